@@ -0,0 +1,76 @@
+"""Size and query latency of the unified database with and without text compression.
+
+    python -m benchmarks.bench_compression --items 50000 --visits 500000
+
+Each variant is a persisted build of the same synthetic Safari history.  Queries run on a
+read-only reader: an indexed domain lookup, the latest page of visits, and full scans
+that decompress every URL or title.
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from sqlite3 import Connection
+
+from browser_history.compression import TextCodecName
+from browser_history.sqlite import BuildOptions, build_unified_browser_history_db
+from browser_history.sqlite import open_unified_db_reader
+
+from .synthetic import build_synthetic_safari_db
+
+QUERIES = {
+    "domain": "SELECT count(*), max(title) FROM browser_history WHERE domain = 'site7.example.com'",
+    "latest": "SELECT url, title FROM browser_history ORDER BY visited_dt DESC LIMIT 100",
+    "url_like": "SELECT count(*) FROM browser_history WHERE url LIKE '%/pottery'",
+    "title_like": "SELECT count(*) FROM browser_history WHERE title LIKE '%glaze%'",
+}
+
+
+def build(source: Path, dest: Path, codec: TextCodecName | None) -> float:
+    started = time.perf_counter()
+    options = BuildOptions(text_compression=codec)
+    conn = build_unified_browser_history_db(dest, [("safari", source)], options=options)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    return (time.perf_counter() - started) * 1000
+
+
+def time_query(conn: Connection, sql: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        conn.execute(sql).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=20_000)
+    parser.add_argument("--visits", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--codec", action="append", choices=["zlib", "zstd"])
+    args = parser.parse_args()
+
+    codecs: list[TextCodecName | None] = [None, *(args.codec or ["zlib"])]
+    with tempfile.TemporaryDirectory(prefix="bh_bench") as tmp:
+        source = build_synthetic_safari_db(Path(tmp) / "History.db", args.items, args.visits)
+        print(f"{args.visits} visits of {args.items} URLs, median of {args.repeat} runs (ms)")
+        print(f"{'codec':<8}{'MiB':>8}{'build':>10}" + "".join(f"{q:>12}" for q in QUERIES))
+        for codec in codecs:
+            dest = Path(tmp) / f"unified-{codec or 'plain'}.db"
+            build_ms = build(source, dest, codec)
+            conn = open_unified_db_reader(dest)
+            latencies = [time_query(conn, sql, args.repeat) for sql in QUERIES.values()]
+            conn.close()
+            size = dest.stat().st_size / (1 << 20)
+            row = "".join(f"{ms:>12.1f}" for ms in latencies)
+            print(f"{codec or 'none':<8}{size:>8.1f}{build_ms:>10.0f}{row}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+"""Throughput and latency of concurrent ``search`` calls against the MCP server.
+
+    python -m benchmarks.bench_mcp_load --rows 1000000 --clients 1,4,16,64 --duration 10
+
+The server is ``make_mcp`` over a synthetic unified database, driven in-process
+("memory": the MCP protocol over in-memory streams), over stdio (the browser-history-mcp
+CLI in a subprocess) and over local HTTP (``make_mcp``'s sse and streamable-http apps
+served by uvicorn in a child process).  In-process and stdio clients share the server's
+single session; HTTP clients each open their own.
+
+Every client issues calls back to back for --duration seconds, picking queries by the
+--mix weights.  The report gives throughput and p50/p95/p99 latency per concurrency level
+and the level after which throughput stopped growing.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import random
+import socket
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import AbstractAsyncContextManager, AsyncExitStack, asynccontextmanager
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+import uvicorn
+from mcp import ClientSession, StdioServerParameters
+from mcp.client.sse import sse_client
+from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.memory import create_connected_server_and_client_session
+
+from browser_history.mcp_server import make_mcp
+from browser_history.sqlite import _write_build_meta, unified_db_fingerprint
+from browser_history.toolbox import BrowserHistory
+
+from .synthetic import build_synthetic_unified_db
+
+# Named search calls: (sql, params).
+QUERIES: dict[str, tuple[str, dict[str, Any]]] = {
+    "domain": (
+        "SELECT url, title, visited_dt FROM browser_history WHERE domain = :d "
+        "ORDER BY visited_dt DESC LIMIT 20",
+        {"d": "site7.example.com"},
+    ),
+    "recent": ("SELECT url, title FROM browser_history ORDER BY visited_dt DESC LIMIT 50", {}),
+    "title_like": (
+        "SELECT url, title FROM browser_history WHERE title LIKE :t LIMIT 20",
+        {"t": "%pottery%"},
+    ),
+    "top_domains": (
+        "SELECT domain, COUNT(*) FROM browser_history WHERE visited_dt >= :since "
+        "GROUP BY domain ORDER BY 2 DESC LIMIT 10",
+        {"since": "2024-06-01"},
+    ),
+}
+DEFAULT_MIX = "domain=5,recent=3,title_like=1,top_domains=1"
+TRANSPORTS = ("memory", "stdio", "sse", "streamable-http")
+# Only the synthetic database is served; no real browser history is read.
+SOURCES = ("chrome",)
+MAX_ROWS = 100
+# Long enough that the server always reuses the seeded database instead of building one.
+REUSE_SECONDS = 10**9
+# A level saturates when the next one adds less than this factor of throughput.
+SATURATION_GAIN = 1.1
+SERVER_START_TIMEOUT = 30.0
+
+OpenSession = Callable[[], AbstractAsyncContextManager[ClientSession]]
+
+
+@dataclass
+class LevelResult:
+    """Calls completed by *clients* concurrent clients and their latencies (seconds)."""
+
+    clients: int
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return len(self.latencies) / self.seconds if self.seconds else 0.0
+
+    def percentiles_ms(self) -> tuple[float, float, float]:
+        if len(self.latencies) < 2:
+            only = self.latencies[0] * 1000 if self.latencies else 0.0
+            return only, only, only
+        cuts = statistics.quantiles(self.latencies, n=100)
+        return cuts[49] * 1000, cuts[94] * 1000, cuts[98] * 1000
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """Parse ``name=weight,...`` into query weights."""
+    weights = {}
+    for item in mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in QUERIES:
+            raise SystemExit(f"unknown query {name!r}; choose from {', '.join(QUERIES)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def seed_database(path: Path, rows: int) -> Path:
+    """Write a synthetic unified database that the server will reuse as its own build."""
+    build_synthetic_unified_db(path, rows)
+    # The toolbox the server creates sees the same sources, whitelist and options.
+    toolbox = BrowserHistory(SOURCES, MAX_ROWS, db_path=str(path))
+    fingerprint = unified_db_fingerprint(
+        toolbox.sources, toolbox.whitelist, toolbox.build_options
+    )
+    conn = sqlite3.connect(path)
+    try:
+        _write_build_meta(conn, fingerprint, rows)
+    finally:
+        conn.close()
+    return path
+
+
+def server_options(db_path: Path) -> dict[str, Any]:
+    return {
+        "sources": SOURCES,
+        "max_rows": MAX_ROWS,
+        "db_path": str(db_path),
+        "db_max_age": REUSE_SECONDS,
+        "warm_up": True,
+    }
+
+
+def _serve_http(transport: str, db_path: Path, port: int) -> None:
+    mcp = make_mcp(**server_options(db_path))
+    app = mcp.sse_app() if transport == "sse" else mcp.streamable_http_app()
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def _wait_for_port(port: int) -> None:
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit(f"MCP server did not start listening on port {port}")
+
+
+@contextmanager
+def http_server(transport: str, db_path: Path) -> Iterator[int]:
+    """Serve make_mcp's *transport* app from a child process; yield its port."""
+    port = _free_port()
+    process = multiprocessing.Process(
+        target=_serve_http, args=(transport, db_path, port), daemon=True
+    )
+    process.start()
+    try:
+        _wait_for_port(port)
+        yield port
+    finally:
+        process.terminate()
+        process.join()
+
+
+@asynccontextmanager
+async def _stdio_session(db_path: Path) -> AsyncIterator[ClientSession]:
+    args = ["-m", "browser_history.mcp_server", "--transport", "stdio", "--db-file", str(db_path)]
+    args += ["--db-max-age", str(REUSE_SECONDS), "--max-rows", str(MAX_ROWS)]
+    args += [arg for source in SOURCES for arg in ("--sources", source)]
+    params = StdioServerParameters(command=sys.executable, args=args)
+    async with stdio_client(params) as (read, write), ClientSession(read, write) as session:
+        await session.initialize()
+        yield session
+
+
+@asynccontextmanager
+async def _http_session(transport: str, port: int) -> AsyncIterator[ClientSession]:
+    if transport == "sse":
+        client: Any = sse_client(f"http://127.0.0.1:{port}/sse")
+    else:
+        client = streamablehttp_client(f"http://127.0.0.1:{port}/mcp")
+    async with client as streams, ClientSession(streams[0], streams[1]) as session:
+        await session.initialize()
+        yield session
+
+
+def session_factory(transport: str, db_path: Path, port: int) -> OpenSession:
+    """Return a function opening a client session to the server over *transport*."""
+    if transport == "memory":
+        return lambda: create_connected_server_and_client_session(
+            make_mcp(**server_options(db_path))
+        )
+    if transport == "stdio":
+        return lambda: _stdio_session(db_path)
+    return lambda: _http_session(transport, port)
+
+
+async def _call(session: ClientSession, name: str) -> bool:
+    """Run the named search query; return whether the tool reported an error."""
+    sql, params = QUERIES[name]
+    result = await session.call_tool("search", {"sql": sql, "params": params})
+    return bool(result.isError)
+
+
+async def _client(
+    session: ClientSession,
+    weights: dict[str, float],
+    deadline: float,
+    rng: random.Random,
+    result: LevelResult,
+) -> None:
+    names, mix = list(weights), list(weights.values())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, mix)[0]
+        started = time.perf_counter()
+        result.errors += await _call(session, name)
+        result.latencies.append(time.perf_counter() - started)
+
+
+async def run_level(
+    open_session: OpenSession,
+    shared: bool,
+    clients: int,
+    weights: dict[str, float],
+    duration: float,
+) -> LevelResult:
+    """Run *clients* concurrent clients for *duration* seconds."""
+    async with AsyncExitStack() as stack:
+        count = 1 if shared else clients
+        opened = [await stack.enter_async_context(open_session()) for _ in range(count)]
+        sessions = opened * clients if shared else opened
+        # The first call waits for the server's warm-up, outside the measured window.
+        await _call(sessions[0], next(iter(weights)))
+        result = LevelResult(clients)
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(
+                _client(session, weights, started + duration, random.Random(i), result)
+                for i, session in enumerate(sessions)
+            )
+        )
+        result.seconds = time.perf_counter() - started
+        return result
+
+
+def saturation_point(results: list[LevelResult]) -> int | None:
+    """Return the client count after which throughput stopped growing, if it did."""
+    for current, following in itertools.pairwise(results):
+        if following.throughput < current.throughput * SATURATION_GAIN:
+            return current.clients
+    return None
+
+
+def report(transport: str, results: list[LevelResult]) -> None:
+    for result in results:
+        p50, p95, p99 = result.percentiles_ms()
+        print(
+            f"{transport:<16}{result.clients:>8}{result.throughput:>10.1f}"
+            f"{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}{result.errors:>8}"
+        )
+    knee = saturation_point(results)
+    if knee is not None:
+        print(f"{transport}: throughput stops growing beyond {knee} clients")
+
+
+async def sweep(
+    open_session: OpenSession,
+    shared: bool,
+    levels: list[int],
+    weights: dict[str, float],
+    duration: float,
+) -> list[LevelResult]:
+    return [await run_level(open_session, shared, n, weights, duration) for n in levels]
+
+
+def run_transport(transport: str, db_path: Path, args: argparse.Namespace) -> None:
+    levels = [int(n) for n in args.clients.split(",")]
+    weights = parse_mix(args.mix)
+    shared = transport in ("memory", "stdio")
+    server = nullcontext(0) if shared else http_server(transport, db_path)
+    with server as port:
+        open_session = session_factory(transport, db_path, port)
+        results = asyncio.run(sweep(open_session, shared, levels, weights, args.duration))
+    report(transport, results)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--clients", default="1,4,16,64", help="Comma-separated levels.")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per level.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Query weights, name=weight,...")
+    parser.add_argument("--transport", action="append", choices=TRANSPORTS)
+    args = parser.parse_args()
+    # The server logs every request at INFO; keep the report readable.
+    logging.basicConfig(level=logging.WARNING, force=True)
+
+    with tempfile.TemporaryDirectory(prefix="bh_bench") as tmp:
+        db_path = seed_database(Path(tmp) / "unified.db", args.rows)
+        print(f"{args.rows} rows, {args.duration:g}s per level, mix {args.mix}")
+        print(
+            f"{'transport':<16}{'clients':>8}{'calls/s':>10}{'p50 ms':>10}"
+            f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+        )
+        for transport in args.transport or TRANSPORTS:
+            run_transport(transport, db_path, args)
+
+
+if __name__ == "__main__":
+    main()
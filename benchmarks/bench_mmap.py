@@ -0,0 +1,81 @@
+"""Full-scan query latency on a persisted unified DB: mmap vs read(), cold vs warm cache.
+
+    python -m benchmarks.bench_mmap --rows 500000
+
+"Cold" evicts the file from the OS page cache with POSIX_FADV_DONTNEED before each run,
+which Linux honours for clean pages; on other platforms cold and warm will look alike.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from browser_history.sqlite import open_unified_db_reader, prewarm_db_file
+
+from .synthetic import build_synthetic_unified_db
+
+QUERIES = {
+    "top_domains": "SELECT domain, COUNT(*) FROM browser_history GROUP BY domain "
+    "ORDER BY 2 DESC LIMIT 10",
+    "monthly_distinct": "SELECT substr(visited_dt, 1, 7), COUNT(DISTINCT url) "
+    "FROM browser_history GROUP BY 1",
+    "title_scan": "SELECT COUNT(*) FROM browser_history WHERE title LIKE '%python%'",
+}
+
+
+def evict(path: Path) -> None:
+    """Best-effort removal of *path* from the OS page cache."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def time_query(path: Path, sql: str, mmap_size: int, cold: bool) -> float:
+    if cold:
+        evict(path)
+    else:
+        prewarm_db_file(path)
+    conn = open_unified_db_reader(path, mmap_size)
+    try:
+        started = time.perf_counter()
+        conn.execute(sql).fetchall()
+        return (time.perf_counter() - started) * 1000
+    finally:
+        conn.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mmap-mb", type=int, default=1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bh_bench") as tmp:
+        path = build_synthetic_unified_db(Path(tmp) / "unified.db", args.rows)
+        size_mb = path.stat().st_size / (1 << 20)
+        print(f"{args.rows} rows, {size_mb:.1f} MiB, median of {args.repeat} runs (ms)")
+        print(f"{'query':<18}{'mmap':>6}{'cold':>10}{'warm':>10}")
+        for name, sql in QUERIES.items():
+            for mmap_size in (0, args.mmap_mb << 20):
+                cold = [time_query(path, sql, mmap_size, True) for _ in range(args.repeat)]
+                warm = [time_query(path, sql, mmap_size, False) for _ in range(args.repeat)]
+                label = "on" if mmap_size else "off"
+                print(
+                    f"{name:<18}{label:>6}"
+                    f"{statistics.median(cold):>10.1f}{statistics.median(warm):>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Safari extraction: the old item-driven LEFT JOIN against the visit-driven batch reader.
+
+    python -m benchmarks.bench_safari_ingest --items 50000 --visits 1000000
+
+Both read every visit of a synthetic History.db (and, with a retention window, only the
+last 90 days of it); "build" is a full unified database build from that file.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from browser_history.ingest import StageCounter, read_source
+from browser_history.retention import IngestWindow
+from browser_history.sqlite import build_unified_browser_history_db
+
+from .synthetic import build_synthetic_safari_db
+
+# The extractor before it was driven from history_visits.
+LEGACY_SQL = """
+    SELECT i.url, v.title, NULL,
+           strftime('%Y-%m-%d %H:00:00', v.visit_time + strftime('%s','2001-01-01'), 'unixepoch')
+    FROM src.history_items i
+    LEFT JOIN src.history_visits v ON v.history_item = i.id
+    WHERE v.visit_time >= ? OR ? IS NULL"""
+
+
+def _open(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("ATTACH DATABASE ? AS src", (f"file:{path}?immutable=1&mode=ro",))
+    return conn
+
+
+def time_legacy(path: Path, since: float | None) -> tuple[float, int]:
+    conn = _open(path)
+    native = since - 978_307_200 if since is not None else None
+    started = time.perf_counter()
+    rows = len(conn.execute(LEGACY_SQL, (native, native)).fetchall())
+    return (time.perf_counter() - started) * 1000, rows
+
+
+def time_batched(path: Path, since: float | None, batch_size: int) -> tuple[float, int]:
+    conn = _open(path)
+    window = IngestWindow(since=since) if since is not None else None
+    started = time.perf_counter()
+    rows = sum(
+        len(batch)
+        for batch in read_source(conn, "safari", "src", window, StageCounter(), batch_size)
+    )
+    return (time.perf_counter() - started) * 1000, rows
+
+
+def time_build(path: Path) -> tuple[float, int]:
+    started = time.perf_counter()
+    conn = build_unified_browser_history_db(None, [("safari", path)])
+    elapsed = (time.perf_counter() - started) * 1000
+    rows = conn.execute("SELECT COUNT(*) FROM browser_history").fetchone()[0]
+    conn.close()
+    return elapsed, rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=20_000)
+    parser.add_argument("--visits", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=5_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bh_bench") as tmp:
+        path = build_synthetic_safari_db(Path(tmp) / "History.db", args.items, args.visits)
+        # The synthetic visits end five years after 2020-01-01.
+        since = 1_577_836_800 + 5 * 365 * 86_400 - 90 * 86_400
+        print(f"{args.visits} visits of {args.items} items, median of {args.repeat} runs (ms)")
+        print(f"{'extractor':<12}{'window':>8}{'rows':>10}{'ms':>10}")
+        cases = [
+            ("legacy", "all", lambda: time_legacy(path, None)),
+            ("batched", "all", lambda: time_batched(path, None, args.batch_size)),
+            ("legacy", "90d", lambda: time_legacy(path, since)),
+            ("batched", "90d", lambda: time_batched(path, since, args.batch_size)),
+            ("build", "all", lambda: time_build(path)),
+        ]
+        for name, window, run in cases:
+            results = [run() for _ in range(args.repeat)]
+            ms = statistics.median(elapsed for elapsed, _ in results)
+            print(f"{name:<12}{window:>8}{results[0][1]:>10}{ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
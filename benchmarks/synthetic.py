@@ -0,0 +1,117 @@
+"""Synthetic browser history databases for benchmarks."""
+
+from __future__ import annotations
+
+import datetime
+import random
+import sqlite3
+from collections.abc import Iterator
+from pathlib import Path
+
+from browser_history.sqlite import _create_unified_db_connection
+
+BROWSERS = ("chrome", "firefox", "safari")
+WORDS = (
+    "python sqlite container networking kubernetes recipe pottery glaze yosemite "
+    "hiking weather news review tutorial docs release notes pricing login search"
+).split()
+INSERT_BATCH = 10_000
+_INSERT_SQL = f"INSERT INTO browser_history VALUES ({','.join('?' * 15)})"
+
+
+def _synthetic_rows(rows: int, seed: int) -> Iterator[tuple[object, ...]]:
+    rng = random.Random(seed)
+    domains = [f"site{i}.example.com" for i in range(500)]
+    start = datetime.datetime(2020, 1, 1)
+    for seq in range(1, rows + 1):
+        browser = rng.choice(BROWSERS)
+        domain = rng.choice(domains)
+        segments = rng.choices(WORDS, k=rng.randint(1, 4))
+        path = "/" + "/".join(segments)
+        url = f"https://{domain}{path}"
+        title = " ".join(rng.choices(WORDS, k=rng.randint(2, 6))).title()
+        visited = start + datetime.timedelta(hours=rng.randint(0, 5 * 365 * 24))
+        yield (
+            browser,
+            f"{browser}:{rng.randint(0, 2):010d}",
+            url,
+            title,
+            None,
+            visited.strftime("%Y-%m-%d %H:00:00"),
+            domain,
+            "",
+            None,
+            None,
+            "https",
+            path,
+            "example.com",
+            len(segments),
+            seq,
+        )
+
+
+def build_synthetic_unified_db(path: Path, rows: int, seed: int = 0) -> Path:
+    """Write a unified database with *rows* random visits to *path*."""
+    conn = _create_unified_db_connection(path)
+    batch: list[tuple[object, ...]] = []
+    for row in _synthetic_rows(rows, seed):
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH:
+            conn.executemany(_INSERT_SQL, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(_INSERT_SQL, batch)
+    conn.commit()
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    return path
+
+
+def _safari_visits(items: int, visits: int, seed: int) -> Iterator[tuple[object, ...]]:
+    rng = random.Random(seed)
+    # Seconds since 2001-01-01 (Safari's epoch), spread over five years from 2020.
+    start = 599_616_000.0
+    for visit_id in range(1, visits + 1):
+        redirect = visit_id - 1 if visit_id > 1 and rng.random() < 0.05 else None
+        title = " ".join(rng.choices(WORDS, k=rng.randint(2, 6))).title()
+        visited = start + visit_id * (5 * 365 * 86_400 / visits)
+        yield visit_id, rng.randint(1, items), visited, title, redirect
+
+
+def build_synthetic_safari_db(path: Path, items: int, visits: int, seed: int = 0) -> Path:
+    """Write a Safari History.db with *items* URLs and *visits* visits to *path*.
+
+    About one visit in twenty is the target of a redirect from the visit before it.
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE history_items (
+          id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL UNIQUE,
+          visit_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE history_visits (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          history_item INTEGER NOT NULL REFERENCES history_items(id) ON DELETE CASCADE,
+          visit_time REAL NOT NULL, title TEXT NULL,
+          redirect_source INTEGER NULL UNIQUE REFERENCES history_visits(id) ON DELETE CASCADE
+        );
+        CREATE INDEX history_visits__last_visit ON history_visits (history_item, visit_time DESC);
+        """
+    )
+    conn.executemany(
+        "INSERT INTO history_items (id, url) VALUES (?, ?)",
+        (
+            (i, f"https://site{rng.randrange(500)}.example.com/{i}/{rng.choice(WORDS)}")
+            for i in range(1, items + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO history_visits (id, history_item, visit_time, title, redirect_source) "
+        "VALUES (?, ?, ?, ?, ?)",
+        _safari_visits(items, visits, seed),
+    )
+    conn.commit()
+    conn.close()
+    return path
@@ -0,0 +1,203 @@
+"""Change feed over the unified history: the rows ingested since a token.
+
+Every row has an ``ingest_seq``, increasing in ingest order.  A rebuild carries the
+sequence numbers of visits it already held over from the previous build, persisted or in
+memory, and numbers only new visits after them, so a token stays valid across rebuilds.
+The feed's *lineage* names that numbering; tokens from another lineage (a database
+rebuilt from scratch, or another process's in-memory build) are rejected rather than
+silently skipping rows.
+"""
+
+from __future__ import annotations
+
+import logging
+import secrets
+from dataclasses import dataclass
+from pathlib import Path
+from sqlite3 import Connection
+from typing import Any
+
+from .compression import history_table
+
+logger = logging.getLogger(__name__)
+
+FEED_TABLE = "_bh_feed"
+# Columns returned for each new row.
+FEED_COLUMNS = ("ingest_seq", "browser", "profile", "url", "title", "referrer_url", "visited_dt")
+# Page size used when the caller sets no row limit (``--max-rows 0``).
+FEED_PAGE_SIZE = 100
+
+
+@dataclass(frozen=True)
+class ChangeToken:
+    """Position in the change feed: every row up to *seq* of *lineage* has been seen."""
+
+    lineage: str
+    seq: int
+
+    def encode(self) -> str:
+        return f"{self.lineage}-{self.seq}"
+
+    @classmethod
+    def parse(cls, token: str) -> ChangeToken:
+        lineage, _, seq = token.rpartition("-")
+        if not lineage or not seq.isdigit():
+            raise ValueError(f"Malformed change token {token!r}")
+        return cls(lineage, int(seq))
+
+
+@dataclass
+class Changes:
+    """Rows ingested after a token, the token to pass next, and whether more rows wait."""
+
+    rows: list[Any]
+    token: str
+    more: bool
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "columns": list(FEED_COLUMNS),
+            "rows": self.rows,
+            "token": self.token,
+            "more": self.more,
+        }
+
+
+def start_feed(conn: Connection) -> None:
+    """Give a freshly built unified database a new feed lineage."""
+    conn.executescript(
+        f"""
+        DROP TABLE IF EXISTS {FEED_TABLE};
+        CREATE TABLE {FEED_TABLE} (lineage TEXT NOT NULL);
+        """
+    )
+    conn.execute(f"INSERT INTO {FEED_TABLE} VALUES (?)", (secrets.token_hex(8),))
+    conn.commit()
+
+
+def feed_lineage(conn: Connection, schema: str = "main") -> str | None:
+    has_table = conn.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE name = ?", (FEED_TABLE,)
+    ).fetchone()
+    if not has_table:
+        return None
+    row = conn.execute(f"SELECT lineage FROM {schema}.{FEED_TABLE}").fetchone()
+    return str(row[0]) if row else None
+
+
+def _old_numbers_sql(conn: Connection, raw_url_table: str, schema: str = "main") -> str:
+    """Return the SELECT of (browser, profile, visit_id, ingest_seq) of a previous build."""
+    table = history_table(conn, schema)
+    return f"""SELECT h.browser, h.profile, r.visit_id, h.ingest_seq
+               FROM {schema}.{table} h JOIN {schema}.{raw_url_table} r ON r.id = h.rowid"""
+
+
+def _renumber(conn: Connection, raw_url_table: str, last_seq: int) -> None:
+    """Keep the numbers of visits listed in ``temp._feed_seq``; number the rest after *last_seq*."""
+    table = history_table(conn)
+    conn.executescript(
+        f"""
+        CREATE INDEX temp._feed_seq_visit ON _feed_seq(browser, profile, visit_id);
+        UPDATE {table} SET ingest_seq = NULL;
+        UPDATE {table} SET ingest_seq = s.ingest_seq
+          FROM {raw_url_table} r, temp._feed_seq s
+          WHERE r.id = {table}.rowid AND s.browser = {table}.browser
+            AND s.profile IS {table}.profile AND s.visit_id = r.visit_id;
+        DROP TABLE temp._feed_seq;
+        """
+    )
+    conn.execute(
+        f"""UPDATE {table} SET ingest_seq = ? + fresh.n
+            FROM (SELECT rowid AS id, row_number() OVER (ORDER BY rowid) AS n
+                  FROM {table} WHERE ingest_seq IS NULL) AS fresh
+            WHERE {table}.rowid = fresh.id""",
+        (last_seq,),
+    )
+
+
+def carry_over_feed(conn: Connection, old_db: Path, raw_url_table: str) -> None:
+    """Continue the feed of the previous build *old_db* in the new build behind *conn*.
+
+    The raw URL side table *raw_url_table* maps each row to its source visit id.
+    """
+    conn.execute("ATTACH DATABASE ? AS old_build", (f"file:{old_db}?mode=ro",))
+    try:
+        lineage = feed_lineage(conn, "old_build")
+        if lineage is None:
+            return
+        last_seq = conn.execute(
+            "SELECT coalesce(max(ingest_seq), 0) FROM old_build.browser_history"
+        ).fetchone()[0]
+        conn.execute(
+            "CREATE TEMP TABLE _feed_seq AS "
+            + _old_numbers_sql(conn, raw_url_table, "old_build")
+        )
+        _continue_feed(conn, raw_url_table, lineage, last_seq)
+    finally:
+        conn.execute("DETACH DATABASE old_build")
+
+
+def carry_over_feed_from(conn: Connection, old: Connection, raw_url_table: str) -> None:
+    """Continue the feed of the previous build open on *old* (in memory) behind *conn*.
+
+    Both connections must be allowed to read the raw URL side table *raw_url_table*.
+    """
+    lineage = feed_lineage(old)
+    if lineage is None:
+        return
+    conn.execute("CREATE TEMP TABLE _feed_seq (browser, profile, visit_id, ingest_seq)")
+    conn.executemany(
+        "INSERT INTO temp._feed_seq VALUES (?, ?, ?, ?)",
+        old.execute(_old_numbers_sql(old, raw_url_table)),
+    )
+    _continue_feed(conn, raw_url_table, lineage, _head(old))
+
+
+def _continue_feed(conn: Connection, raw_url_table: str, lineage: str, last_seq: int) -> None:
+    _renumber(conn, raw_url_table, last_seq)
+    conn.execute(f"UPDATE {FEED_TABLE} SET lineage = ?", (lineage,))
+    conn.commit()
+    logger.info("Continued change feed %s after sequence number %d", lineage, last_seq)
+
+
+def _head(conn: Connection) -> int:
+    row = conn.execute("SELECT max(ingest_seq) FROM browser_history").fetchone()
+    return int(row[0] or 0)
+
+
+def _position(token: str, lineage: str) -> int:
+    """Return the sequence number *token* points at in the feed *lineage*."""
+    position = ChangeToken.parse(token)
+    if position.lineage != lineage:
+        raise ValueError(
+            "The change token belongs to another build of the history; call changes_since "
+            "without a token to start a new feed."
+        )
+    return position.seq
+
+
+def _page_size(limit: int) -> int:
+    return limit if limit > 0 else FEED_PAGE_SIZE
+
+
+def changes_since(conn: Connection, token: str | None, limit: int) -> Changes:
+    """Return up to *limit* rows ingested after *token*, oldest first.
+
+    Without a token nothing is returned and the token marks the current end of the feed.
+    A *limit* of ``0`` (or less) pages by :data:`FEED_PAGE_SIZE`, so every page advances
+    the token.  Rows are found by a range scan on the ``ingest_seq`` index, so the cost
+    follows the number of new rows rather than the size of the history.
+    """
+    limit = _page_size(limit)
+    lineage = feed_lineage(conn) or ""
+    if token is None:
+        return Changes([], ChangeToken(lineage, _head(conn)).encode(), False)
+    after = _position(token, lineage)
+    rows = conn.execute(
+        f"""SELECT {", ".join(FEED_COLUMNS)} FROM browser_history
+            WHERE ingest_seq > ? ORDER BY ingest_seq LIMIT ?""",
+        (after, limit + 1),
+    ).fetchall()
+    page = [list(row) for row in rows[:limit]]
+    seq = page[-1][0] if page else after
+    return Changes(page, ChangeToken(lineage, seq).encode(), len(rows) > limit)
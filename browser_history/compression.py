@@ -0,0 +1,279 @@
+"""Dictionary compression of the URL and title text in the unified database.
+
+With ``BuildOptions.text_compression`` the build trains a small dictionary on a sample of
+URLs and titles, moves the rows into ``browser_history_packed`` with their url, title and
+referrer_url compressed, and replaces ``browser_history`` by a view decompressing them with
+the ``bh_text()`` SQL function.  Indexed columns (domain, visited_dt, ...) are copied as
+they are, so filters on them still use their indexes.  The indexes on url and title are
+dropped: indexing the decompressed text would store it a second time, uncompressed.
+The view has no rowid; internal code addresses rows through ``browser_history_packed.id``
+(see :func:`history_table`).
+
+``zlib`` (raw deflate with a preset dictionary) only needs the standard library; ``zstd``
+needs the optional ``zstandard`` package (``pip install 'llm-tools-browser-history[zstd]'``).
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import sqlite3
+import zlib
+from collections import Counter
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from sqlite3 import Connection
+from typing import Any, Literal
+
+logger = logging.getLogger(__name__)
+
+TextCodecName = Literal["zlib", "zstd"]
+
+PACKED_TABLE = "browser_history_packed"
+DICTIONARY_TABLE = "_bh_text_dictionary"
+# Columns stored compressed, in the unified table and in the raw URL side table.
+PACKED_COLUMNS = ("url", "title", "referrer_url")
+# Deflate looks back at most 32 KiB, preset dictionary included.
+TEXT_DICTIONARY_BYTES = 16 * 1024
+# Rows whose URL and title the dictionary is trained on.
+DICTIONARY_SAMPLES = 5_000
+ZLIB_LEVEL = 9
+ZSTD_LEVEL = 9
+
+# Dictionary tokens: a URL's scheme and host, then path segments and words with the
+# delimiter that follows them.
+_TOKEN_RE = re.compile(r"[a-z]+://[^/?#\s]+/?|[^/?&=#.\s]+[/?&=#.\s]?")
+
+_Transform = Callable[[bytes], bytes]
+
+
+def train_zlib_dictionary(samples: Iterable[str], size: int = TEXT_DICTIONARY_BYTES) -> bytes:
+    """Return a preset dictionary of the tokens of *samples* that save the most bytes.
+
+    Tokens seen more than once are ranked by occurrences times length; the best go last,
+    where deflate reaches them with the shortest distances.
+    """
+    counts = Counter(token for sample in samples for token in _TOKEN_RE.findall(sample))
+    ranked = sorted(
+        (token for token, count in counts.items() if count > 1),
+        key=lambda token: counts[token] * len(token),
+        reverse=True,
+    )
+    return b"".join(reversed(_fill(ranked, size)))
+
+
+def _fill(tokens: Iterable[str], size: int) -> list[bytes]:
+    """Return the leading *tokens* that fit in *size* bytes, encoded."""
+    chosen: list[bytes] = []
+    used = 0
+    for token in tokens:
+        raw = token.encode("utf-8")
+        if used + len(raw) > size:
+            break
+        chosen.append(raw)
+        used += len(raw)
+    return chosen
+
+
+def _zstandard() -> Any:
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ValueError(
+            "zstd text compression needs the zstandard package: "
+            "pip install 'llm-tools-browser-history[zstd]'"
+        ) from e
+    return zstandard
+
+
+def train_dictionary(name: TextCodecName, samples: list[str]) -> bytes:
+    """Return a compression dictionary for codec *name* trained on *samples*."""
+    if name == "zstd":
+        zstd = _zstandard()
+        try:
+            encoded = [sample.encode("utf-8") for sample in samples]
+            return bytes(zstd.train_dictionary(TEXT_DICTIONARY_BYTES, encoded).as_bytes())
+        except zstd.ZstdError as e:
+            # Too few samples to train on; zstd also accepts raw content dictionaries.
+            logger.debug("Falling back to a raw content zstd dictionary: %s", e)
+    return train_zlib_dictionary(samples)
+
+
+def _zlib(dictionary: bytes) -> tuple[_Transform, _Transform]:
+    def compress(raw: bytes) -> bytes:
+        compressor = zlib.compressobj(ZLIB_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+        return compressor.compress(raw) + compressor.flush()
+
+    def decompress(packed: bytes) -> bytes:
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=dictionary)
+        return decompressor.decompress(packed) + decompressor.flush()
+
+    return compress, decompress
+
+
+def _zstd(dictionary: bytes) -> tuple[_Transform, _Transform]:
+    zstd = _zstandard()
+    data = zstd.ZstdCompressionDict(dictionary)
+    compressor = zstd.ZstdCompressor(
+        level=ZSTD_LEVEL, dict_data=data, write_checksum=False, write_dict_id=False
+    )
+    return compressor.compress, zstd.ZstdDecompressor(dict_data=data).decompress
+
+
+_CODECS: dict[str, Callable[[bytes], tuple[_Transform, _Transform]]] = {
+    "zlib": _zlib,
+    "zstd": _zstd,
+}
+
+
+@dataclass
+class TextCodec:
+    """Compress text with a trained dictionary; values it would not shrink stay text."""
+
+    name: TextCodecName
+    dictionary: bytes
+    _compress: _Transform = field(init=False, repr=False)
+    _decompress: _Transform = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self._compress, self._decompress = _CODECS[self.name](self.dictionary)
+
+    def pack(self, text: str | None) -> str | bytes | None:
+        if text is None:
+            return None
+        raw = text.encode("utf-8")
+        packed = self._compress(raw)
+        return packed if len(packed) < len(raw) else text
+
+    def unpack(self, value: str | bytes | None) -> str | None:
+        if isinstance(value, bytes):
+            return self._decompress(value).decode("utf-8")
+        return value
+
+
+def _identity(value: str | bytes | None) -> str | bytes | None:
+    return value
+
+
+def load_text_codec(conn: Connection) -> TextCodec | None:
+    """Return the codec the unified database behind *conn* was packed with, if any."""
+    try:
+        row = conn.execute(f"SELECT codec, dictionary FROM {DICTIONARY_TABLE}").fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return TextCodec(row[0], row[1]) if row else None
+
+
+def register_text_codec(conn: Connection, codec: TextCodec | None = None) -> None:
+    """Define ``bh_text()`` and ``bh_pack()`` on *conn* for its database's codec.
+
+    Without a codec (an uncompressed database) both return their argument unchanged.
+    """
+    codec = codec or load_text_codec(conn)
+    unpack: Callable[[Any], str | bytes | None] = codec.unpack if codec else _identity
+    pack: Callable[[Any], str | bytes | None] = codec.pack if codec else _identity
+    conn.create_function("bh_text", 1, unpack, deterministic=True)
+    conn.create_function("bh_pack", 1, pack, deterministic=True)
+
+
+def history_table(conn: Connection, schema: str = "main") -> str:
+    """Return the table holding the unified rows: the packed one when text is compressed.
+
+    Its rowid (``id`` in the packed table) identifies a unified row.
+    """
+    row = conn.execute(
+        f"SELECT type FROM {schema}.sqlite_master WHERE name = 'browser_history'"
+    ).fetchone()
+    return PACKED_TABLE if row is not None and row[0] == "view" else "browser_history"
+
+
+def _sample_text(conn: Connection, samples: int = DICTIONARY_SAMPLES) -> list[str]:
+    """Return the URL and title of about *samples* rows spread evenly over the table."""
+    rows = conn.execute("SELECT coalesce(max(rowid), 0) FROM browser_history").fetchone()[0]
+    step = max(1, rows // samples)
+    found = conn.execute(
+        "SELECT url, title FROM browser_history WHERE rowid % ? = 0", (step,)
+    ).fetchall()
+    return [text for row in found for text in row if text]
+
+
+def _column_list(conn: Connection) -> list[tuple[str, str, bool]]:
+    """Return the (name, type, not null) columns of the unified table."""
+    info = conn.execute("PRAGMA table_info(browser_history)").fetchall()
+    return [(row[1], row[2], bool(row[3])) for row in info]
+
+
+def _plain_indexes(conn: Connection) -> dict[str, list[str]]:
+    """Return the unified table's indexes that cover no compressed column, with their columns.
+
+    The others are dropped with the table and logged.
+    """
+    indexes = {}
+    for index in conn.execute("PRAGMA index_list(browser_history)").fetchall():
+        columns = [row[2] for row in conn.execute(f"PRAGMA index_info({index[1]})")]
+        if set(columns) & set(PACKED_COLUMNS):
+            logger.info("Dropping index %s on compressed text columns %s", index[1], columns)
+        else:
+            indexes[index[1]] = columns
+    return indexes
+
+
+def _packed_expr(name: str, function: str, source: str = "") -> str:
+    return f"{function}({source}{name})" if name in PACKED_COLUMNS else f"{source}{name}"
+
+
+def _packed_lists(names: list[str]) -> tuple[str, str]:
+    """Return the packed INSERT values and the view's select list."""
+    packed = ", ".join(_packed_expr(name, "bh_pack") for name in names)
+    unpacked = ", ".join(f"{_packed_expr(name, 'bh_text')} AS {name}" for name in names)
+    return packed, unpacked
+
+
+def _column_definition(name: str, kind: str, not_null: bool) -> str:
+    kind = "BLOB" if name in PACKED_COLUMNS else kind
+    return f"{name} {kind} NOT NULL" if not_null else f"{name} {kind}"
+
+
+def _packed_schema(columns: list[tuple[str, str, bool]]) -> str:
+    """Return the SQL moving the unified rows into the packed table behind a view."""
+    names = [name for name, _, _ in columns]
+    definitions = ", ".join(_column_definition(*column) for column in columns)
+    packed, unpacked = _packed_lists(names)
+    return f"""
+        CREATE TABLE {PACKED_TABLE} (id INTEGER PRIMARY KEY, {definitions});
+        INSERT INTO {PACKED_TABLE} (id, {", ".join(names)})
+          SELECT rowid, {packed} FROM browser_history ORDER BY rowid;
+        DROP TABLE browser_history;
+        CREATE VIEW browser_history AS SELECT {unpacked} FROM {PACKED_TABLE};
+    """
+
+
+def pack_unified_db(conn: Connection, name: TextCodecName, raw_url_table: str) -> TextCodec:
+    """Compress the URL and title text of the unified database behind *conn* in place.
+
+    The URLs kept in *raw_url_table* are compressed as well.  Returns the trained codec,
+    which is also registered on *conn*; the database is vacuumed to release the space.
+    """
+    codec = TextCodec(name, train_dictionary(name, _sample_text(conn)))
+    register_text_codec(conn, codec)
+    indexes = _plain_indexes(conn)
+    conn.executescript(
+        f"""
+        BEGIN;
+        {_packed_schema(_column_list(conn))}
+        UPDATE {raw_url_table} SET url = bh_pack(url), referrer_url = bh_pack(referrer_url);
+        CREATE TABLE {DICTIONARY_TABLE} (codec TEXT NOT NULL, dictionary BLOB NOT NULL);
+        COMMIT;
+        """
+    )
+    for index, columns in indexes.items():
+        conn.execute(f"CREATE INDEX {index} ON {PACKED_TABLE}({', '.join(columns)})")
+    conn.execute(f"INSERT INTO {DICTIONARY_TABLE} VALUES (?, ?)", (codec.name, codec.dictionary))
+    conn.commit()
+    conn.execute("VACUUM")
+    logger.info(
+        "Compressed unified database text with a %d byte %s dictionary",
+        len(codec.dictionary),
+        name,
+    )
+    return codec
@@ -0,0 +1,102 @@
+"""Removal of visits duplicated across synced browser profiles."""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+from collections.abc import Iterator
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from sqlite3 import Connection
+
+logger = logging.getLogger(__name__)
+
+# Rows read (and deleted) per round trip.
+DEDUP_BATCH_SIZE = 5_000
+
+Visit = tuple[int, str, str, str, str]
+
+
+@dataclass
+class DedupStats:
+    """Counters describing one dedup pass."""
+
+    rows_removed: int = 0
+    groups: int = 0
+
+
+def _hour_bucket(visited_dt: str, window_hours: int) -> str:
+    if window_hours == 1:
+        # visited_dt is already truncated to the hour.
+        return visited_dt
+    when = datetime.fromisoformat(visited_dt).replace(tzinfo=timezone.utc)
+    return str(int(when.timestamp()) // 3600 // window_hours)
+
+
+def visit_key(url: str, visited_dt: str, browser: str, window_hours: int = 1) -> bytes:
+    """Hash (cleaned url, time bucket, browser family) into a compact grouping key."""
+    bucket = _hour_bucket(visited_dt, window_hours)
+    raw = f"{browser}\0{bucket}\0{url}".encode("utf-8")
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+def _iter_visits(conn: Connection, batch_size: int) -> Iterator[Visit]:
+    """Yield (rowid, url, visited_dt, browser, profile) for every row, in rowid batches."""
+    last_rowid = 0
+    while rows := conn.execute(
+        """SELECT rowid, url, visited_dt, browser, coalesce(profile, '')
+           FROM browser_history WHERE rowid > ? ORDER BY rowid LIMIT ?""",
+        (last_rowid, batch_size),
+    ).fetchall():
+        yield from rows
+        last_rowid = rows[-1][0]
+
+
+def _keeper(per_profile: dict[str, int]) -> str:
+    """Pick the profile whose copy of a visit group is kept: most visits, then by name."""
+    return min(per_profile, key=lambda profile: (-per_profile[profile], profile))
+
+
+def _keepers(conn: Connection, window_hours: int, batch_size: int) -> dict[bytes, str]:
+    """Return the kept profile of every visit group seen in more than one profile.
+
+    Grouping is a single hash aggregation over the table; no sort is needed.
+    """
+    counts: dict[bytes, dict[str, int]] = {}
+    for _, url, visited_dt, browser, profile in _iter_visits(conn, batch_size):
+        per_profile = counts.setdefault(visit_key(url, visited_dt, browser, window_hours), {})
+        per_profile[profile] = per_profile.get(profile, 0) + 1
+    return {key: _keeper(per) for key, per in counts.items() if len(per) > 1}
+
+
+def _duplicate_rowids(
+    conn: Connection, keepers: dict[bytes, str], window_hours: int, batch_size: int
+) -> Iterator[int]:
+    for rowid, url, visited_dt, browser, profile in _iter_visits(conn, batch_size):
+        kept = keepers.get(visit_key(url, visited_dt, browser, window_hours))
+        if kept is not None and kept != profile:
+            yield rowid
+
+
+def dedup_visits(
+    conn: Connection, window_hours: int = 1, batch_size: int = DEDUP_BATCH_SIZE
+) -> DedupStats:
+    """Delete visits that another profile of the same browser family also recorded.
+
+    Visits are grouped on (cleaned url, *window_hours* time bucket, browser).  In a group
+    seen in several profiles only the rows of the profile with the most visits are kept,
+    so genuine repeat visits within the window survive while synced copies are dropped.
+    """
+    stats = DedupStats()
+    keepers = _keepers(conn, window_hours, batch_size)
+    stats.groups = len(keepers)
+    rowids = list(_duplicate_rowids(conn, keepers, window_hours, batch_size))
+    for start in range(0, len(rowids), batch_size):
+        conn.executemany(
+            "DELETE FROM browser_history WHERE rowid = ?",
+            [(rowid,) for rowid in rowids[start : start + batch_size]],
+        )
+    conn.commit()
+    stats.rows_removed = len(rowids)
+    logger.info("Dedup stats: %s", stats)
+    return stats
@@ -0,0 +1,311 @@
+"""Bulk export of the unified history to columnar files.
+
+Parquet is written when the optional ``pyarrow`` dependency is installed
+(``pip install 'llm-tools-browser-history[export]'``).  Otherwise rows are written in
+*bhcol*, a small built-in columnar format that :func:`read_bhcol` reads back:
+
+    file   := MAGIC header block*
+    header := u32 length, JSON {"columns": [name, ...], "types": [declared type, ...]}
+    block  := u32 row count, then for each column:
+              u32 length, zlib(u32 value lengths || utf-8 values)
+
+All integers are little-endian.  A value length of ``0xFFFFFFFF`` marks NULL.
+
+Parquet keeps the column types: INTEGER columns as int64 and ``visited_dt`` as a UTC
+timestamp, so DuckDB and pandas need no casts.
+"""
+
+from __future__ import annotations
+
+import array
+import json
+import logging
+import struct
+import sys
+import zlib
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from sqlite3 import Connection
+from typing import Any, BinaryIO, Literal, Protocol
+
+logger = logging.getLogger(__name__)
+
+ExportFormat = Literal["parquet", "bhcol"]
+PartitionBy = Literal["none", "browser", "date"]
+EXPORT_FORMATS: tuple[ExportFormat, ...] = ("parquet", "bhcol")
+PARTITIONS: tuple[PartitionBy, ...] = ("none", "browser", "date")
+# Rows held in memory at once; each batch becomes one Parquet row group / bhcol block.
+EXPORT_BATCH_SIZE = 50_000
+
+BHCOL_MAGIC = b"BHCOL1\n"
+_NULL_LENGTH = 0xFFFFFFFF
+_U32 = struct.Struct("<I")
+
+# Partition key expression and the ORDER BY that keeps each partition contiguous.
+_PARTITION_SQL: dict[str, tuple[str, str]] = {
+    "none": ("''", "ingest_seq"),
+    "browser": ("browser", "browser"),
+    "date": ("substr(visited_dt, 1, 10)", "visited_dt"),
+}
+
+
+@dataclass
+class ExportStats:
+    rows: int = 0
+    files: list[Path] = field(default_factory=list)
+
+
+@dataclass
+class ExportColumn:
+    """An exported column and its declared SQLite type."""
+
+    name: str
+    declared_type: str = ""
+
+
+class _ColumnarWriter(Protocol):
+    def write_batch(self, columns: list[list[Any]]) -> None: ...
+
+    def close(self) -> None: ...
+
+
+def have_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def default_export_format() -> ExportFormat:
+    """Parquet when pyarrow is installed, otherwise the built-in bhcol format."""
+    return "parquet" if have_pyarrow() else "bhcol"
+
+
+def _u32_array(values: list[int]) -> bytes:
+    lengths = array.array("I", values)
+    if sys.byteorder == "big":
+        lengths.byteswap()
+    return lengths.tobytes()
+
+
+def _encode_value(value: Any) -> tuple[int, bytes]:
+    if value is None:
+        return _NULL_LENGTH, b""
+    data = str(value).encode("utf-8")
+    return len(data), data
+
+
+def _encode_column(values: list[Any]) -> bytes:
+    lengths, data = zip(*(_encode_value(v) for v in values)) if values else ((), ())
+    return zlib.compress(_u32_array(list(lengths)) + b"".join(data))
+
+
+def _decode_column(payload: bytes, rows: int) -> list[str | None]:
+    raw = zlib.decompress(payload)
+    lengths = array.array("I", raw[: rows * 4])
+    if sys.byteorder == "big":
+        lengths.byteswap()
+    values: list[str | None] = []
+    offset = rows * 4
+    for length in lengths:
+        if length == _NULL_LENGTH:
+            values.append(None)
+            continue
+        values.append(raw[offset : offset + length].decode("utf-8"))
+        offset += length
+    return values
+
+
+class BHColWriter:
+    """Writer for the built-in bhcol format."""
+
+    def __init__(self, path: Path, columns: list[ExportColumn]):
+        self._fh: BinaryIO = path.open("wb")
+        header = json.dumps(
+            {"columns": [c.name for c in columns], "types": [c.declared_type for c in columns]}
+        ).encode("utf-8")
+        self._fh.write(BHCOL_MAGIC + _U32.pack(len(header)) + header)
+
+    def write_batch(self, columns: list[list[Any]]) -> None:
+        self._fh.write(_U32.pack(len(columns[0]) if columns else 0))
+        for values in columns:
+            chunk = _encode_column(values)
+            self._fh.write(_U32.pack(len(chunk)) + chunk)
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+def _read_u32(fh: BinaryIO) -> int | None:
+    raw = fh.read(4)
+    return _U32.unpack(raw)[0] if len(raw) == 4 else None
+
+
+def read_bhcol(path: Path) -> Iterator[dict[str, list[str | None]]]:
+    """Yield each block of a bhcol file as a mapping of column name to values."""
+    with path.open("rb") as fh:
+        if fh.read(len(BHCOL_MAGIC)) != BHCOL_MAGIC:
+            raise ValueError(f"{path} is not a bhcol file")
+        columns: list[str] = json.loads(fh.read(_U32.unpack(fh.read(4))[0]))["columns"]
+        while (rows := _read_u32(fh)) is not None:
+            yield {
+                name: _decode_column(fh.read(_U32.unpack(fh.read(4))[0]), rows)
+                for name in columns
+            }
+
+
+def _utc_timestamp(value: Any) -> datetime | None:
+    if value is None:
+        return None
+    return datetime.fromisoformat(str(value)).replace(tzinfo=timezone.utc)
+
+
+def _text(value: Any) -> str | None:
+    return None if value is None else str(value)
+
+
+def _integer(value: Any) -> int | None:
+    return None if value is None else int(value)
+
+
+class ParquetWriter:
+    """Writer for Parquet files: integers as int64, DATETIME as UTC timestamps, else text."""
+
+    def __init__(self, path: Path, columns: list[ExportColumn]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        kinds = [self._column_kind(column.declared_type) for column in columns]
+        self._convert = [convert for _, convert in kinds]
+        self._schema = pa.schema(
+            [(column.name, kind) for column, (kind, _) in zip(columns, kinds)]
+        )
+        self._writer = pq.ParquetWriter(str(path), self._schema, compression="zstd")
+
+    def _column_kind(self, declared_type: str) -> tuple[Any, Any]:
+        """Return the Arrow type for a declared SQLite type and the value conversion to it."""
+        declared = declared_type.upper()
+        if "INT" in declared:
+            return self._pa.int64(), _integer
+        if declared in ("DATETIME", "TIMESTAMP"):
+            return self._pa.timestamp("us", tz="UTC"), _utc_timestamp
+        return self._pa.string(), _text
+
+    def write_batch(self, columns: list[list[Any]]) -> None:
+        arrays = [
+            self._pa.array([convert(v) for v in values], type=column.type)
+            for values, convert, column in zip(columns, self._convert, self._schema)
+        ]
+        self._writer.write_batch(self._pa.record_batch(arrays, schema=self._schema))
+
+    def close(self) -> None:
+        self._writer.close()
+
+
+_WRITERS: dict[str, type[BHColWriter] | type[ParquetWriter]] = {
+    "bhcol": BHColWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def _partition_dir(out_dir: Path, partition_by: PartitionBy, key: str) -> Path:
+    if partition_by == "none":
+        return out_dir
+    return out_dir / f"{partition_by}={key or '__null__'}"
+
+
+class _PartitionedExport:
+    """Route batches to one open writer at a time; rows arrive grouped by partition."""
+
+    def __init__(
+        self,
+        out_dir: Path,
+        fmt: ExportFormat,
+        partition_by: PartitionBy,
+        columns: list[ExportColumn],
+    ):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.partition_by = partition_by
+        self.columns = columns
+        self.stats = ExportStats()
+        self._key: str | None = None
+        self._writer: _ColumnarWriter | None = None
+
+    def write(self, key: str, rows: list[Any]) -> None:
+        writer = self._writer if key == self._key else None
+        if writer is None:
+            writer = self._open(key)
+        writer.write_batch([list(col) for col in zip(*rows)])
+        self.stats.rows += len(rows)
+
+    def _open(self, key: str) -> _ColumnarWriter:
+        self.close()
+        directory = _partition_dir(self.out_dir, self.partition_by, key)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"part-00000.{self.fmt}"
+        self._writer = _WRITERS[self.fmt](path, self.columns)
+        self._key = key
+        self.stats.files.append(path)
+        return self._writer
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def _export_columns(conn: Connection, names: list[str]) -> list[ExportColumn]:
+    declared = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(browser_history)")}
+    return [ExportColumn(name, declared.get(name, "")) for name in names]
+
+
+def _keyed_batches(
+    conn: Connection, partition_by: PartitionBy, batch_size: int
+) -> tuple[list[ExportColumn], Iterator[tuple[str, list[Any]]]]:
+    """Return the columns and an iterator of (partition key, rows) batches."""
+    key_sql, order_sql = _PARTITION_SQL[partition_by]
+    cur = conn.execute(
+        f"SELECT {key_sql} AS _partition, * FROM browser_history ORDER BY {order_sql}"
+    )
+    columns = _export_columns(conn, [desc[0] for desc in cur.description][1:])
+
+    def batches() -> Iterator[tuple[str, list[Any]]]:
+        while rows := cur.fetchmany(batch_size):
+            # Split a fetched batch wherever the partition key changes.
+            start = 0
+            for i in range(1, len(rows) + 1):
+                if i == len(rows) or rows[i][0] != rows[start][0]:
+                    yield str(rows[start][0] or ""), [row[1:] for row in rows[start:i]]
+                    start = i
+
+    return columns, batches()
+
+
+def export_unified_db(
+    conn: Connection,
+    out_dir: Path,
+    fmt: ExportFormat | None = None,
+    partition_by: PartitionBy = "none",
+    batch_size: int = EXPORT_BATCH_SIZE,
+) -> ExportStats:
+    """Write every row of the unified database under *out_dir* as columnar files.
+
+    Rows are read *batch_size* at a time in partition order, so at most one batch and one
+    open file are held at once.  Partitions are laid out Hive-style
+    (``browser=chrome/part-00000.parquet``) so DuckDB and pandas can prune them.
+    """
+    fmt = fmt or default_export_format()
+    columns, batches = _keyed_batches(conn, partition_by, batch_size)
+    export = _PartitionedExport(out_dir, fmt, partition_by, columns)
+    try:
+        for key, rows in batches:
+            export.write(key, rows)
+    finally:
+        export.close()
+    logger.info("Exported %d rows to %d %s files", export.stats.rows, len(export.stats.files), fmt)
+    return export.stats
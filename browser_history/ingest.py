@@ -0,0 +1,209 @@
+"""Streaming ingest: source visits are read, cleaned and written in bounded batches.
+
+Each source is read with keyset pagination on its visit id, so a batch never holds more
+than ``batch_size`` rows and the build can report progress or stop between batches.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from sqlite3 import Connection
+
+from .browser_types import BrowserType
+from .qp_whitelist import Whitelist, process_url
+from .retention import SAFARI_EPOCH_OFFSET, IngestWindow, since_cutoff, window_clause
+
+# Source visits read, cleaned and written per batch.
+INGEST_BATCH_SIZE = 5_000
+
+# (visit id, url, title, referrer url, visited_dt) as read from a source.
+SourceVisit = tuple[int, str, str | None, str | None, str]
+
+# Per browser: visit id column, then the SELECT producing SourceVisit rows.  {alias} is the
+# attached source and {where} the keyset and retention conditions.
+_SOURCE_QUERIES: dict[BrowserType, tuple[str, str]] = {
+    "chrome": (
+        "v.id",
+        """SELECT v.id, u.url, u.title, r.url,
+                  strftime('%Y-%m-%d %H:00:00',
+                           (v.visit_time/1000 - 11644473600*1000)/1000, 'unixepoch')
+           FROM {alias}.urls u
+           JOIN {alias}.visits v       ON v.url = u.id
+           LEFT JOIN {alias}.visits pv ON pv.id = v.from_visit
+           LEFT JOIN {alias}.urls  r   ON r.id = pv.url
+           {where}""",
+    ),
+    "firefox": (
+        "h.id",
+        """SELECT h.id, p.url, p.title, pr.url,
+                  strftime('%Y-%m-%d %H:00:00', h.visit_date/1000000, 'unixepoch')
+           FROM {alias}.moz_historyvisits h
+           JOIN {alias}.moz_places p         ON p.id = h.place_id
+           LEFT JOIN {alias}.moz_historyvisits ph ON ph.id = h.from_visit
+           LEFT JOIN {alias}.moz_places pr    ON pr.id = ph.place_id
+           {where}""",
+    ),
+    # Driven from the visits so every row has a visit time; redirect_source is the visit
+    # that redirected here, which is the closest thing to a referrer Safari records.
+    "safari": (
+        "v.id",
+        f"""SELECT v.id, i.url, v.title, ri.url,
+                   strftime('%Y-%m-%d %H:00:00', v.visit_time + {SAFARI_EPOCH_OFFSET}, 'unixepoch')
+            FROM {{alias}}.history_visits v
+            JOIN {{alias}}.history_items i       ON i.id = v.history_item
+            LEFT JOIN {{alias}}.history_visits rv ON rv.id = v.redirect_source
+            LEFT JOIN {{alias}}.history_items ri  ON ri.id = rv.history_item
+            {{where}}""",
+    ),
+}
+
+_SPAN_TABLES: dict[BrowserType, str] = {
+    "chrome": "visits",
+    "firefox": "moz_historyvisits",
+    "safari": "history_visits",
+}
+
+
+class IngestCancelled(Exception):
+    """Raised by a build whose :class:`IngestControl` was cancelled."""
+
+
+@dataclass
+class StageCounter:
+    """Rows through one ingest stage and the time spent in it."""
+
+    rows: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @contextmanager
+    def timing(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds += time.perf_counter() - started
+
+
+@dataclass
+class IngestCounters:
+    """Throughput of the read, clean and write stages of one build."""
+
+    read: StageCounter = field(default_factory=StageCounter)
+    clean: StageCounter = field(default_factory=StageCounter)
+    write: StageCounter = field(default_factory=StageCounter)
+    batches: int = 0
+
+
+@dataclass
+class IngestControl:
+    """How a build ingests its sources; none of this changes the data it produces.
+
+    *on_progress* is called with the build's progress (0-1) after every batch and stage.
+    Setting *cancel*, from any thread, stops the running build with
+    :class:`IngestCancelled` before its next batch.  Each build clears it when it starts
+    (see :meth:`begin`), so one control serves every later build.
+    """
+
+    batch_size: int = INGEST_BATCH_SIZE
+    on_progress: Callable[[float], None] | None = None
+    cancel: threading.Event = field(default_factory=threading.Event)
+
+    def begin(self) -> None:
+        """Start a build: a cancellation of an earlier build does not carry over."""
+        self.cancel.clear()
+
+    def check(self) -> None:
+        if self.cancel.is_set():
+            raise IngestCancelled("Unified database build cancelled")
+
+
+def visit_id_span(conn: Connection, browser: BrowserType, alias: str) -> tuple[int, int]:
+    """Return the smallest and largest visit id of the source attached as *alias*."""
+    lo, hi = conn.execute(
+        f"SELECT coalesce(min(id), 0), coalesce(max(id), 0) FROM {alias}.{_SPAN_TABLES[browser]}"
+    ).fetchone()
+    return int(lo), int(hi)
+
+
+def window_start_id(
+    conn: Connection, browser: BrowserType, alias: str, window: IngestWindow | None
+) -> int | None:
+    """Return the visit id just before the first visit inside *window*'s cutoff.
+
+    The lookup is answered from the source's visit time index (``visits_time_index``,
+    ``moz_historyvisits_dateindex``, ...), so reading can start at the window instead of
+    at the oldest visit.  ``-1`` without a cutoff, ``None`` when no visit is recent enough.
+    """
+    cutoff = since_cutoff(browser, window)
+    if cutoff is None:
+        return -1
+    column, since = cutoff
+    # The unary + keeps SQLite from answering min(id) by walking the primary key.
+    row = conn.execute(
+        f"SELECT min(+id) FROM {alias}.{_SPAN_TABLES[browser]} WHERE {column} >= ?", (since,)
+    ).fetchone()
+    return None if row[0] is None else int(row[0]) - 1
+
+
+def read_source(
+    conn: Connection,
+    browser: BrowserType,
+    alias: str,
+    window: IngestWindow | None,
+    counters: StageCounter,
+    batch_size: int = INGEST_BATCH_SIZE,
+    after_id: int = -1,
+) -> Iterator[list[SourceVisit]]:
+    """Yield the visits of the source attached as *alias* in visit id order, in batches.
+
+    Each batch is one primary key range query resuming after the last visit id of the
+    previous one.  The first starts after the *after_id* watermark or, if later, just
+    before the first visit inside *window* (see :func:`window_start_id`); the *window*
+    conditions are still evaluated on the rows of each range.
+    """
+    start_id = window_start_id(conn, browser, alias, window)
+    if start_id is None:
+        return
+    key, template = _SOURCE_QUERIES[browser]
+    where, params = window_clause(browser, window, f"{key} > ?")
+    sql = template.replace("{alias}", alias).replace("{where}", where)
+    sql += f" ORDER BY {key} LIMIT ?"
+    last_id = max(after_id, start_id)
+    while True:
+        with counters.timing():
+            rows = conn.execute(sql, (last_id, *params, batch_size)).fetchall()
+        counters.rows += len(rows)
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def clean_urls(raw_url: str, raw_referrer: str | None, whitelist: Whitelist) -> tuple[object, ...]:
+    """Return the URL columns of one visit after applying *whitelist*.
+
+    In order: url, domain, stripped_qp, scheme, path, registrable_domain, path_depth,
+    referrer_url, referrer_domain, referrer_stripped_qp.
+    """
+    page = process_url(raw_url, whitelist)
+    referrer = process_url(raw_referrer, whitelist) if raw_referrer is not None else None
+    return (
+        page["url"],
+        page["domain"],
+        page["stripped_qp"],
+        page["scheme"],
+        page["path"],
+        page["registrable_domain"],
+        page["path_depth"],
+        referrer["url"] if referrer else None,
+        referrer["domain"] if referrer else None,
+        referrer["stripped_qp"] if referrer else None,
+    )
@@ -1,19 +1,47 @@
+import asyncio
 import logging
 import importlib.metadata
+import sqlite3
 import click
 import atexit
 from pathlib import Path
-from typing import Any, Iterable, Literal, get_args
+from collections.abc import Awaitable, Callable, Sized
+from typing import Any, Iterable, Literal, TypeVar, get_args
 
 from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import Response
 
 from .browser_types import BrowserType
+from .compression import TextCodecName
+from .export import (
+    EXPORT_BATCH_SIZE,
+    EXPORT_FORMATS,
+    PARTITIONS,
+    ExportFormat,
+    PartitionBy,
+    export_unified_db,
+)
+from .metrics import CONTENT_TYPE, ServerMetrics, toolbox_gauges
+from .profiling import DEFAULT_SLOW_QUERY_MS, SlowQueryLog, add_query_hook
+from .retention import DEFAULT_SAMPLE_EVERY, parse_since
+from .sketches import Period, SketchKind
 from .toolbox import BrowserHistory
-from .sqlite import cleanup_unified_db, get_or_create_unified_db, run_unified_query_with_headers
+from .output import OUTPUT_FORMATS, STREAM_WRITERS, format_table, row_count_footer
+from .sqlite import (
+    cleanup_unified_db,
+    get_or_create_unified_db,
+    iter_unified_query_with_headers,
+    run_unified_query_with_headers,
+)
 from .qp_whitelist import load_whitelist, Whitelist
+from .warmup import RefreshTimer, Warmup
+from .workload import DEFAULT_INDEX_THRESHOLD
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T", bound=Sized)
+
 LOG_LEVELS = {
     "debug": logging.DEBUG,
     "info": logging.INFO,
@@ -30,70 +58,305 @@ def get_version() -> str:
         return "0.0.0-dev"
 
 
-def make_mcp(sources: Iterable[str], max_rows: int, whitelist: Whitelist | None = None) -> FastMCP:
+def make_mcp(
+    sources: Iterable[str],
+    max_rows: int,
+    whitelist: Whitelist | None = None,
+    max_memory_mb: int | None = None,
+    db_path: str | None = None,
+    mmap_size_mb: int = 0,
+    db_max_age: int | None = None,
+    dedup_window_hours: int | None = None,
+    since: str | None = None,
+    retention_days: int | None = None,
+    sample_after_days: int | None = None,
+    sample_every: int = DEFAULT_SAMPLE_EVERY,
+    sketches: bool = False,
+    text_compression: TextCodecName | None = None,
+    whitelist_path: Path | None = None,
+    max_query_cost: int | None = None,
+    rewrite_like: bool = False,
+    workload_profile: str | None = None,
+    adaptive_index_threshold: int = DEFAULT_INDEX_THRESHOLD,
+    warm_up: bool = False,
+    metrics: bool = False,
+    embedding_model: str | None = None,
+    allow_remote_embeddings: bool = False,
+    refresh_interval: float | None = None,
+) -> FastMCP:
+    """Create the MCP server; with *warm_up* the unified database build starts right away.
+
+    The build runs in a worker thread either way, so the event loop keeps serving while it
+    runs and ``search`` answers with the build progress until the data is ready.
+    With *metrics* the HTTP transports also serve Prometheus metrics at ``/metrics``.
+    With *refresh_interval* the database is rebuilt from the sources every that many
+    seconds, so a long-running server sees new visits.
+    """
     mcp = FastMCP("browser-history", stateless_http=True, json_response=True)
 
     # Pass sources and max_rows to BrowserHistory
-    browser_history = BrowserHistory(sources, max_rows, whitelist=whitelist)
+    browser_history = BrowserHistory(
+        sources,
+        max_rows,
+        whitelist=whitelist,
+        whitelist_path=whitelist_path,
+        max_memory_mb=max_memory_mb,
+        db_path=db_path,
+        mmap_size_mb=mmap_size_mb,
+        db_max_age=db_max_age,
+        dedup_window_hours=dedup_window_hours,
+        since=since,
+        retention_days=retention_days,
+        sample_after_days=sample_after_days,
+        sample_every=sample_every,
+        sketches=sketches,
+        text_compression=text_compression,
+        max_query_cost=max_query_cost,
+        rewrite_like=rewrite_like,
+        workload_profile=workload_profile,
+        adaptive_index_threshold=adaptive_index_threshold,
+        embedding_model=embedding_model,
+        allow_remote_embeddings=allow_remote_embeddings,
+    )
+
+    warmup = Warmup(browser_history._prepare, browser_history._build_stats)
+    if warm_up:
+        warmup.start()
+    if refresh_interval is not None:
+        refresher = RefreshTimer(browser_history._refresh, refresh_interval)
+        refresher.start()
+        atexit.register(refresher.stop)
+    server_metrics = ServerMetrics()
+    if metrics:
+        _add_metrics_route(mcp, server_metrics, browser_history)
+    _register_tools(mcp, browser_history, warmup, server_metrics)
+    return mcp
+
 
+def _register_tools(
+    mcp: FastMCP, browser_history: BrowserHistory, warmup: Warmup, server_metrics: ServerMetrics
+) -> None:
     @mcp.tool(description=browser_history.search.__doc__)
-    def search(sql: str) -> list[Any]:
-        return browser_history._do_search(sql)
+    async def search(sql: str, params: dict[str, Any] | None = None) -> list[Any]:
+        return await _run_tool(
+            "search", warmup, server_metrics, browser_history._do_search, sql, params
+        )
 
-    return mcp
+    @mcp.tool(description=browser_history.approx_stats.__doc__)
+    async def approx_stats(
+        kind: SketchKind,
+        k: int = 10,
+        period: Period = "month",
+        browser: str | None = None,
+        profile: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> list[Any]:
+        return await _run_tool(
+            "approx_stats",
+            warmup,
+            server_metrics,
+            browser_history._do_approx_stats,
+            *(kind, k, period, browser, profile, since, until),
+        )
 
+    @mcp.tool(description=browser_history.search_many.__doc__)
+    async def search_many(queries: list[dict[str, Any]], parallel: bool = False) -> list[Any]:
+        return await _run_tool(
+            "search_many",
+            warmup,
+            server_metrics,
+            browser_history._do_search_many,
+            queries,
+            parallel,
+            rows=_batch_rows,
+        )
 
-def _stringify_row(row: Any) -> list[str]:
-    """Convert a row of values to strings, replacing None with empty string."""
-    return [str(v) if v is not None else "" for v in row]
+    @mcp.tool(description=browser_history.changes_since.__doc__)
+    async def changes_since(token: str | None = None) -> dict[str, Any] | list[str]:
+        return await _run_tool(
+            "changes_since",
+            warmup,
+            server_metrics,
+            browser_history._do_changes_since,
+            token,
+            rows=_feed_rows,
+        )
 
+    if browser_history.embedding_model is None:
+        return
 
-def _column_widths(all_rows: list[list[str]]) -> list[int]:
-    """Compute the max width for each column across all rows (including header)."""
-    widths = [0] * (len(all_rows[0]) if all_rows else 0)
-    for row in all_rows:
-        for i, cell in enumerate(row):
-            widths[i] = max(widths[i], len(cell))
-    return widths
+    @mcp.tool(description=browser_history.semantic_search.__doc__)
+    async def semantic_search(query: str, k: int = 10) -> list[Any]:
+        return await _run_tool(
+            "semantic_search", warmup, server_metrics, browser_history._do_semantic_search, query, k
+        )
 
 
-def _format_table(headers: list[str], rows: list[Any]) -> str:
-    """Format *headers* and *rows* as an aligned text table."""
-    str_rows = [_stringify_row(row) for row in rows]
-    widths = _column_widths([headers] + str_rows)
-    fmt = "  ".join(f"{{:<{w}}}" for w in widths)
-    separator = ["-" * w for w in widths]
-    lines = [fmt.format(*headers), fmt.format(*separator)]
-    lines.extend(fmt.format(*row) for row in str_rows)
-    return "\n".join(lines)
+def _batch_rows(results: list[Any]) -> int:
+    """Rows returned by a ``search_many`` batch; failed queries return none."""
+    return sum(len(result) for result in results if isinstance(result, list))
 
 
-def _run_single_query(
+def _feed_rows(changes: dict[str, Any]) -> int:
+    return len(changes["rows"])
+
+
+async def _run_tool(
+    tool: str,
+    warmup: Warmup,
+    server_metrics: ServerMetrics,
+    func: Callable[..., T],
+    *args: Any,
+    rows: Callable[[T], int] = len,
+) -> T | list[str]:
+    """Run *func* in a worker thread once the build is ready, tracking the call's metrics.
+
+    *rows* counts the rows in *func*'s result, for the rows metric.  While the build is
+    still running the call returns the build's progress instead.
+    """
+    with server_metrics.track(tool) as call:
+        if not await warmup.wait():
+            call.timed_out = True
+            return [warmup.status()]
+        result = await asyncio.to_thread(func, *args)
+        call.rows = rows(result)
+        return result
+
+
+RouteHandler = Callable[[Request], Awaitable[Response]]
+
+
+def _add_metrics_route(
+    mcp: FastMCP, server_metrics: ServerMetrics, browser_history: BrowserHistory
+) -> None:
+    async def metrics(_request: Request) -> Response:
+        # The gauges stat the database file and take the registry lock: keep them off the
+        # event loop.  The call counters are only touched on the loop, so render them here.
+        gauges = await asyncio.to_thread(toolbox_gauges, browser_history)
+        return Response(server_metrics.render(gauges), media_type=CONTENT_TYPE)
+
+    route: Callable[[RouteHandler], RouteHandler] = mcp.custom_route(
+        "/metrics", methods=["GET"], include_in_schema=False
+    )
+    route(metrics)
+
+
+def _parse_params(
+    _ctx: click.Context, _param: click.Parameter, values: tuple[str, ...]
+) -> dict[str, object]:
+    """Parse repeated ``--param NAME=VALUE`` options into named SQL parameters."""
+    params: dict[str, object] = {}
+    for item in values:
+        name, sep, value = item.partition("=")
+        if not sep or not name:
+            raise click.BadParameter(f"expected NAME=VALUE, got {item!r}")
+        params[name] = value
+    return params
+
+
+def _parse_since(
+    _ctx: click.Context, _param: click.Parameter, value: str | None
+) -> str | None:
+    """Validate ``--since`` as an ISO 8601 date or datetime."""
+    if value is None:
+        return None
+    try:
+        parse_since(value)
+    except ValueError:
+        raise click.BadParameter(f"expected an ISO 8601 date, got {value!r}") from None
+    return value
+
+
+def _open_unified_db(
     sources: tuple[str, ...],
     max_rows: int,
-    whitelist: Whitelist,
+    whitelist: Whitelist | None,
+    max_memory_mb: int | None = None,
+    db_path: str | None = None,
+    mmap_size_mb: int = 0,
+    db_max_age: int | None = None,
+    dedup_window_hours: int | None = None,
+    since: str | None = None,
+    retention_days: int | None = None,
+    sample_after_days: int | None = None,
+    sample_every: int = DEFAULT_SAMPLE_EVERY,
+    sketches: bool = False,
+    text_compression: TextCodecName | None = None,
+) -> sqlite3.Connection:
+    """Build (or reuse) the unified database for the CLI's one-shot commands."""
+    bh = BrowserHistory(
+        sources or None,
+        max_rows,
+        whitelist=whitelist,
+        max_memory_mb=max_memory_mb,
+        db_path=db_path,
+        mmap_size_mb=mmap_size_mb,
+        db_max_age=db_max_age,
+        dedup_window_hours=dedup_window_hours,
+        since=since,
+        retention_days=retention_days,
+        sample_after_days=sample_after_days,
+        sample_every=sample_every,
+        sketches=sketches,
+        text_compression=text_compression,
+    )
+    return get_or_create_unified_db(
+        bh.sources,
+        whitelist=whitelist,
+        max_memory=bh.max_memory,
+        db_path=bh.db_path,
+        mmap_size=bh.mmap_size,
+        max_age=bh.db_max_age,
+        options=bh.build_options,
+    )
+
+
+def _run_single_query(
+    db_options: dict[str, Any],
     sql: str,
+    params: dict[str, object] | None = None,
+    output_format: str = "table",
 ) -> None:
-    """Execute a single SQL query, print a human-readable table, then exit."""
+    """Execute a single SQL query, print its results, then exit.
+
+    *db_options* are the :func:`_open_unified_db` arguments.  ``table`` buffers the rows to
+    size every column exactly; the other formats stream rows to stdout as they come off the
+    cursor.
+    """
+    max_rows = db_options["max_rows"]
     try:
-        bh = BrowserHistory(sources or None, max_rows, whitelist=whitelist)
-        conn = get_or_create_unified_db(bh.sources, whitelist=whitelist)
-        headers, rows = run_unified_query_with_headers(conn, sql, max_rows=max_rows)
+        conn = _open_unified_db(**db_options)
+        if output_format == "table":
+            _print_table(*run_unified_query_with_headers(conn, sql, params, max_rows=max_rows))
+        else:
+            headers, rows = iter_unified_query_with_headers(conn, sql, params, max_rows=max_rows)
+            STREAM_WRITERS[output_format](headers, rows, click.get_text_stream("stdout"))
     except Exception as exc:
         click.echo(f"Error: {exc}", err=True)
         raise SystemExit(1) from None
     finally:
         cleanup_unified_db()
 
+
+def _configure_logging(
+    log_level: str, slow_query_log: Path | None, slow_query_ms: float
+) -> None:
+    logging.basicConfig(level=LOG_LEVELS[log_level])
+    if slow_query_log is not None:
+        add_query_hook(SlowQueryLog(slow_query_log, slow_query_ms))
+
+
+def _print_table(headers: list[str], rows: list[Any]) -> None:
     if not rows:
         click.echo("(no results)")
         return
 
-    click.echo(_format_table(headers, rows))
-    click.echo(f"\n({len(rows)} row{'s' if len(rows) != 1 else ''})")
+    click.echo(format_table(headers, rows))
+    click.echo(row_count_footer(len(rows)))
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.version_option(version=get_version(), prog_name="browser-history-mcp")
 @click.option(
     "--transport",
@@ -110,10 +373,10 @@ def _run_single_query(
 )
 @click.option(
     "--max-rows",
-    type=int,
+    type=click.IntRange(min=0),
     default=100,
     show_default=True,
-    help="Maximum rows to return from a search",
+    help="Maximum rows to return from a search (0 for no limit)",
 )
 @click.option(
     "--log-level",
@@ -129,7 +392,8 @@ def _run_single_query(
     type=click.Path(exists=True, dir_okay=False, path_type=Path),
     default=None,
     help="Path to a YAML file mapping domains to allowed query-parameter keys. "
-    "When omitted the built-in default whitelist is used.",
+    "When omitted the built-in default whitelist is used. The server reloads the file when "
+    "it changes and re-cleans only the rows of affected domains.",
 )
 @click.option(
     "--query",
@@ -138,25 +402,295 @@ def _run_single_query(
     default=None,
     help="Execute a single SQL query against the browser history, print results, and exit.",
 )
+@click.option(
+    "--param",
+    "params",
+    multiple=True,
+    callback=_parse_params,
+    metavar="NAME=VALUE",
+    help="Bind a named parameter (:NAME) in the --query SQL. May be repeated.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="table",
+    show_default=True,
+    help="Output format for --query. 'table' sizes columns over all rows; 'sampled-table', "
+    "'csv', 'tsv' and 'jsonl' stream rows as they are read.",
+)
+@click.option(
+    "--max-memory",
+    "max_memory_mb",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Memory budget in MiB for the unified database. When the projected size exceeds it, "
+    "the database is built in a temporary file with a capped page cache instead of in memory.",
+)
+@click.option(
+    "--db-file",
+    "db_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Persist the unified database to this file (rebuilt on startup) and serve queries "
+    "from read-only connections on it instead of an in-memory database.",
+)
+@click.option(
+    "--mmap-size",
+    "mmap_size_mb",
+    type=click.IntRange(min=0),
+    default=0,
+    show_default=True,
+    help="Memory-map up to this many MiB of the --db-file database for queries (0 disables).",
+)
+@click.option(
+    "--db-max-age",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Reuse an existing --db-file built from the same sources and whitelist if it is at "
+    "most this many seconds old, instead of rebuilding it on startup.",
+)
+@click.option(
+    "--dedup-window",
+    "dedup_window_hours",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Drop visits that browser sync copied into several profiles: visits to the same URL "
+    "by the same browser within this many hours are kept from one profile only.",
+)
+@click.option(
+    "--since",
+    callback=_parse_since,
+    default=None,
+    metavar="DATE",
+    help="Only import visits on or after this ISO 8601 date or datetime (UTC).",
+)
+@click.option(
+    "--retention-days",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Only import visits from the last N days. With --since, the later cutoff wins.",
+)
+@click.option(
+    "--sample-after-days",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Down-sample visits older than N days to one in --sample-every.",
+)
+@click.option(
+    "--sample-every",
+    type=click.IntRange(min=1),
+    default=DEFAULT_SAMPLE_EVERY,
+    show_default=True,
+    help="Keep one in this many visits older than --sample-after-days.",
+)
+@click.option(
+    "--sketches/--no-sketches",
+    default=False,
+    show_default=True,
+    help="Summarise visits into top-K and distinct-count sketches while building, for the "
+    "approx_stats tool's instant approximate answers.",
+)
+@click.option(
+    "--compress-text",
+    "text_compression",
+    type=click.Choice(["zlib", "zstd"]),
+    default=None,
+    help="Store URLs and titles compressed with a dictionary trained on them, for a smaller "
+    "database at the cost of a slower build and slower full scans (zstd needs the "
+    "zstandard package).",
+)
+@click.option(
+    "--max-query-cost",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Reject search queries whose EXPLAIN QUERY PLAN estimate visits more rows than this, "
+    "with a message telling the model how to rewrite them.",
+)
+@click.option(
+    "--rewrite-like/--no-rewrite-like",
+    default=False,
+    show_default=True,
+    help="Add index-friendly ranges to search queries using LIKE 'prefix%' on indexed columns.",
+)
+@click.option(
+    "--workload-profile",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Enable adaptive indexing: record the columns unindexed search queries filter and "
+    "sort on in this JSON file (kept across runs) and build composite indexes for hot patterns.",
+)
+@click.option(
+    "--adaptive-index-threshold",
+    type=click.IntRange(min=1),
+    default=DEFAULT_INDEX_THRESHOLD,
+    show_default=True,
+    help="Number of times a filter/sort pattern must be seen before it is indexed.",
+)
+@click.option(
+    "--metrics/--no-metrics",
+    default=False,
+    show_default=True,
+    help="Serve Prometheus metrics (tool latency, errors, timeouts, database size) at "
+    "/metrics on the sse and streamable-http transports.",
+)
+@click.option(
+    "--embedding-model",
+    default=None,
+    metavar="MODEL_ID",
+    help="Enable the semantic_search tool: embed distinct page titles with this local llm "
+    "embedding model (cached in the database, so only new titles are embedded).",
+)
+@click.option(
+    "--allow-remote-embeddings/--no-allow-remote-embeddings",
+    default=False,
+    show_default=True,
+    help="Accept an --embedding-model that needs an API key. Every page title in the "
+    "history is then sent to that provider.",
+)
+@click.option(
+    "--refresh-interval",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Rebuild the unified database from the browsers every this many seconds, so new "
+    "visits show up without restarting the server. Running queries finish on the old build.",
+)
+@click.option(
+    "--slow-query-log",
+    type=click.Path(dir_okay=False, path_type=Path),
+    default=None,
+    help="Append queries slower than --slow-query-ms to this JSON Lines file, with their "
+    "wall time, rows, SQLite VM steps and query plan. Literals in the SQL are redacted.",
+)
+@click.option(
+    "--slow-query-ms",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_SLOW_QUERY_MS,
+    show_default=True,
+    help="Threshold in milliseconds for --slow-query-log.",
+)
+@click.pass_context
 def cli(
+    ctx: click.Context,
     transport: str,
     sources: tuple[str, ...],
     max_rows: int,
     log_level: str,
     qp_whitelist_path: Path | None,
     single_query: str | None,
+    params: dict[str, object],
+    output_format: str,
+    max_memory_mb: int | None,
+    db_path: str | None,
+    mmap_size_mb: int,
+    db_max_age: int | None,
+    dedup_window_hours: int | None,
+    since: str | None,
+    retention_days: int | None,
+    sample_after_days: int | None,
+    sample_every: int,
+    sketches: bool,
+    text_compression: TextCodecName | None,
+    max_query_cost: int | None,
+    rewrite_like: bool,
+    workload_profile: str | None,
+    adaptive_index_threshold: int,
+    metrics: bool,
+    embedding_model: str | None,
+    allow_remote_embeddings: bool,
+    refresh_interval: int | None,
+    slow_query_log: Path | None,
+    slow_query_ms: float,
 ) -> None:
-    logging.basicConfig(level=LOG_LEVELS[log_level])
+    _configure_logging(log_level, slow_query_log, slow_query_ms)
 
     whitelist = load_whitelist(qp_whitelist_path)
+    db_options: dict[str, Any] = {
+        "sources": sources,
+        "max_rows": max_rows,
+        "whitelist": whitelist,
+        "max_memory_mb": max_memory_mb,
+        "db_path": db_path,
+        "mmap_size_mb": mmap_size_mb,
+        "db_max_age": db_max_age,
+        "dedup_window_hours": dedup_window_hours,
+        "since": since,
+        "retention_days": retention_days,
+        "sample_after_days": sample_after_days,
+        "sample_every": sample_every,
+        "sketches": sketches,
+        "text_compression": text_compression,
+    }
+
+    if ctx.invoked_subcommand is not None:
+        # Subcommands build the unified database from the same source options.
+        ctx.obj = db_options
+        return
 
     if single_query is not None:
-        _run_single_query(sources, max_rows, whitelist, single_query)
+        _run_single_query(db_options, single_query, params, output_format)
         return
 
+    if metrics and transport == "stdio":
+        logger.warning("--metrics needs an HTTP transport (sse or streamable-http); ignoring it")
     atexit.register(cleanup_unified_db)
     transport_mode: Literal["stdio", "sse", "streamable-http"] = transport  # type: ignore[assignment]
-    make_mcp(sources, max_rows, whitelist=whitelist).run(transport=transport_mode)
+    make_mcp(
+        **db_options,
+        whitelist_path=qp_whitelist_path,
+        max_query_cost=max_query_cost,
+        rewrite_like=rewrite_like,
+        workload_profile=workload_profile,
+        adaptive_index_threshold=adaptive_index_threshold,
+        warm_up=True,
+        metrics=metrics,
+        embedding_model=embedding_model,
+        allow_remote_embeddings=allow_remote_embeddings,
+        refresh_interval=refresh_interval,
+    ).run(transport=transport_mode)
+
+
+@cli.command()
+@click.argument("output_dir", type=click.Path(file_okay=False, path_type=Path))
+@click.option(
+    "--format",
+    "export_format",
+    type=click.Choice(EXPORT_FORMATS),
+    default=None,
+    help="File format (default: parquet when pyarrow is installed, otherwise bhcol).",
+)
+@click.option(
+    "--partition-by",
+    type=click.Choice(PARTITIONS),
+    default="none",
+    show_default=True,
+    help="Split the output into Hive-style directories by browser or visit date.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=EXPORT_BATCH_SIZE,
+    show_default=True,
+    help="Rows read and written per batch (one Parquet row group or bhcol block).",
+)
+@click.pass_obj
+def export(
+    obj: dict[str, Any],
+    output_dir: Path,
+    export_format: ExportFormat | None,
+    partition_by: PartitionBy,
+    batch_size: int,
+) -> None:
+    """Export the unified browser history to columnar files in OUTPUT_DIR."""
+    try:
+        conn = _open_unified_db(**obj)
+        stats = export_unified_db(conn, output_dir, export_format, partition_by, batch_size)
+    except Exception as exc:
+        click.echo(f"Error: {exc}", err=True)
+        raise SystemExit(1) from None
+    finally:
+        cleanup_unified_db()
+    click.echo(f"Exported {stats.rows} rows to {len(stats.files)} file(s) in {output_dir}")
 
 
 if __name__ == "__main__":
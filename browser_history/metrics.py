@@ -0,0 +1,147 @@
+"""Prometheus text-format metrics for the MCP server's HTTP transports."""
+
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from .sqlite import UNIFIED_DB_REGISTRY, peak_rss_bytes
+from .toolbox import BrowserHistory
+
+# Upper bounds (seconds) of the tool call latency histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# (name, type, help text, value)
+Gauge = tuple[str, str, str, float]
+
+
+@dataclass
+class _Histogram:
+    # One count per bucket plus the +Inf bucket, not cumulative.
+    counts: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    total: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+
+
+@dataclass
+class ToolCall:
+    """What a tracked call reports back: rows returned, or that it timed out."""
+
+    rows: int = 0
+    timed_out: bool = False
+
+
+class ServerMetrics:
+    """Per-tool call latency, row, error and timeout counters.
+
+    Calls are tracked on the event loop thread, so the counters need no locking and a
+    tracked call costs two clock reads and a few dict updates.
+    """
+
+    def __init__(self) -> None:
+        self._latency: dict[str, _Histogram] = {}
+        self._rows: dict[str, int] = {}
+        self._errors: dict[str, int] = {}
+        self._timeouts: dict[str, int] = {}
+
+    @contextmanager
+    def track(self, tool: str) -> Iterator[ToolCall]:
+        """Time one call of *tool*; exceptions escaping the block count as errors."""
+        call = ToolCall()
+        started = time.perf_counter()
+        try:
+            yield call
+        except Exception:
+            _bump(self._errors, tool)
+            raise
+        finally:
+            self._latency.setdefault(tool, _Histogram()).observe(time.perf_counter() - started)
+            _bump(self._rows, tool, call.rows)
+            _bump(self._timeouts, tool, int(call.timed_out))
+
+    def render(self, gauges: list[Gauge] | None = None) -> str:
+        """Return the metrics, followed by *gauges*, in the Prometheus text format."""
+        lines = self._histogram_lines()
+        for name, help_text, counts in (
+            ("browser_history_tool_rows_total", "Rows returned by tool calls.", self._rows),
+            ("browser_history_tool_errors_total", "Tool calls that raised.", self._errors),
+            (
+                "browser_history_tool_timeouts_total",
+                "Tool calls that gave up waiting for the unified database build.",
+                self._timeouts,
+            ),
+        ):
+            lines += _header(name, "counter", help_text)
+            lines += [f'{name}{{tool="{tool}"}} {value}' for tool, value in counts.items()]
+        for name, kind, help_text, value in gauges or []:
+            lines += _header(name, kind, help_text) + [f"{name} {value:g}"]
+        return "\n".join(lines) + "\n"
+
+    def _histogram_lines(self) -> list[str]:
+        name = "browser_history_tool_call_seconds"
+        lines = _header(name, "histogram", "Tool call latency in seconds.")
+        for tool, histogram in self._latency.items():
+            cumulative = 0
+            for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{tool="{tool}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{tool="{tool}"}} {histogram.total:g}')
+            lines.append(f'{name}_count{{tool="{tool}"}} {cumulative}')
+        return lines
+
+
+def _bump(counts: dict[str, int], key: str, by: int = 1) -> None:
+    counts[key] = counts.get(key, 0) + by
+
+
+def _header(name: str, kind: str, help_text: str) -> list[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+
+def toolbox_gauges(browser_history: BrowserHistory) -> list[Gauge]:
+    """Return gauges describing *browser_history*'s unified database and the registry.
+
+    Everything is read from counters kept by the build and the registry; nothing queries
+    the database, so a scrape never waits behind a running search.
+    """
+    stats = browser_history._build_stats
+    db_path = browser_history.db_path
+    file_bytes = db_path.stat().st_size if db_path is not None and db_path.exists() else 0
+    registry = UNIFIED_DB_REGISTRY
+    return [
+        ("browser_history_unified_db_rows", "gauge", "Rows in the unified database.", stats.rows),
+        (
+            "browser_history_unified_db_memory_bytes",
+            "gauge",
+            "Size of the in-memory unified databases kept open.",
+            registry.total_bytes(),
+        ),
+        (
+            "browser_history_unified_db_file_bytes",
+            "gauge",
+            "Size of the persisted unified database file.",
+            file_bytes,
+        ),
+        ("browser_history_build_seconds", "gauge", "Duration of the last build.", stats.seconds),
+        ("browser_history_build_progress", "gauge", "Build progress (0-1).", stats.progress),
+        (
+            "browser_history_registry_hits_total",
+            "counter",
+            "Lookups served by an already open unified database.",
+            registry.hits,
+        ),
+        (
+            "browser_history_registry_misses_total",
+            "counter",
+            "Lookups that had to build or open a unified database.",
+            registry.misses,
+        ),
+        ("browser_history_peak_rss_bytes", "gauge", "Peak resident set size.", peak_rss_bytes()),
+    ]
@@ -0,0 +1,104 @@
+"""Formatting of ``--query`` results, including streaming writers for large exports."""
+
+from __future__ import annotations
+
+import csv
+import itertools
+import json
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any, Literal, TextIO
+
+OutputFormat = Literal["table", "sampled-table", "csv", "tsv", "jsonl"]
+OUTPUT_FORMATS: tuple[OutputFormat, ...] = ("table", "sampled-table", "csv", "tsv", "jsonl")
+# Rows used to size the columns of a sampled table; later rows may overflow their column.
+WIDTH_SAMPLE_ROWS = 200
+
+
+def _stringify_row(row: Any) -> list[str]:
+    """Convert a row of values to strings, replacing None with empty string."""
+    return [str(v) if v is not None else "" for v in row]
+
+
+def _column_widths(all_rows: list[list[str]]) -> list[int]:
+    """Compute the max width for each column across all rows (including header)."""
+    widths = [0] * (len(all_rows[0]) if all_rows else 0)
+    for row in all_rows:
+        for i, cell in enumerate(row):
+            widths[i] = max(widths[i], len(cell))
+    return widths
+
+
+def _table_lines(headers: list[str], str_rows: list[list[str]]) -> tuple[str, list[str]]:
+    """Return the row format string and the header/separator lines for *str_rows*."""
+    widths = _column_widths([headers] + str_rows)
+    fmt = "  ".join(f"{{:<{w}}}" for w in widths)
+    separator = ["-" * w for w in widths]
+    return fmt, [fmt.format(*headers), fmt.format(*separator)]
+
+
+def format_table(headers: list[str], rows: list[Any]) -> str:
+    """Format *headers* and *rows* as an aligned text table."""
+    str_rows = [_stringify_row(row) for row in rows]
+    fmt, lines = _table_lines(headers, str_rows)
+    lines.extend(fmt.format(*row) for row in str_rows)
+    return "\n".join(lines)
+
+
+def row_count_footer(count: int) -> str:
+    return f"\n({count} row{'s' if count != 1 else ''})"
+
+
+def write_sampled_table(
+    headers: list[str], rows: Iterable[Any], out: TextIO, sample_size: int = WIDTH_SAMPLE_ROWS
+) -> int:
+    """Stream an aligned table whose column widths come from the first *sample_size* rows."""
+    row_iter = iter(rows)
+    sample = [_stringify_row(row) for row in itertools.islice(row_iter, sample_size)]
+    if not sample:
+        out.write("(no results)\n")
+        return 0
+    fmt, lines = _table_lines(headers, sample)
+    out.write("\n".join(lines) + "\n")
+    count = 0
+    for str_row in itertools.chain(sample, (_stringify_row(row) for row in row_iter)):
+        out.write(fmt.format(*str_row) + "\n")
+        count += 1
+    out.write(row_count_footer(count) + "\n")
+    return count
+
+
+def _write_delimited(headers: list[str], rows: Iterable[Any], out: TextIO, dialect: str) -> int:
+    writer = csv.writer(out, dialect=dialect, lineterminator="\n")
+    writer.writerow(headers)
+    count = 0
+    for row in rows:
+        writer.writerow(_stringify_row(row))
+        count += 1
+    return count
+
+
+def write_csv(headers: list[str], rows: Iterable[Any], out: TextIO) -> int:
+    """Stream *rows* as CSV with a header line."""
+    return _write_delimited(headers, rows, out, "excel")
+
+
+def write_tsv(headers: list[str], rows: Iterable[Any], out: TextIO) -> int:
+    """Stream *rows* as tab-separated values with a header line."""
+    return _write_delimited(headers, rows, out, "excel-tab")
+
+
+def write_jsonl(headers: list[str], rows: Iterable[Any], out: TextIO) -> int:
+    """Stream *rows* as JSON Lines, one object per row keyed by column name."""
+    count = 0
+    for row in rows:
+        out.write(json.dumps(dict(zip(headers, row)), default=str) + "\n")
+        count += 1
+    return count
+
+
+STREAM_WRITERS: dict[str, Callable[[list[str], Iterator[Any], TextIO], int]] = {
+    "sampled-table": write_sampled_table,
+    "csv": write_csv,
+    "tsv": write_tsv,
+    "jsonl": write_jsonl,
+}
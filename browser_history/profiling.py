@@ -0,0 +1,129 @@
+"""Per-query profiling hooks and a JSON Lines slow-query log."""
+
+from __future__ import annotations
+
+import json
+import logging
+import re
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from sqlite3 import Connection
+
+from .query_plan import explain_query_plan
+
+logger = logging.getLogger(__name__)
+
+# SQLite VM instructions between progress handler calls while a query is profiled.  Step
+# counts are accurate to this granularity; smaller values cost more Python callbacks.
+VM_STEP_INTERVAL = 1_000
+DEFAULT_SLOW_QUERY_MS = 250
+
+# String and blob literals (with '' escapes), then numbers not part of an identifier.
+_STRING_LITERAL_RE = re.compile(r"[xX]?'(?:[^']|'')*'")
+_NUMBER_LITERAL_RE = re.compile(r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+
+
+@dataclass
+class QueryProfile:
+    """What one profiled query cost."""
+
+    sql: str
+    seconds: float = 0.0
+    rows: int = 0
+    # Approximate, to VM_STEP_INTERVAL.
+    vm_steps: int = 0
+    # Returns the query plan; only called when a hook asks for ``plan``.
+    explain: Callable[[], list[str]] | None = field(default=None, repr=False)
+    _plan: list[str] | None = field(default=None, init=False, repr=False)
+
+    @property
+    def plan(self) -> list[str]:
+        """The query's plan, explained on first use so queries no hook logs skip it."""
+        if self._plan is None:
+            self._plan = self.explain() if self.explain is not None else []
+        return self._plan
+
+
+QueryHook = Callable[[QueryProfile], None]
+
+# Hooks called after every profiled query.  With none installed profiling is skipped.
+QUERY_HOOKS: list[QueryHook] = []
+
+
+def add_query_hook(hook: QueryHook) -> None:
+    QUERY_HOOKS.append(hook)
+
+
+def remove_query_hook(hook: QueryHook) -> None:
+    if hook in QUERY_HOOKS:
+        QUERY_HOOKS.remove(hook)
+
+
+@contextmanager
+def profile_query(
+    conn: Connection, sql: str, params: dict[str, object] | None
+) -> Iterator[QueryProfile]:
+    """Profile the query run inside the block; the block sets ``rows`` on the profile.
+
+    Hooks see the profile only if the block succeeds.  VM steps are counted with a progress
+    handler on *conn*, so they are approximate when several threads share the connection.
+    """
+    profile = QueryProfile(sql)
+    if not QUERY_HOOKS:
+        yield profile
+        return
+    ticks = 0
+
+    def _tick() -> int:
+        nonlocal ticks
+        ticks += 1
+        return 0
+
+    conn.set_progress_handler(_tick, VM_STEP_INTERVAL)
+    started = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.seconds = time.perf_counter() - started
+        conn.set_progress_handler(None, 0)
+    profile.vm_steps = ticks * VM_STEP_INTERVAL
+    profile.explain = partial(explain_query_plan, conn, sql, params)
+    for hook in list(QUERY_HOOKS):
+        hook(profile)
+
+
+def redact_sql(sql: str) -> str:
+    """Replace string, blob and numeric literals in *sql* with ``?``."""
+    return _NUMBER_LITERAL_RE.sub("?", _STRING_LITERAL_RE.sub("?", sql))
+
+
+class SlowQueryLog:
+    """Query hook appending queries slower than *threshold_ms* to a JSON Lines file.
+
+    The SQL is written with its literals redacted; bound parameter values are never logged.
+    """
+
+    def __init__(self, path: Path, threshold_ms: float = DEFAULT_SLOW_QUERY_MS):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+
+    def __call__(self, profile: QueryProfile) -> None:
+        if profile.seconds * 1000 < self.threshold_ms:
+            return
+        record = {
+            "ts": time.time(),
+            "ms": round(profile.seconds * 1000, 3),
+            "rows": profile.rows,
+            "vm_steps": profile.vm_steps,
+            "plan": profile.plan,
+            "sql": redact_sql(profile.sql),
+        }
+        with self._lock, self.path.open("a", encoding="utf-8") as out:
+            out.write(json.dumps(record) + "\n")
+        logger.info("Slow query (%.1fms) logged to %s", record["ms"], self.path)
@@ -0,0 +1,127 @@
+"""Registrable domains from the bundled Public Suffix List.
+
+The rules are compiled on first use into a trie keyed by domain label, right to left, so a
+lookup walks at most as many nodes as the host has labels.  Internationalised rules are
+added in their punycode form too, as hosts appear in URLs.  Hosts matching no rule fall
+back to the list's implicit ``*`` rule: the last label is the public suffix.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import logging
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from functools import cache, lru_cache
+from importlib.resources import files
+
+logger = logging.getLogger(__name__)
+
+# Distinct hosts whose registrable domain is memoised; history revisits the same hosts a lot.
+REGISTRABLE_DOMAIN_CACHE = 65_536
+
+# The Public Suffix List (https://publicsuffix.org/list/), ICANN and private sections,
+# shipped with the package; ``make update-psl`` refreshes it.
+PSL_FILE = "public_suffix_list.dat"
+
+
+@dataclass
+class _Node:
+    children: dict[str, _Node] = field(default_factory=dict)
+    rule: bool = False
+    exception: bool = False
+
+
+def parse_rules(text: str) -> Iterator[str]:
+    """Yield the rules of a list in the PSL format: one per line, ``//`` comments."""
+    for line in text.splitlines():
+        rule = line.split(maxsplit=1)[0].lower() if line.strip() else ""
+        if rule and not rule.startswith("//"):
+            yield rule
+
+
+def _punycode(rule: str) -> str | None:
+    """Return *rule* with its labels IDNA-encoded, or None if it is ASCII or cannot be."""
+    if rule.isascii():
+        return None
+    try:
+        return ".".join(
+            label if label in ("*", "!") else label.encode("idna").decode("ascii")
+            for label in rule.split(".")
+        )
+    except UnicodeError:
+        return None
+
+
+def _add(root: _Node, rule: str) -> None:
+    node = root
+    for label in reversed(rule.lstrip("!").split(".")):
+        node = node.children.setdefault(label, _Node())
+    if rule.startswith("!"):
+        node.exception = True
+    else:
+        node.rule = True
+
+
+def compile_rules(rules: Iterable[str]) -> _Node:
+    root = _Node()
+    for rule in rules:
+        _add(root, rule)
+        encoded = _punycode(rule.lstrip("!"))
+        if encoded is not None:
+            _add(root, "!" + encoded if rule.startswith("!") else encoded)
+    return root
+
+
+@cache
+def _trie() -> _Node:
+    text = files(__package__).joinpath(PSL_FILE).read_text(encoding="utf-8")
+    root = compile_rules(parse_rules(text))
+    logger.debug("Loaded %d top-level public suffixes from %s", len(root.children), PSL_FILE)
+    return root
+
+
+def _walk(labels: list[str]) -> Iterator[tuple[int, _Node]]:
+    """Yield the trie nodes matched by *labels*, right to left, with their depth."""
+    node = _trie()
+    for depth, label in enumerate(reversed(labels), start=1):
+        child = node.children.get(label) or node.children.get("*")
+        if child is None:
+            return
+        yield depth, child
+        node = child
+
+
+def suffix_labels(labels: list[str]) -> int:
+    """Return how many trailing *labels* form the public suffix (at least one)."""
+    length = 1
+    for depth, node in _walk(labels):
+        if node.exception:
+            return depth - 1
+        if node.rule:
+            length = depth
+    return length
+
+
+def _is_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return True
+
+
+@lru_cache(maxsize=REGISTRABLE_DOMAIN_CACHE)
+def registrable_domain(host: str) -> str:
+    """Return *host*'s registrable domain: its public suffix plus one label.
+
+    ``mail.google.com`` and ``docs.google.com`` both give ``google.com``, and
+    ``news.bbc.co.uk`` gives ``bbc.co.uk``.  IP addresses, single-label hosts and bare
+    public suffixes are returned unchanged.
+    """
+    host = host.lower().rstrip(".")
+    if "." not in host or _is_ip(host):
+        return host
+    labels = host.split(".")
+    keep = suffix_labels(labels) + 1
+    return ".".join(labels[-keep:]) if len(labels) >= keep else host
@@ -5,10 +5,12 @@ from __future__ import annotations
 import logging
 from pathlib import Path
 from typing import TypedDict
-from urllib.parse import urlparse, urlencode, parse_qs
+from urllib.parse import ParseResult, urlparse, urlencode, parse_qs
 
 import yaml
 
+from .psl import registrable_domain
+
 logger = logging.getLogger(__name__)
 
 Whitelist = dict[str, list[str]]
@@ -33,6 +35,10 @@ class ProcessedURL(TypedDict):
     url: str
     domain: str
     stripped_qp: str
+    scheme: str
+    path: str
+    registrable_domain: str
+    path_depth: int
 
 
 def _read_yaml(path: Path | None) -> Whitelist:
@@ -85,6 +91,46 @@ def _match_domain(hostname: str, whitelist: Whitelist) -> list[str] | None:
     return None
 
 
+def changed_domains(domains: list[str], old: Whitelist, new: Whitelist) -> list[str]:
+    """Return the *domains* whose allowed keys differ between the *old* and *new* whitelists."""
+    return [d for d in domains if _match_domain(d, old) != _match_domain(d, new)]
+
+
+class WhitelistWatcher:
+    """Reload a whitelist YAML file when its modification time changes."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._mtime = self._stat()
+
+    def _stat(self) -> int | None:
+        try:
+            return self.path.stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def poll(self) -> Whitelist | None:
+        """Return the reloaded whitelist if the file changed since the last poll, else ``None``.
+
+        A file that cannot be read or parsed is logged and skipped, keeping the current
+        whitelist until the next change.
+        """
+        mtime = self._stat()
+        if mtime == self._mtime or mtime is None:
+            return None
+        self._mtime = mtime
+        try:
+            return load_whitelist(self.path)
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning("Ignoring unreadable whitelist %s: %s", self.path, e)
+            return None
+
+
+def make_whitelist_watcher(path: Path | None) -> WhitelistWatcher | None:
+    """Return a watcher for the whitelist at *path*, or ``None`` when using the default."""
+    return WhitelistWatcher(path) if path is not None else None
+
+
 def _partition_params(
     query_params: dict[str, list[str]], allowed_keys: list[str]
 ) -> tuple[dict[str, list[str]], list[str]]:
@@ -99,38 +145,41 @@ def _partition_params(
     return kept, stripped
 
 
-def _replace_query(raw_url: str, query: str) -> str:
-    """Return *raw_url* with its query string replaced by *query*."""
-    return urlparse(raw_url)._replace(query=query).geturl()
-
-
-def _apply_allowed_keys(
-    raw_url: str, domain: str, query_params: dict[str, list[str]], allowed_keys: list[str]
-) -> ProcessedURL:
-    """Keep only *allowed_keys* from *query_params*."""
+def _strip_query(
+    parsed: ParseResult, query_params: dict[str, list[str]], allowed_keys: list[str]
+) -> tuple[str, str]:
+    """Keep only *allowed_keys* from *query_params*; return the URL and stripped names."""
     kept, stripped = _partition_params(query_params, allowed_keys)
     new_query = urlencode([(k, v) for k in kept for v in kept[k]]) if kept else ""
-    return ProcessedURL(
-        url=_replace_query(raw_url, new_query),
-        domain=domain,
-        stripped_qp=",".join(sorted(stripped)),
-    )
+    return parsed._replace(query=new_query).geturl(), ",".join(sorted(stripped))
+
+
+def _path_depth(path: str) -> int:
+    return len([segment for segment in path.split("/") if segment])
 
 
 def process_url(raw_url: str, whitelist: Whitelist) -> ProcessedURL:
     """Apply the whitelist to a single URL.
 
-    Returns a :class:`ProcessedURL` with the cleaned URL, the domain,
-    and a comma-separated list of stripped parameter *names*.
+    Returns a :class:`ProcessedURL` with the cleaned URL, the domain, a
+    comma-separated list of stripped parameter *names*, and the URL's scheme,
+    path, registrable domain and path depth (number of non-empty path segments).
     """
-    domain = urlparse(raw_url).hostname or ""
-    query_params = parse_qs(urlparse(raw_url).query, keep_blank_values=True)
-
-    if not query_params:
-        return ProcessedURL(url=raw_url, domain=domain, stripped_qp="")
+    parsed = urlparse(raw_url)
+    domain = parsed.hostname or ""
+    query_params = parse_qs(parsed.query, keep_blank_values=True)
 
-    allowed_keys = _match_domain(domain, whitelist)
-    if allowed_keys is None:
-        allowed_keys = []
+    url, stripped_qp = raw_url, ""
+    if query_params:
+        allowed_keys = _match_domain(domain, whitelist) or []
+        url, stripped_qp = _strip_query(parsed, query_params, allowed_keys)
 
-    return _apply_allowed_keys(raw_url, domain, query_params, allowed_keys)
+    return ProcessedURL(
+        url=url,
+        domain=domain,
+        stripped_qp=stripped_qp,
+        scheme=parsed.scheme,
+        path=parsed.path,
+        registrable_domain=registrable_domain(domain),
+        path_depth=_path_depth(parsed.path),
+    )
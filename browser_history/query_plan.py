@@ -0,0 +1,196 @@
+"""Pre-flight checks for model-written SQL: EXPLAIN QUERY PLAN cost guard and LIKE rewrites."""
+
+from __future__ import annotations
+
+import logging
+import re
+import time
+from dataclasses import dataclass
+from sqlite3 import Connection
+from typing import Any
+
+from .compression import history_table
+
+logger = logging.getLogger(__name__)
+
+# Heuristic cost of each kind of query plan step, as a divisor of the table size (first
+# match wins; ``None`` means the step costs nothing or is counted elsewhere).  A SEARCH
+# through an index is assumed to touch ~1% of the table, a covering-index SCAN a quarter of
+# the bytes of a table SCAN, and a temp b-tree (ORDER BY / GROUP BY / DISTINCT) a sort over
+# a tenth of it.
+_STEP_DIVISORS: tuple[tuple[re.Pattern[str], int | None], ...] = (
+    (re.compile(r"CONSTANT ROW|\(subquery"), None),
+    (re.compile(r"^SCAN .*COVERING INDEX"), 4),
+    (re.compile(r"^SCAN "), 1),
+    (re.compile(r"^SEARCH "), 100),
+    (re.compile(r"^USE TEMP B-TREE"), 10),
+)
+
+_LIKE_PREFIX_RE = re.compile(
+    r"(?P<col>\b[A-Za-z_][\w.]*)\s+LIKE\s+'(?P<prefix>[^'%_\\]+)%'(?!\s*ESCAPE)",
+    re.IGNORECASE,
+)
+
+
+class QueryRejectedError(ValueError):
+    """Raised when a query's estimated cost exceeds the configured guard threshold."""
+
+
+@dataclass
+class QueryGuard:
+    """Options for the pre-flight step run before each model-written query."""
+
+    max_cost: int | None = None
+    rewrite_like: bool = False
+
+
+def make_query_guard(max_cost: int | None, rewrite_like: bool) -> QueryGuard | None:
+    """Return a :class:`QueryGuard`, or ``None`` when no pre-flight option is enabled."""
+    if max_cost is None and not rewrite_like:
+        return None
+    return QueryGuard(max_cost=max_cost, rewrite_like=rewrite_like)
+
+
+@dataclass
+class CheckedQuery:
+    """A query that passed the guard, possibly rewritten, with its plan and estimated cost."""
+
+    sql: str
+    plan: list[str]
+    cost: int
+
+
+def explain_query_plan(conn: Connection, sql: str, params: dict[str, object] | None) -> list[str]:
+    """Return the ``detail`` column of ``EXPLAIN QUERY PLAN`` for *sql*."""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params or {}).fetchall()
+    return [row[3] for row in rows]
+
+
+def _table_rows(conn: Connection) -> int:
+    """Cheap upper bound on the number of rows in ``browser_history``."""
+    row = conn.execute(f"SELECT MAX(rowid) FROM {history_table(conn)}").fetchone()
+    return int(row[0] or 0)
+
+
+def _step_divisor(detail: str) -> int | None:
+    """Return the table-size divisor for a plan step, or ``None`` if it costs nothing."""
+    for pattern, divisor in _STEP_DIVISORS:
+        if pattern.search(detail):
+            return divisor
+    return None
+
+
+def _step_cost(detail: str, table_rows: int) -> int:
+    """Estimate the rows visited by one plan step."""
+    divisor = _step_divisor(detail)
+    return 0 if divisor is None else max(1, table_rows // divisor)
+
+
+def estimate_cost(plan: list[str], table_rows: int) -> int:
+    """Estimate how many rows a query with *plan* visits."""
+    return sum(_step_cost(detail, table_rows) for detail in plan)
+
+
+def indexed_columns(conn: Connection) -> set[str]:
+    """Return the leading column of every index on ``browser_history``."""
+    columns: set[str] = set()
+    for index in conn.execute(f"PRAGMA index_list({history_table(conn)})").fetchall():
+        info = conn.execute(f"PRAGMA index_info({index[1]})").fetchall()
+        if info:
+            columns.add(info[0][2])
+    return columns
+
+
+def _has_text_affinity(declared: str) -> bool:
+    """Return whether a column declared as *declared* has TEXT affinity (SQLite's rules)."""
+    declared = declared.upper()
+    return "INT" not in declared and any(kind in declared for kind in ("CHAR", "CLOB", "TEXT"))
+
+
+def text_columns(conn: Connection) -> set[str]:
+    """Return the columns of ``browser_history`` that compare as text."""
+    info = conn.execute(f"PRAGMA table_info({history_table(conn)})").fetchall()
+    return {row[1] for row in info if _has_text_affinity(row[2])}
+
+
+def _prefix_range(prefix: str) -> tuple[str, str] | None:
+    """Return a ``[low, high)`` range containing every case variant of *prefix*.
+
+    SQLite's LIKE is case-insensitive for ASCII, so the range runs from the upper-cased
+    prefix (upper case sorts first) to just past the lower-cased one.
+    """
+    lowered = prefix.lower()
+    if not prefix.isascii() or lowered[-1] == "\x7f":
+        return None
+    return prefix.upper(), lowered[:-1] + chr(ord(lowered[-1]) + 1)
+
+
+def rewrite_like_prefixes(sql: str, columns: set[str]) -> str:
+    """Add an index-friendly range next to each ``col LIKE 'prefix%'`` on one of *columns*.
+
+    The original LIKE is kept as a residual filter.  *columns* must only hold TEXT affinity
+    columns: on others (``visited_dt`` is NUMERIC) the bounds would compare as numbers.
+    """
+
+    def _replace(match: re.Match[str]) -> str:
+        col, prefix = match.group("col"), match.group("prefix")
+        bounds = _prefix_range(prefix)
+        if col.split(".")[-1].lower() not in columns or bounds is None:
+            return match.group(0)
+        low, high = (bound.replace("'", "''") for bound in bounds)
+        return f"({col} >= '{low}' AND {col} < '{high}' AND {match.group(0)})"
+
+    return _LIKE_PREFIX_RE.sub(_replace, sql)
+
+
+def _rejection_message(plan: list[str], cost: int, max_cost: int, columns: set[str]) -> str:
+    """Explain to the model why its query was rejected and how to rewrite it."""
+    parts = [
+        f"Query rejected: it would visit an estimated {cost} rows (limit {max_cost}).",
+        f"Plan: {'; '.join(plan)}.",
+    ]
+    scans = [detail for detail in plan if detail.startswith("SCAN")]
+    if scans:
+        parts.append(f"It scans the whole table ({'; '.join(scans)}).")
+    parts.append(
+        f"Rewrite it to filter on an indexed column ({', '.join(sorted(columns))}), "
+        "for example `WHERE visited_dt >= '2025-01-01'`, prefer `LIKE 'prefix%'` over "
+        "`LIKE '%infix%'`, and avoid ORDER BY / GROUP BY on unindexed expressions."
+    )
+    return " ".join(parts)
+
+
+def check_query(
+    conn: Connection, sql: str, params: dict[str, object] | None, guard: QueryGuard
+) -> CheckedQuery:
+    """Run the pre-flight step for *sql*: optionally rewrite it, then cost its plan.
+
+    Raises :class:`QueryRejectedError` when the estimated cost exceeds ``guard.max_cost``.
+    """
+    started = time.perf_counter()
+    columns = indexed_columns(conn)
+    if guard.rewrite_like:
+        sql = rewrite_like_prefixes(sql, columns & text_columns(conn))
+    plan = explain_query_plan(conn, sql, params)
+    cost = estimate_cost(plan, _table_rows(conn))
+    logger.info(
+        "Query plan (cost=%d, %.1fms): %s -- %s",
+        cost,
+        (time.perf_counter() - started) * 1000,
+        " | ".join(plan),
+        sql,
+    )
+    if guard.max_cost is not None and cost > guard.max_cost:
+        raise QueryRejectedError(_rejection_message(plan, cost, guard.max_cost, columns))
+    return CheckedQuery(sql=sql, plan=plan, cost=cost)
+
+
+def log_query_timing(checked: CheckedQuery, elapsed: float, rows: list[Any]) -> None:
+    """Log how long a guarded query took, alongside its plan, to spot missing indexes."""
+    logger.info(
+        "Query ran in %.1fms returning %d rows (cost=%d): %s",
+        elapsed * 1000,
+        len(rows),
+        checked.cost,
+        " | ".join(checked.plan),
+    )
@@ -0,0 +1,248 @@
+"""Registry of built unified databases, one per source configuration, with LRU eviction."""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from sqlite3 import Connection
+
+logger = logging.getLogger(__name__)
+
+# Unified databases kept open at once, referenced or not.
+MAX_UNIFIED_DBS = 4
+# Combined size of the in-memory unified databases kept open (persisted ones do not count).
+MAX_UNIFIED_DB_BYTES = 1 << 30
+
+
+@dataclass
+class _Entry:
+    conn: Connection
+    size_bytes: int
+    # Queries currently pinned to this connection.
+    readers: int = 0
+    # Replaced by a newer build; closed as soon as its readers drain.
+    retired: bool = False
+    # Called after the connection is closed.
+    on_close: Callable[[], object] | None = None
+    # Held by the query pinning the connection; see UnifiedDBRegistry.pin.
+    query_lock: threading.RLock = field(default_factory=threading.RLock)
+
+
+def memory_bytes(conn: Connection) -> int:
+    """Return the size of the database behind *conn* (page count times page size)."""
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    return int(pages) * int(conn.execute("PRAGMA page_size").fetchone()[0])
+
+
+class UnifiedDBRegistry:
+    """Open unified databases keyed by configuration, least recently used first.
+
+    Users hold references with :meth:`acquire` / :meth:`release`.  When the registry exceeds
+    *max_entries* or *max_bytes*, unreferenced databases are closed oldest first; databases
+    still referenced are never closed behind their users' backs.  :meth:`swap` replaces a
+    database with a newer build while queries :meth:`pin`-ned to the old one finish on it.
+    """
+
+    def __init__(self, max_entries: int = MAX_UNIFIED_DBS, max_bytes: int = MAX_UNIFIED_DB_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._refs: dict[str, int] = {}
+        # Replaced databases still pinned by running queries.
+        self._retired: list[_Entry] = []
+        # Lookups served from an open database, and lookups that had to build one.
+        self.hits = 0
+        self.misses = 0
+        # Guards the maps above; never held while a database is built.
+        self._lock = threading.RLock()
+        # Per-key locks serialising builds of the same database.
+        self._builds: dict[str, threading.RLock] = {}
+
+    def get(
+        self,
+        key: str,
+        build: Callable[[], Connection],
+        in_memory: bool = True,
+        on_close: Callable[[], object] | None = None,
+    ) -> Connection:
+        """Return the database for *key*, calling *build* to create it on first use.
+
+        Builds run outside the registry lock, so other keys stay usable meanwhile; callers
+        asking for the same key wait for the one build.  *on_close* is called once a
+        database built here is eventually closed.
+        """
+        conn = self._lookup(key)
+        if conn is not None:
+            return conn
+        with self._build_lock(key):
+            # Another caller may have built it while this one waited.
+            conn = self._lookup(key)
+            if conn is not None:
+                return conn
+            with self._lock:
+                self.misses += 1
+            return self._register(key, build(), in_memory, on_close)
+
+    def _lookup(self, key: str) -> Connection | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            self._evict(keep=key)
+            return entry.conn
+
+    def _build_lock(self, key: str) -> threading.RLock:
+        with self._lock:
+            return self._builds.setdefault(key, threading.RLock())
+
+    def _register(
+        self,
+        key: str,
+        conn: Connection,
+        in_memory: bool,
+        on_close: Callable[[], object] | None,
+    ) -> Connection:
+        size = memory_bytes(conn) if in_memory else 0
+        with self._lock:
+            if key in self._entries:
+                # A swap registered a newer build meanwhile; keep it.
+                self._close_entry(_Entry(conn, size, on_close=on_close))
+                return self._entries[key].conn
+            entry = _Entry(conn, size, on_close=on_close)
+            self._entries[key] = entry
+            logger.info("Registered unified database %s (%d bytes)", key, entry.size_bytes)
+            self._evict(keep=key)
+            return entry.conn
+
+    @contextmanager
+    def pin(self, key: str) -> Iterator[Connection]:
+        """Yield the registered database for *key*, kept open until the block ends.
+
+        A :meth:`swap` during the block sends new queries to the new database; this one is
+        closed once every block pinning it has finished.  Blocks pinning the same database
+        run one at a time: a sqlite3 callback (authorizer, SQL function) taking the GIL
+        while another thread holding it waits on the connection's mutex would deadlock.
+        """
+        with self._lock:
+            entry = self._entries[key]
+            entry.readers += 1
+        try:
+            with entry.query_lock:
+                yield entry.conn
+        finally:
+            with self._lock:
+                entry.readers -= 1
+                if entry.retired and not entry.readers:
+                    self._retired.remove(entry)
+                    self._close_entry(entry)
+
+    def query_lock(self, conn: Connection) -> threading.RLock | None:
+        """Return the lock :meth:`pin` holds around queries on *conn*, if it is registered.
+
+        Work on a pinned connection from another thread must hold it too.
+        """
+        with self._lock:
+            for entry in [*self._entries.values(), *self._retired]:
+                if entry.conn is conn:
+                    return entry.query_lock
+        return None
+
+    def swap(
+        self,
+        key: str,
+        conn: Connection,
+        in_memory: bool = True,
+        on_close: Callable[[], object] | None = None,
+    ) -> None:
+        """Register *conn* as the database for *key*, retiring the one it replaces.
+
+        *on_close* is called once *conn* is eventually closed.
+        """
+        with self._lock:
+            old = self._entries.pop(key, None)
+            size = memory_bytes(conn) if in_memory else 0
+            self._entries[key] = _Entry(conn, size, on_close=on_close)
+            logger.info("Swapped in a new build of unified database %s", key)
+            if old is not None and old.readers:
+                old.retired = True
+                self._retired.append(old)
+            elif old is not None:
+                self._close_entry(old)
+            self._evict(keep=key)
+
+    def acquire(self, key: str) -> None:
+        with self._lock:
+            self._refs[key] = self._refs.get(key, 0) + 1
+
+    def release(self, key: str) -> None:
+        with self._lock:
+            refs = self._refs.pop(key, 0) - 1
+            if refs > 0:
+                self._refs[key] = refs
+            self._evict()
+
+    def rekey(self, old: str, new: str) -> None:
+        """Register the database under *old* as *new* after its configuration changed.
+
+        References are not moved; holders acquire *new* and release *old* themselves.  If
+        *new* is already registered that database is kept and *old* is left as it was.
+        """
+        with self._lock:
+            if old in self._entries and new not in self._entries:
+                self._entries[new] = self._entries.pop(old)
+
+    def keys(self) -> list[str]:
+        """Return the registered keys, least recently used first."""
+        with self._lock:
+            return list(self._entries)
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            entries = [*self._entries.values(), *self._retired]
+            return sum(entry.size_bytes for entry in entries)
+
+    def close_all(self) -> None:
+        """Close every registered database, whether or not it is still referenced or pinned."""
+        with self._lock:
+            while self._entries:
+                self._close(next(iter(self._entries)))
+            while self._retired:
+                self._close_entry(self._retired.pop())
+
+    def _over_budget(self) -> bool:
+        return len(self._entries) > self.max_entries or self.total_bytes() > self.max_bytes
+
+    def _idle_keys(self, keep: str | None) -> list[str]:
+        """Return the unreferenced keys other than *keep*, least recently used first."""
+        return [key for key in self._entries if not self._refs.get(key) and key != keep]
+
+    def _evict(self, keep: str | None = None) -> None:
+        for key in self._idle_keys(keep):
+            if not self._over_budget():
+                return
+            logger.info("Evicting unified database %s", key)
+            self._close(key)
+        if self._over_budget():
+            logger.warning(
+                "Unified database registry over budget (%d databases, %d bytes) but all in use",
+                len(self._entries),
+                self.total_bytes(),
+            )
+
+    def _close(self, key: str) -> None:
+        self._close_entry(self._entries.pop(key))
+
+    def _close_entry(self, entry: _Entry) -> None:
+        try:
+            entry.conn.close()
+        except Exception:
+            # Best-effort cleanup, ignore errors
+            pass
+        if entry.on_close is not None:
+            entry.on_close()
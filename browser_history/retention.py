@@ -0,0 +1,109 @@
+"""Visit-time retention and down-sampling pushed down into the source SELECTs."""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+# Seconds between the Windows epoch (1601-01-01, Chrome) and the Unix epoch.
+CHROME_EPOCH_OFFSET = 11_644_473_600
+# Seconds between the Unix epoch and the Core Data epoch (2001-01-01, Safari).
+SAFARI_EPOCH_OFFSET = 978_307_200
+DEFAULT_SAMPLE_EVERY = 10
+
+# Per browser: (visit time column, visit id column, Unix seconds -> native visit time).
+_VISIT_COLUMNS: dict[str, tuple[str, str, Callable[[float], float]]] = {
+    "chrome": ("v.visit_time", "v.id", lambda ts: int((ts + CHROME_EPOCH_OFFSET) * 1_000_000)),
+    "firefox": ("h.visit_date", "h.id", lambda ts: int(ts * 1_000_000)),
+    "safari": ("v.visit_time", "v.id", lambda ts: ts - SAFARI_EPOCH_OFFSET),
+}
+
+
+@dataclass(frozen=True)
+class IngestWindow:
+    """Which visits to import, as Unix timestamps (UTC).
+
+    Visits before *since* are skipped.  Visits before *sample_before* are down-sampled to
+    one in *sample_every*, picked by visit id so rebuilds keep the same rows.
+    """
+
+    since: float | None = None
+    sample_before: float | None = None
+    sample_every: int = DEFAULT_SAMPLE_EVERY
+
+    def conditions(
+        self, time_col: str, id_col: str, to_native: Callable[[float], float]
+    ) -> tuple[list[str], list[object]]:
+        """Return SQL conditions on a source's visit columns and their bound parameters."""
+        conds: list[str] = []
+        params: list[object] = []
+        if self.since is not None:
+            conds.append(f"{time_col} >= ?")
+            params.append(to_native(self.since))
+        if self.sample_before is not None and self.sample_every > 1:
+            conds.append(f"({time_col} >= ? OR {id_col} % ? = 0)")
+            params.extend([to_native(self.sample_before), self.sample_every])
+        return conds, params
+
+
+def parse_since(value: str) -> float:
+    """Parse an ISO 8601 date or datetime (UTC unless it has an offset) to Unix seconds."""
+    when = datetime.fromisoformat(value)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+
+def _days_ago(days: int | None, now: float) -> float | None:
+    return now - days * 86_400 if days is not None else None
+
+
+def _latest(*cutoffs: float | None) -> float | None:
+    return max((c for c in cutoffs if c is not None), default=None)
+
+
+def make_ingest_window(
+    since: str | None = None,
+    retention_days: int | None = None,
+    sample_after_days: int | None = None,
+    sample_every: int = DEFAULT_SAMPLE_EVERY,
+    now: float | None = None,
+) -> IngestWindow | None:
+    """Resolve the retention options against *now*; ``None`` when every visit is imported.
+
+    With both *since* and *retention_days* the later cutoff wins.
+    """
+    now = time.time() if now is None else now
+    cutoff = _latest(_days_ago(retention_days, now), parse_since(since) if since else None)
+    sample_before = _days_ago(sample_after_days, now)
+    if cutoff is None and sample_before is None:
+        return None
+    return IngestWindow(since=cutoff, sample_before=sample_before, sample_every=sample_every)
+
+
+def since_cutoff(browser: str, window: IngestWindow | None) -> tuple[str, float] | None:
+    """Return *browser*'s unqualified visit time column and *window*'s cutoff in its units.
+
+    ``None`` when *window* keeps visits of any age.
+    """
+    if window is None or window.since is None:
+        return None
+    time_col, _, to_native = _VISIT_COLUMNS[browser]
+    return time_col.partition(".")[2], to_native(window.since)
+
+
+def window_clause(
+    browser: str, window: IngestWindow | None, *conditions: str
+) -> tuple[str, tuple[object, ...]]:
+    """Return the ``WHERE`` clause restricting *browser*'s visits to *window*, and its params.
+
+    Extra *conditions* are ANDed in front of the window's; their parameters, if any, go
+    before the returned ones.
+    """
+    conds, params = window.conditions(*_VISIT_COLUMNS[browser]) if window else ([], [])
+    conds = [*conditions, *conds]
+    if not conds:
+        return "", ()
+    return "WHERE " + " AND ".join(conds), tuple(params)
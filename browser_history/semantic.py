@@ -0,0 +1,201 @@
+"""Nearest-neighbour search over page titles with an ``llm`` embedding model.
+
+Vectors are cached in the unified database keyed by model and title hash, so each distinct
+title is embedded once.  Scoring is brute force: one matrix-vector product with the optional
+``numpy`` dependency (``pip install 'llm-tools-browser-history[semantic]'``), otherwise a
+pure-Python scan feeding a bounded top-K heap.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import logging
+import math
+import operator
+import struct
+from collections.abc import Iterator, Sequence
+from pathlib import Path
+from sqlite3 import Connection
+from typing import Any
+
+from llm.models import EmbeddingModel
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_TABLE = "_bh_embeddings"
+# Titles sent to the embedding model per call.
+EMBED_BATCH_SIZE = 100
+
+
+def encode_vector(vector: Sequence[float]) -> bytes:
+    """Pack *vector* as little-endian float32, the layout ``llm.encode`` uses."""
+    return struct.pack(f"<{len(vector)}f", *vector)
+
+
+def decode_vector(data: bytes) -> tuple[float, ...]:
+    return struct.unpack(f"<{len(data) // 4}f", data)
+
+
+def title_hash(title: str) -> bytes:
+    return hashlib.blake2b(title.encode("utf-8"), digest_size=16).digest()
+
+
+def _create_table(conn: Connection) -> None:
+    conn.execute(
+        f"""CREATE TABLE IF NOT EXISTS {EMBEDDING_TABLE} (
+                model TEXT, title_hash BLOB, title TEXT, vector BLOB,
+                PRIMARY KEY (model, title_hash)
+            )"""
+    )
+
+
+def _missing_titles(conn: Connection, model_id: str) -> list[str]:
+    known = {
+        row[0]
+        for row in conn.execute(
+            f"SELECT title_hash FROM {EMBEDDING_TABLE} WHERE model = ?", (model_id,)
+        )
+    }
+    titles = conn.execute(
+        "SELECT DISTINCT title FROM browser_history WHERE title IS NOT NULL AND title != ''"
+    )
+    return [title for (title,) in titles if title_hash(title) not in known]
+
+
+def check_local_model(model: EmbeddingModel, allow_remote: bool) -> None:
+    """Refuse a model that sends titles to a remote API unless *allow_remote* is set.
+
+    Models that need an API key are taken to be remote; local plugin models need none.
+    """
+    if not model.needs_key:
+        return
+    if not allow_remote:
+        raise ValueError(
+            f"Embedding model {model.model_id} needs a {model.needs_key} API key, so it would "
+            "send every page title in the browser history to that provider. Use a local "
+            "model, or allow remote embedding models explicitly."
+        )
+    logger.warning(
+        "Sending every page title in the browser history to the remote embedding model %s",
+        model.model_id,
+    )
+
+
+def embed_new_titles(
+    conn: Connection, model: EmbeddingModel, batch_size: int = EMBED_BATCH_SIZE
+) -> int:
+    """Embed the distinct titles with no cached vector for *model*; return how many.
+
+    *conn* must be able to write to the unified database.
+    """
+    _create_table(conn)
+    missing = _missing_titles(conn, model.model_id)
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start : start + batch_size]
+        vectors = model.embed_multi(batch, batch_size)
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {EMBEDDING_TABLE} VALUES (?, ?, ?, ?)",
+            [
+                (model.model_id, title_hash(title), title, encode_vector(vector))
+                for title, vector in zip(batch, vectors)
+            ],
+        )
+        conn.commit()
+    logger.info("Embedded %d new titles with %s", len(missing), model.model_id)
+    return len(missing)
+
+
+def copy_embeddings(conn: Connection, old_db: Path) -> None:
+    """Carry cached vectors of titles still present over from the previous build *old_db*."""
+    conn.execute("ATTACH DATABASE ? AS old_build", (f"file:{old_db}?mode=ro",))
+    try:
+        has_table = conn.execute(
+            "SELECT 1 FROM old_build.sqlite_master WHERE name = ?", (EMBEDDING_TABLE,)
+        ).fetchone()
+        if has_table:
+            _create_table(conn)
+            conn.execute(
+                f"""INSERT OR IGNORE INTO {EMBEDDING_TABLE}
+                    SELECT * FROM old_build.{EMBEDDING_TABLE}
+                    WHERE title IN (SELECT title FROM browser_history)"""
+            )
+            conn.commit()
+    finally:
+        conn.execute("DETACH DATABASE old_build")
+
+
+def copy_embeddings_from(conn: Connection, old: Connection) -> None:
+    """Carry cached vectors of titles still present over from the previous build on *old*.
+
+    Used for in-memory builds, which cannot be attached by file name.
+    """
+    has_table = old.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (EMBEDDING_TABLE,)
+    ).fetchone()
+    if not has_table:
+        return
+    _create_table(conn)
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {EMBEDDING_TABLE} VALUES (?, ?, ?, ?)",
+        old.execute(f"SELECT model, title_hash, title, vector FROM {EMBEDDING_TABLE}"),
+    )
+    conn.execute(
+        f"""DELETE FROM {EMBEDDING_TABLE}
+            WHERE title NOT IN (SELECT title FROM browser_history WHERE title IS NOT NULL)"""
+    )
+    conn.commit()
+
+
+def _numpy() -> Any:
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _normalized(vector: Sequence[float]) -> tuple[float, ...]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return tuple(x / norm for x in vector)
+
+
+class TitleIndex:
+    """Unit-length title vectors of one model, held in memory for top-K cosine search."""
+
+    def __init__(self, titles: list[str], vectors: list[bytes]):
+        self.titles = titles
+        np = _numpy()
+        if np is not None and vectors:
+            matrix = np.frombuffer(b"".join(vectors), dtype="<f4").reshape(len(vectors), -1)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            self._matrix = matrix / np.where(norms == 0, 1, norms)
+        else:
+            self._matrix = None
+            self._vectors = [_normalized(decode_vector(vector)) for vector in vectors]
+
+    @classmethod
+    def load(cls, conn: Connection, model_id: str) -> TitleIndex:
+        rows = conn.execute(
+            f"SELECT title, vector FROM {EMBEDDING_TABLE} WHERE model = ?", (model_id,)
+        ).fetchall()
+        return cls([title for title, _ in rows], [vector for _, vector in rows])
+
+    def nearest(self, query: Sequence[float], k: int = 10) -> list[tuple[str, float]]:
+        """Return the *k* titles most similar to *query*, with their cosine similarity."""
+        unit = _normalized(query)
+        if self._matrix is not None:
+            return self._nearest_numpy(unit, k)
+        best = heapq.nlargest(k, self._scores(unit), key=operator.itemgetter(1))
+        return [(self.titles[i], score) for i, score in best]
+
+    def _nearest_numpy(self, unit: tuple[float, ...], k: int) -> list[tuple[str, float]]:
+        np = _numpy()
+        scores = self._matrix @ np.asarray(unit, dtype="<f4")
+        top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(self.titles[i], float(scores[i])) for i in top]
+
+    def _scores(self, unit: tuple[float, ...]) -> Iterator[tuple[int, float]]:
+        for i, vector in enumerate(self._vectors):
+            yield i, sum(map(operator.mul, unit, vector))
@@ -0,0 +1,252 @@
+"""Approximate top-K and distinct-count summaries of the unified table, built at ingest."""
+
+from __future__ import annotations
+
+import hashlib
+import heapq
+import json
+import logging
+import math
+import zlib
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from sqlite3 import Connection
+from typing import Literal, cast
+
+logger = logging.getLogger(__name__)
+
+SKETCH_TABLE = "_bh_sketches"
+# Items tracked per top-K summary; answers are reliable for k well below this.
+TOPK_CAPACITY = 1_000
+# HyperLogLog precision: 2**10 registers per day, about 3% standard error.
+HLL_PRECISION = 10
+# Rows read per round trip while building the sketches.
+SKETCH_BATCH_SIZE = 5_000
+
+SketchKind = Literal["top_domains", "top_urls", "distinct_urls"]
+SKETCH_KINDS: tuple[SketchKind, ...] = ("top_domains", "top_urls", "distinct_urls")
+TopKind = Literal["top_domains", "top_urls"]
+Period = Literal["day", "month", "year", "all"]
+PERIODS: tuple[Period, ...] = ("day", "month", "year", "all")
+# Length of the visited_dt prefix identifying each period.
+_PERIOD_PREFIX = {"day": 10, "month": 7, "year": 4, "all": 0}
+
+
+@dataclass
+class TopK:
+    """Space-Saving style heavy-hitter summary with batched eviction.
+
+    Once more than twice *capacity* items are tracked, only the *capacity* largest are
+    kept and ``floor`` remembers the largest count dropped.  New items start at ``floor``,
+    so counts may overestimate by at most ``floor`` but never underestimate.
+    """
+
+    capacity: int = TOPK_CAPACITY
+    counts: dict[str, int] = field(default_factory=dict)
+    floor: int = 0
+
+    def add(self, item: str, count: int = 1) -> None:
+        self.counts[item] = self.counts.get(item, self.floor) + count
+        if len(self.counts) > 2 * self.capacity:
+            self._compact()
+
+    def merge(self, other: TopK) -> None:
+        for item in self.counts.keys() - other.counts.keys():
+            self.counts[item] += other.floor
+        for item, count in other.counts.items():
+            self.counts[item] = self.counts.get(item, self.floor) + count
+        self.floor += other.floor
+        self._compact()
+
+    def top(self, k: int) -> list[tuple[str, int]]:
+        return heapq.nlargest(k, self.counts.items(), key=lambda item: (item[1], item[0]))
+
+    def _compact(self) -> None:
+        if len(self.counts) <= self.capacity:
+            return
+        ranked = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        self.floor = max(self.floor, ranked[self.capacity][1])
+        self.counts = dict(ranked[: self.capacity])
+
+    def to_bytes(self) -> bytes:
+        payload = {"capacity": self.capacity, "floor": self.floor, "counts": self.counts}
+        return zlib.compress(json.dumps(payload).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> TopK:
+        return cls(**json.loads(zlib.decompress(data)))
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with ``2**precision`` one-byte registers."""
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: bytes | None = None):
+        self.precision = precision
+        self.registers = bytearray(registers or bytes(1 << precision))
+
+    def add(self, item: str) -> None:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "big")
+        index = value >> (64 - self.precision)
+        rest = value & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: HyperLogLog) -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        raw = (0.7213 / (1 + 1.079 / m)) * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction (linear counting).
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def to_bytes(self) -> bytes:
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> HyperLogLog:
+        registers = zlib.decompress(data)
+        return cls(len(registers).bit_length() - 1, registers)
+
+
+@dataclass
+class _ProfileSketches:
+    domains: TopK = field(default_factory=TopK)
+    urls: TopK = field(default_factory=TopK)
+    days: dict[str, HyperLogLog] = field(default_factory=dict)
+
+
+def _iter_rows(conn: Connection, batch_size: int) -> Iterator[tuple[str, str, str, str, str]]:
+    last_rowid = 0
+    while rows := conn.execute(
+        """SELECT rowid, browser, coalesce(profile, ''), url, coalesce(domain, ''),
+                  substr(visited_dt, 1, 10)
+           FROM browser_history WHERE rowid > ? ORDER BY rowid LIMIT ?""",
+        (last_rowid, batch_size),
+    ).fetchall():
+        for row in rows:
+            yield row[1:]
+        last_rowid = rows[-1][0]
+
+
+def _sketch_rows(
+    sketches: dict[tuple[str, str], _ProfileSketches],
+) -> Iterable[tuple[str, str, str, str, bytes]]:
+    for (browser, profile), sketch in sketches.items():
+        yield "top_domains", browser, profile, "", sketch.domains.to_bytes()
+        yield "top_urls", browser, profile, "", sketch.urls.to_bytes()
+        for day, hll in sketch.days.items():
+            yield "distinct_urls", browser, profile, day, hll.to_bytes()
+
+
+def build_sketches(conn: Connection, batch_size: int = SKETCH_BATCH_SIZE) -> int:
+    """Summarise the unified table into ``_bh_sketches``; return the number of sketches.
+
+    Top domains and URLs are kept per browser and profile; distinct URLs per browser,
+    profile and day.  One pass over the table, with memory bounded by the sketch sizes.
+    """
+    sketches: dict[tuple[str, str], _ProfileSketches] = {}
+    for browser, profile, url, domain, day in _iter_rows(conn, batch_size):
+        sketch = sketches.setdefault((browser, profile), _ProfileSketches())
+        sketch.domains.add(domain)
+        sketch.urls.add(url)
+        sketch.days.setdefault(day, HyperLogLog()).add(url)
+    conn.executescript(
+        f"""DROP TABLE IF EXISTS {SKETCH_TABLE};
+            CREATE TABLE {SKETCH_TABLE} (
+                kind TEXT, browser TEXT, profile TEXT, bucket TEXT, data BLOB,
+                PRIMARY KEY (kind, browser, profile, bucket)
+            )"""
+    )
+    rows = list(_sketch_rows(sketches))
+    conn.executemany(f"INSERT INTO {SKETCH_TABLE} VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    logger.info("Built %d sketches for %d profiles", len(rows), len(sketches))
+    return len(rows)
+
+
+def _load(
+    conn: Connection,
+    kind: SketchKind,
+    browser: str | None,
+    profile: str | None,
+    since: str | None,
+    until: str | None,
+) -> list[tuple[str, bytes]]:
+    if not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SKETCH_TABLE,)
+    ).fetchone():
+        raise ValueError(
+            "Approximate statistics are not enabled (start with --sketches); use search instead."
+        )
+    return conn.execute(
+        f"""SELECT bucket, data FROM {SKETCH_TABLE}
+            WHERE kind = :kind AND browser = coalesce(:browser, browser)
+              AND profile = coalesce(:profile, profile)
+              AND (bucket = '' OR bucket >= coalesce(:since, bucket))
+              AND (bucket = '' OR bucket < coalesce(:until, bucket || 'z'))""",
+        {"kind": kind, "browser": browser, "profile": profile, "since": since, "until": until},
+    ).fetchall()
+
+
+def approx_top(
+    conn: Connection,
+    kind: TopKind,
+    k: int = 10,
+    browser: str | None = None,
+    profile: str | None = None,
+) -> list[tuple[str, int]]:
+    """Return the approximate *k* most visited domains or URLs, most visited first."""
+    merged = TopK()
+    for _, data in _load(conn, kind, browser, profile, None, None):
+        merged.merge(TopK.from_bytes(data))
+    return merged.top(k)
+
+
+def approx_distinct(
+    conn: Connection,
+    period: Period = "month",
+    browser: str | None = None,
+    profile: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+) -> list[tuple[str, int]]:
+    """Return the approximate number of distinct URLs visited per *period*.
+
+    *since* (inclusive) and *until* (exclusive) are ``YYYY-MM-DD`` dates.
+    """
+    per_period: dict[str, HyperLogLog] = {}
+    for day, data in _load(conn, "distinct_urls", browser, profile, since, until):
+        label = day[: _PERIOD_PREFIX[period]] or "all"
+        hll = HyperLogLog.from_bytes(data)
+        if label in per_period:
+            per_period[label].merge(hll)
+        else:
+            per_period[label] = hll
+    return [(label, per_period[label].estimate()) for label in sorted(per_period)]
+
+
+def approx_stats(
+    conn: Connection,
+    kind: str,
+    k: int = 10,
+    period: str = "month",
+    browser: str | None = None,
+    profile: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+) -> list[tuple[str, int]]:
+    """Answer a *kind* question from the sketches; see :func:`approx_top` and
+    :func:`approx_distinct`."""
+    if kind == "distinct_urls":
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+        return approx_distinct(conn, period, browser, profile, since, until)
+    if kind in ("top_domains", "top_urls"):
+        return approx_top(conn, cast(TopKind, kind), k, browser, profile)
+    raise ValueError(f"kind must be one of {', '.join(SKETCH_KINDS)}")
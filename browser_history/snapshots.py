@@ -0,0 +1,100 @@
+"""Versioned generations of a persisted unified database.
+
+Each build is published as ``<stem>-<generation><suffix>`` beside the configured database
+path, which is then atomically re-pointed (as a hard link) at the new generation.  Readers
+open a generation file, so they keep the build they started on; superseded generations are
+deleted once the queries pinned to them have drained.
+
+Every connection, writers included, opens a generation file and never the configured path:
+SQLite names its rollback journal after the path it was given, so a connection on the other
+name of a hard-linked file would miss a hot journal left by a crash.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+from pathlib import Path
+from sqlite3 import Connection
+
+logger = logging.getLogger(__name__)
+
+
+def generation_path(db_path: Path, generation: int) -> Path:
+    return db_path.with_name(f"{db_path.stem}-{generation}{db_path.suffix}")
+
+
+def generations(db_path: Path) -> list[int]:
+    """Return the generations published for *db_path*, oldest first."""
+    pattern = re.compile(rf"{re.escape(db_path.stem)}-(\d+){re.escape(db_path.suffix)}")
+    found = (pattern.fullmatch(path.name) for path in db_path.parent.iterdir())
+    return sorted(int(match.group(1)) for match in found if match)
+
+
+def publish_generation(built: Path, db_path: Path) -> Path:
+    """Publish the finished database file *built* as the next generation of *db_path*.
+
+    The generation number is claimed with an exclusive hard link, so concurrent builders
+    never overwrite each other; *db_path* is then replaced by a link to it.  *built* is
+    left in place for the caller to remove.
+    """
+    generation = max(generations(db_path), default=0) + 1
+    while True:
+        target = generation_path(db_path, generation)
+        try:
+            os.link(built, target)
+        except FileExistsError:
+            generation += 1
+            continue
+        link = db_path.with_name(f".{db_path.name}.{os.getpid()}.link")
+        link.unlink(missing_ok=True)
+        os.link(target, link)
+        link.replace(db_path)
+        logger.info("Published %s as generation %d of %s", built, generation, db_path)
+        return target
+
+
+def current_generation(db_path: Path) -> Path:
+    """Return the generation file *db_path* points at (*db_path* itself for legacy files)."""
+    inode = db_path.stat().st_ino
+    for generation in reversed(generations(db_path)):
+        path = generation_path(db_path, generation)
+        if path.stat().st_ino == inode:
+            return path
+    return db_path
+
+
+def database_file(conn: Connection) -> Path | None:
+    """Return the file *conn*'s main database was opened from; ``None`` when in memory."""
+    for _, name, file in conn.execute("PRAGMA database_list").fetchall():
+        if name == "main":
+            return Path(file) if file else None
+    return None
+
+
+def _superseded(db_path: Path) -> list[Path]:
+    current = current_generation(db_path) if db_path.exists() else None
+    paths = (generation_path(db_path, generation) for generation in generations(db_path))
+    return [path for path in paths if path != current]
+
+
+def _remove(path: Path) -> bool:
+    try:
+        path.unlink()
+    except OSError as e:
+        logger.debug("Keeping %s for now: %s", path, e)
+        return False
+    return True
+
+
+def collect_generations(db_path: Path) -> list[Path]:
+    """Delete the generation files of *db_path* other than the current one; return them.
+
+    On POSIX systems a reader in another process keeps its open file until it closes it.
+    Where open files cannot be deleted (Windows) the file is kept for a later collection.
+    """
+    removed = [path for path in _superseded(db_path) if _remove(path)]
+    if removed:
+        logger.info("Removed %d superseded generations of %s", len(removed), db_path)
+    return removed
@@ -1,16 +1,52 @@
+import sqlite3
 from sqlite3 import Cursor, Connection, connect
 import logging
 from collections.abc import Generator
-from contextlib import contextmanager
+from contextlib import AbstractContextManager, ExitStack, contextmanager
 from pathlib import Path
 import pathlib
 import tempfile
 import shutil
 import hashlib
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from functools import partial
 from typing import Any
-from collections.abc import Callable, Iterable
+from collections.abc import Iterable, Iterator
 from .browser_types import BrowserType
-from .qp_whitelist import Whitelist, process_url
+from .changes import carry_over_feed, carry_over_feed_from, start_feed
+from .compression import TextCodecName, history_table, pack_unified_db, register_text_codec
+from .dedup import dedup_visits
+from .ingest import (
+    IngestCancelled,
+    IngestControl,
+    IngestCounters,
+    SourceVisit,
+    clean_urls,
+    read_source,
+    visit_id_span,
+)
+from .profiling import QueryProfile, profile_query
+from .semantic import copy_embeddings, copy_embeddings_from
+from .snapshots import (
+    collect_generations,
+    current_generation,
+    database_file,
+    publish_generation,
+)
+from .sketches import build_sketches
+from .retention import (
+    DEFAULT_SAMPLE_EVERY,
+    IngestWindow,
+    make_ingest_window,
+)
+from .qp_whitelist import Whitelist, changed_domains
+from .registry import UnifiedDBRegistry
 
 logger = logging.getLogger(__name__)
 
@@ -41,7 +77,94 @@ def copy_locked_db(path: pathlib.Path) -> pathlib.Path:
     return dst
 
 
-_UNIFIED_DB_CONN: Connection | None = None
+UNIFIED_DB_REGISTRY = UnifiedDBRegistry()
+
+# The unified table denormalises every visit (one url/title string per row) and indexes it
+# three ways, so it is typically a few times larger than the source databases on disk.
+MEMORY_EXPANSION_FACTOR = 3
+# Compiled statements kept per connection.  Parameterised search templates that differ only
+# in their bound values reuse one entry instead of being re-parsed (the sqlite3 default is 128).
+CACHED_STATEMENTS = 512
+# Rows fetched per round trip when streaming query results.
+FETCH_BATCH_SIZE = 1_000
+# Private table keeping each row's URLs as ingested, before the whitelist was applied.
+RAW_URL_TABLE = "_bh_raw"
+# Domains re-cleaned per query after a whitelist change (two bound parameters each).
+RECLEAN_DOMAIN_BATCH = 400
+# Read size used when pre-warming a persisted unified database into the OS page cache.
+PREWARM_CHUNK_SIZE = 1 << 20
+# Read-only connections a parallel search batch runs its queries on.
+SEARCH_MANY_WORKERS = 4
+# Share of BuildStats.progress taken by ingesting the sources; post-processing gets the rest.
+INGEST_PROGRESS_SHARE = 0.9
+# Bumped when the unified table's columns or their derivation change, so persisted builds are
+# not reused.
+UNIFIED_SCHEMA_VERSION = 5
+
+
+@dataclass
+class BuildStats:
+    """Counters describing a single unified database build."""
+
+    sources: int = 0
+    rows: int = 0
+    projected_bytes: int = 0
+    max_memory: int | None = None
+    spilled: bool = False
+    seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    duplicates_removed: int = 0
+    dedup_bytes_freed: int = 0
+    # Fraction of the build done so far, updated while it runs (readable from other threads).
+    progress: float = 0.0
+    # Rows and time through each ingest stage.
+    ingest: IngestCounters = field(default_factory=IngestCounters)
+
+
+@dataclass(frozen=True)
+class BuildOptions:
+    """Optional build stages; they change the data, so they are part of the registry key."""
+
+    # Drop visits synced into several profiles, grouped into windows of this many hours.
+    dedup_window_hours: int | None = None
+    # Only import visits from this ISO date/datetime (UTC) or the last N days onwards.
+    since: str | None = None
+    retention_days: int | None = None
+    # Keep one in sample_every visits older than sample_after_days.
+    sample_after_days: int | None = None
+    sample_every: int = DEFAULT_SAMPLE_EVERY
+    # Summarise visits into approximate top-K and distinct-count sketches.
+    sketches: bool = False
+    # Store URLs and titles compressed with a dictionary trained by this codec.
+    text_compression: TextCodecName | None = None
+
+    def ingest_window(self) -> IngestWindow | None:
+        """Resolve the retention options against the current time."""
+        return make_ingest_window(
+            self.since, self.retention_days, self.sample_after_days, self.sample_every
+        )
+
+
+def peak_rss_bytes() -> int:
+    """Return the peak resident set size of this process in bytes (0 when unavailable)."""
+    try:
+        import resource
+    except ImportError:  # pragma: no cover - Windows has no resource module
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports KiB.
+    return int(peak) if sys.platform == "darwin" else int(peak) * 1024
+
+
+def projected_unified_db_bytes(sources: Iterable[tuple[BrowserType, Path]]) -> int:
+    """Estimate how large the unified database will be for *sources*."""
+    total = 0
+    for _, path in sources:
+        try:
+            total += path.stat().st_size
+        except OSError:
+            continue
+    return total * MEMORY_EXPANSION_FACTOR
 
 
 def sha_label(browser: str, path: Path) -> str:
@@ -49,92 +172,48 @@ def sha_label(browser: str, path: Path) -> str:
     return f"{browser}:{h}"
 
 
-def _execute_sql(sql: str, cur: Cursor, params: tuple[str, ...] = ()) -> None:
-    cur.execute(sql, params)
-
-
-def insert_chrome_history(cur: Cursor, alias: str, profile_label: str) -> None:
-    """Insert Chrome browser history into the unified database."""
-    _execute_sql(
-        (
-            """
-        INSERT INTO browser_history (browser, profile, url, title, referrer_url, visited_dt)
-        SELECT
-          'chrome' AS browser,
-          ?         AS profile,
-          u.url,
-          u.title,
-          r.url AS referrer_url,
-          strftime('%Y-%m-%d %H:00:00', (v.visit_time/1000 - 11644473600*1000)/1000, 'unixepoch') AS visited_dt
-        FROM {alias}.urls u
-        JOIN {alias}.visits v       ON v.url = u.id
-        LEFT JOIN {alias}.visits pv ON pv.id = v.from_visit
-        LEFT JOIN {alias}.urls  r   ON r.id = pv.url;
-        """
-        ).replace("{alias}", alias),
-        cur,
-        (profile_label,),
+def _connect(database: str) -> Connection:
+    """Open a unified database connection that background threads may share."""
+    return connect(
+        database,
+        uri=database.startswith("file:"),
+        check_same_thread=False,
+        cached_statements=CACHED_STATEMENTS,
     )
 
 
-def insert_firefox_history(cur: Cursor, alias: str, profile_label: str) -> None:
-    """Insert Firefox browser history into the unified database."""
-    _execute_sql(
-        (
-            """
-        INSERT INTO browser_history (browser, profile, url, title, referrer_url, visited_dt)
-        SELECT
-          'firefox' AS browser,
-          ?          AS profile,
-          p.url,
-          p.title,
-          pr.url AS referrer_url,
-          strftime('%Y-%m-%d %H:00:00', h.visit_date/1000000, 'unixepoch') AS visited_dt
-        FROM {alias}.moz_historyvisits h
-        JOIN {alias}.moz_places p         ON p.id = h.place_id
-        LEFT JOIN {alias}.moz_historyvisits ph ON ph.id = h.from_visit
-        LEFT JOIN {alias}.moz_places pr    ON pr.id = ph.place_id;
-        """
-        ).replace("{alias}", alias),
-        cur,
-        (profile_label,),
-    )
-
+def _apply_memory_budget(conn: Connection, max_memory: int | None, spill: bool) -> None:
+    """Cap SQLite's page cache to half of *max_memory* and push temp b-trees to disk."""
+    if spill:
+        conn.execute("PRAGMA temp_store=FILE")
+    if max_memory is not None:
+        cache_kib = max(max_memory // 2 // 1024, 1024)
+        conn.execute(f"PRAGMA cache_size=-{cache_kib}")
 
-def insert_safari_history(cur: Cursor, alias: str, profile_label: str) -> None:
-    """Insert Safari browser history into the unified database."""
-    _execute_sql(
-        (
-            """
-        INSERT INTO browser_history (browser, profile, url, title, referrer_url, visited_dt)
-        SELECT
-          'safari' AS browser,
-          ?         AS profile,
-          i.url,
-          v.title,
-          NULL AS referrer_url,
-          strftime('%Y-%m-%d %H:00:00', v.visit_time + strftime('%s','2001-01-01'), 'unixepoch') AS visited_dt
-        FROM {alias}.history_items i
-        LEFT JOIN {alias}.history_visits v ON v.history_item = i.id;
-        """
-        ).replace("{alias}", alias),
-        cur,
-        (profile_label,),
-    )
 
+def _create_unified_db_connection(
+    dest_db: Path | None, max_memory: int | None = None, spill: bool = False
+) -> Connection:
+    """Create and initialize the unified database connection.
 
-def _create_unified_db_connection(dest_db: Path | None) -> Connection:
-    """Create and initialize the unified database connection."""
+    The connection may be shared with background threads (e.g. adaptive indexing); the
+    sqlite3 module serialises access to it.
+    With *spill* and no *dest_db* the database is a private on-disk temporary file that
+    SQLite deletes when the connection closes, rather than an in-memory database.
+    """
     if dest_db is not None:
         if dest_db.exists():
             dest_db.unlink()
-        conn = connect(f"file:{dest_db}?mode=rwc", uri=True)
+        conn = _connect(f"file:{dest_db}?mode=rwc")
+    elif spill:
+        conn = _connect("")
     else:
-        conn = connect(":memory:")
+        conn = _connect(":memory:")
+    _apply_memory_budget(conn, max_memory, spill)
 
     cur = conn.cursor()
     cur.executescript(
-        """
+        f"""
         PRAGMA journal_mode=WAL;
         CREATE TABLE IF NOT EXISTS browser_history (
           browser      TEXT NOT NULL,
@@ -146,128 +225,688 @@ def _create_unified_db_connection(dest_db: Path | None) -> Connection:
           domain       TEXT,
           stripped_qp  TEXT,
           referrer_domain TEXT,
-          referrer_stripped_qp TEXT
+          referrer_stripped_qp TEXT,
+          scheme       TEXT,
+          path         TEXT,
+          registrable_domain TEXT,
+          path_depth   INTEGER,
+          ingest_seq   INTEGER
         );
         CREATE INDEX IF NOT EXISTS idx_bh_time  ON browser_history(visited_dt);
         CREATE INDEX IF NOT EXISTS idx_bh_url   ON browser_history(url);
         CREATE INDEX IF NOT EXISTS idx_bh_title ON browser_history(title);
+        CREATE INDEX IF NOT EXISTS idx_bh_domain ON browser_history(domain);
+        CREATE INDEX IF NOT EXISTS idx_bh_referrer_domain ON browser_history(referrer_domain);
+        CREATE INDEX IF NOT EXISTS idx_bh_registrable_domain
+          ON browser_history(registrable_domain);
+        CREATE INDEX IF NOT EXISTS idx_bh_path ON browser_history(path);
+        CREATE INDEX IF NOT EXISTS idx_bh_ingest_seq ON browser_history(ingest_seq);
+        CREATE TABLE IF NOT EXISTS {RAW_URL_TABLE} (
+          id           INTEGER PRIMARY KEY,
+          visit_id     INTEGER,
+          url          TEXT NOT NULL,
+          referrer_url TEXT
+        );
         """
     )
+    register_text_codec(conn)
     return conn
 
 
-def _apply_qp_whitelist(conn: Connection, whitelist: Whitelist) -> None:
-    """Post-process all rows: apply the query-parameter whitelist."""
-    cur = conn.cursor()
-    rows = cur.execute("SELECT rowid, url, referrer_url FROM browser_history").fetchall()
-    for rowid, raw_url, raw_referrer in rows:
-        result = process_url(raw_url, whitelist)
-        if raw_referrer is not None:
-            ref_result = process_url(raw_referrer, whitelist)
-            ref_url = ref_result["url"]
-            ref_domain = ref_result["domain"]
-            ref_stripped = ref_result["stripped_qp"]
-        else:
-            ref_url = None
-            ref_domain = None
-            ref_stripped = None
-        cur.execute(
-            """UPDATE browser_history
-               SET url = ?, domain = ?, stripped_qp = ?,
-                   referrer_url = ?, referrer_domain = ?, referrer_stripped_qp = ?
-               WHERE rowid = ?""",
-            (
-                result["url"],
-                result["domain"],
-                result["stripped_qp"],
-                ref_url,
-                ref_domain,
-                ref_stripped,
-                rowid,
-            ),
-        )
-    conn.commit()
+def _clean_row(row: tuple[int, str, str | None], whitelist: Whitelist) -> tuple[object, ...]:
+    """Return the UPDATE parameters that apply *whitelist* to one unified row."""
+    rowid, raw_url, raw_referrer = row
+    return (*clean_urls(raw_url, raw_referrer, whitelist), rowid)
 
 
-def _process_browser_sources(conn: Connection, sources: Iterable[tuple[BrowserType, Path]]) -> None:
-    """Process and import browser history from all sources."""
-    cur = conn.cursor()
-    alias_num = 0
+# Run on the history table; bh_pack() compresses the text when the database is packed.
+_CLEAN_ROW_SQL = """UPDATE {table}
+   SET url = bh_pack(?), domain = ?, stripped_qp = ?,
+       scheme = ?, path = ?, registrable_domain = ?, path_depth = ?,
+       referrer_url = bh_pack(?), referrer_domain = ?, referrer_stripped_qp = ?
+   WHERE rowid = ?"""
 
-    browser_inserters: dict[BrowserType, Callable[[Cursor, str, str], None]] = {
-        "chrome": insert_chrome_history,
-        "firefox": insert_firefox_history,
-        "safari": insert_safari_history,
-    }
 
-    with copy_locked_dbs([path for _, path in sources]) as locked_copies:
-        for og_path, copy_path in locked_copies:
-            browser: BrowserType = next(browser for browser, path in sources if path == og_path)
-            alias_num += 1
+def _deny_raw_url_access(
+    action: int, arg1: str | None, arg2: str | None, db_name: str | None, trigger: str | None
+) -> int:
+    """SQLite authorizer hiding the raw URL side table from model-written queries."""
+    return sqlite3.SQLITE_DENY if RAW_URL_TABLE in (arg1, arg2) else sqlite3.SQLITE_OK
 
-            alias = f"src{alias_num}"
-            cur.execute("ATTACH DATABASE ? AS " + alias, (f"file:{copy_path}?immutable=1&mode=ro",))
 
-            profile_label = sha_label(browser, og_path)
+def hide_raw_urls(conn: Connection) -> None:
+    """Deny every statement on *conn* that touches the raw URL side table."""
+    conn.set_authorizer(_deny_raw_url_access)
 
-            inserter = browser_inserters[browser]
-            inserter(cur, alias, profile_label)
 
-            conn.commit()
-            cur.execute(f"DETACH DATABASE {alias}")
+@contextmanager
+def _raw_url_access(conn: Connection) -> Iterator[None]:
+    """Temporarily lift :func:`hide_raw_urls` for internal maintenance on *conn*.
+
+    Changing the authorizer expires prepared statements, so cached statements are
+    re-authorized before the next model query reuses them.
+    """
+    conn.set_authorizer(None)
+    try:
+        yield
+    finally:
+        hide_raw_urls(conn)
+
+
+def _indexed_domains(conn: Connection) -> list[str]:
+    """Return every distinct page and referrer domain, read from the domain indexes."""
+    rows = conn.execute(
+        """SELECT domain FROM browser_history WHERE domain IS NOT NULL
+           UNION
+           SELECT referrer_domain FROM browser_history WHERE referrer_domain IS NOT NULL"""
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def _reclean_domains(
+    conn: Connection, domains: list[str], whitelist: Whitelist, batch_size: int
+) -> int:
+    """Re-apply *whitelist* to the rows whose page or referrer domain is in *domains*."""
+    cleaned = 0
+    table = history_table(conn)
+    for start in range(0, len(domains), batch_size):
+        chunk = domains[start : start + batch_size]
+        marks = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"""SELECT r.id, bh_text(r.url), bh_text(r.referrer_url)
+                FROM {table} h JOIN {RAW_URL_TABLE} r ON r.id = h.rowid
+                WHERE h.domain IN ({marks}) OR h.referrer_domain IN ({marks})""",
+            chunk * 2,
+        ).fetchall()
+        conn.executemany(
+            _CLEAN_ROW_SQL.format(table=table), [_clean_row(row, whitelist) for row in rows]
+        )
+        cleaned += len(rows)
+    return cleaned
+
+
+@contextmanager
+def unified_db_writer(conn: Connection, db_path: Path | None) -> Iterator[Connection]:
+    """Yield a connection that may modify the unified database behind *conn*.
+
+    A persisted database (*db_path*) is queried read-only, so a writable connection is
+    opened on the generation file *conn* reads for the duration of the block; an in-memory
+    one is *conn* itself.
+    """
+    if db_path is None:
+        yield conn
+        return
+    path = database_file(conn) or current_generation(db_path)
+    writer = _connect(f"file:{path}?mode=rw")
+    register_text_codec(writer)
+    try:
+        yield writer
+    finally:
+        writer.close()
+
+
+def reclean_unified_db(
+    conn: Connection,
+    old: Whitelist,
+    new: Whitelist,
+    db_path: Path | None = None,
+    fingerprint: str | None = None,
+) -> int:
+    """Re-apply the whitelist after it changed from *old* to *new*; return rows updated.
+
+    Only rows whose page or referrer domain is matched differently by the two whitelists
+    are rebuilt from the raw URL side table.  A persisted database at *db_path* is updated
+    through a separate writable connection and its build *fingerprint* is refreshed.
+    """
+    with unified_db_writer(conn, db_path) as writer, _raw_url_access(writer):
+        changed = changed_domains(_indexed_domains(writer), old, new)
+        cleaned = _reclean_domains(writer, changed, new, RECLEAN_DOMAIN_BATCH)
+        if fingerprint is not None and db_path is not None:
+            _write_build_meta(writer, fingerprint)
+        writer.commit()
+    logger.info(
+        "Re-cleaned %d rows across %d domains after a whitelist change", cleaned, len(changed)
+    )
+    return cleaned
+
+
+def _report_progress(
+    stats: BuildStats | None, progress: float, control: IngestControl | None = None
+) -> None:
+    if stats is not None:
+        stats.progress = progress
+    if control is not None and control.on_progress is not None:
+        control.on_progress(progress)
+
+
+_INSERT_VISIT_SQL = """INSERT INTO browser_history (
+       rowid, browser, profile, title, visited_dt,
+       url, domain, stripped_qp, scheme, path, registrable_domain, path_depth,
+       referrer_url, referrer_domain, referrer_stripped_qp, ingest_seq)
+   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+_INSERT_RAW_URL_SQL = (
+    f"INSERT INTO {RAW_URL_TABLE} (id, visit_id, url, referrer_url) VALUES (?, ?, ?, ?)"
+)
+
+
+def _write_visits(
+    conn: Connection,
+    visits: list[SourceVisit],
+    source: tuple[BrowserType, str | None],
+    whitelist: Whitelist,
+    counters: IngestCounters,
+) -> None:
+    """Clean *visits* of one (browser, profile) *source* and append them to the unified table.
+
+    Their URLs are also kept as read in the raw URL side table, under the same row id and
+    with their source visit id.  Rows are numbered in ingest order (``ingest_seq``).
+    """
+    browser, profile = source
+    first = conn.execute("SELECT coalesce(max(rowid), 0) + 1 FROM browser_history").fetchone()[0]
+    with counters.clean.timing():
+        rows = [
+            (rowid, browser, profile, title, visited, *clean_urls(url, referrer, whitelist), rowid)
+            for rowid, (_, url, title, referrer, visited) in enumerate(visits, start=first)
+        ]
+    counters.clean.rows += len(rows)
+    with counters.write.timing(), _raw_url_access(conn):
+        conn.executemany(_INSERT_VISIT_SQL, rows)
+        conn.executemany(
+            _INSERT_RAW_URL_SQL,
+            [
+                (rowid, visit_id, url, referrer)
+                for rowid, (visit_id, url, _, referrer, _) in enumerate(visits, start=first)
+            ],
+        )
+        conn.commit()
+    counters.write.rows += len(rows)
+    counters.batches += 1
+
+
+def _ingest_source(
+    conn: Connection,
+    source: tuple[BrowserType, str, str],
+    whitelist: Whitelist | None,
+    window: IngestWindow | None,
+    stats: BuildStats,
+    control: IngestControl,
+    position: tuple[int, int],
+) -> None:
+    """Stream the (browser, alias, profile) *source* into the unified table batch by batch.
+
+    *position* is the source's index and the number of sources, used to report progress.
+    """
+    browser, alias, profile = source
+    index, total = position
+    lo, hi = visit_id_span(conn, browser, alias)
+    for visits in read_source(conn, browser, alias, window, stats.ingest.read, control.batch_size):
+        control.check()
+        _write_visits(conn, visits, (browser, profile), whitelist or {}, stats.ingest)
+        done = (visits[-1][0] - lo + 1) / (hi - lo + 1)
+        _report_progress(stats, INGEST_PROGRESS_SHARE * (index + done) / total, control)
+
+
+def _process_browser_sources(
+    conn: Connection,
+    sources: Iterable[tuple[BrowserType, Path]],
+    whitelist: Whitelist | None,
+    window: IngestWindow | None,
+    stats: BuildStats,
+    control: IngestControl,
+) -> None:
+    """Process and import browser history from all sources, restricted to *window*.
+
+    Visits are cleaned with *whitelist* as they are imported.  *stats* progress advances
+    and *control* is consulted after every batch.
+    """
+    sources = list(sources)
+    with copy_locked_dbs([path for _, path in sources]) as locked_copies:
+        for index, (og_path, copy_path) in enumerate(locked_copies):
+            browser: BrowserType = next(browser for browser, path in sources if path == og_path)
+            alias = f"src{index + 1}"
+            conn.execute("ATTACH DATABASE ? AS " + alias, (f"file:{copy_path}?immutable=1&mode=ro",))
+            source = (browser, alias, sha_label(browser, og_path))
+            position = (index, len(sources))
+            _ingest_source(conn, source, whitelist, window, stats, control, position)
+            conn.execute(f"DETACH DATABASE {alias}")
+
+
+def _should_spill(dest_db: Path | None, max_memory: int | None, projected: int) -> bool:
+    """True when an in-memory build is projected to exceed the memory budget."""
+    return dest_db is None and max_memory is not None and projected > max_memory
 
 
 def build_unified_browser_history_db(
     dest_db: Path | None,
     sources: Iterable[tuple[BrowserType, Path]],
     whitelist: Whitelist | None = None,
+    max_memory: int | None = None,
+    stats: BuildStats | None = None,
+    options: BuildOptions | None = None,
+    control: IngestControl | None = None,
 ) -> Connection:
-    conn = _create_unified_db_connection(dest_db)
-    _process_browser_sources(conn, sources)
-    _apply_qp_whitelist(conn, whitelist if whitelist is not None else {})
+    """Build the unified database from *sources*.
+
+    When *max_memory* (bytes) is given and the projected size of the unified database
+    exceeds it, an in-memory build spills to a temporary file with a capped page cache.
+    *options* enables optional stages such as cross-profile dedup.
+    Pass *stats* to receive the build counters; they are also logged at INFO level.
+    *control* sets the ingest batch size, a progress callback and a cancellation flag;
+    a cancelled build closes its connection and raises :class:`IngestCancelled`.
+    """
+    sources = list(sources)
+    stats = stats if stats is not None else BuildStats()
+    options = options or BuildOptions()
+    control = control or IngestControl()
+    control.begin()
+    started = time.perf_counter()
+    stats.sources = len(sources)
+    stats.max_memory = max_memory
+    stats.projected_bytes = projected_unified_db_bytes(sources)
+    stats.spilled = _should_spill(dest_db, max_memory, stats.projected_bytes)
+
+    conn = _create_unified_db_connection(dest_db, max_memory, stats.spilled)
+    try:
+        _process_browser_sources(conn, sources, whitelist, options.ingest_window(), stats, control)
+    except IngestCancelled:
+        conn.close()
+        raise
+    _post_process(conn, options, stats)
+    start_feed(conn)
+    hide_raw_urls(conn)
+
+    stats.rows = conn.execute("SELECT COUNT(*) FROM browser_history").fetchone()[0]
+    stats.seconds = time.perf_counter() - started
+    stats.peak_rss_bytes = peak_rss_bytes()
+    _report_progress(stats, 1.0, control)
+    logger.info("Unified browser history build stats: %s", stats)
+    return conn
+
+
+def _post_process(conn: Connection, options: BuildOptions, stats: BuildStats) -> None:
+    """Run the optional build stages that follow ingest."""
+    if options.dedup_window_hours is not None:
+        _dedup_unified_db(conn, options.dedup_window_hours, stats)
+    if options.sketches:
+        build_sketches(conn)
+    if options.text_compression is not None:
+        with _raw_url_access(conn):
+            pack_unified_db(conn, options.text_compression, RAW_URL_TABLE)
+
+
+def _freelist_bytes(conn: Connection) -> int:
+    """Return the bytes held by free pages, which SQLite reuses before growing the database."""
+    pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return int(pages) * int(conn.execute("PRAGMA page_size").fetchone()[0])
+
+
+def _dedup_unified_db(conn: Connection, window_hours: int, stats: BuildStats) -> None:
+    """Remove cross-profile duplicate visits and their raw URLs, recording the savings."""
+    freed_before = _freelist_bytes(conn)
+    stats.duplicates_removed = dedup_visits(conn, window_hours).rows_removed
+    with _raw_url_access(conn):
+        conn.execute(
+            f"DELETE FROM {RAW_URL_TABLE} WHERE id NOT IN (SELECT rowid FROM browser_history)"
+        )
+        conn.commit()
+    stats.dedup_bytes_freed = _freelist_bytes(conn) - freed_before
+
+
+def prewarm_db_file(path: Path, chunk_size: int = PREWARM_CHUNK_SIZE) -> int:
+    """Pull *path* into the OS page cache and return the number of bytes read."""
+    total = 0
+    with path.open("rb", buffering=0) as fh:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+        while chunk := fh.read(chunk_size):
+            total += len(chunk)
+    return total
+
+
+def open_unified_db_reader(path: Path, mmap_size: int = 0) -> Connection:
+    """Open a read-only query connection on a persisted unified database.
+
+    A non-zero *mmap_size* (bytes) lets SQLite read pages straight out of the memory-mapped
+    file instead of copying them through its page cache with read() calls.
+    """
+    conn = _connect(f"file:{path}?mode=ro")
+    conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+    conn.execute("PRAGMA query_only=1")
+    register_text_codec(conn)
+    hide_raw_urls(conn)
     return conn
 
 
+def unified_db_fingerprint(
+    sources: Iterable[tuple[BrowserType, Path]],
+    whitelist: Whitelist | None,
+    options: BuildOptions | None = None,
+) -> str:
+    """Identify the inputs a persisted unified database was built from."""
+    payload = {
+        "sources": sorted(f"{browser}:{path}" for browser, path in sources),
+        "schema": UNIFIED_SCHEMA_VERSION,
+        "whitelist": whitelist or {},
+        "options": asdict(options or BuildOptions()),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _write_build_meta(conn: Connection, fingerprint: str, rows: int | None = None) -> None:
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS _bh_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+    )
+    meta = [("fingerprint", fingerprint), ("built_at", str(time.time()))]
+    if rows is not None:
+        meta.append(("rows", str(rows)))
+    conn.executemany("INSERT OR REPLACE INTO _bh_meta (key, value) VALUES (?, ?)", meta)
+    conn.commit()
+
+
+def _read_build_meta(db_path: Path) -> dict[str, str]:
+    """Return the build metadata of the database at *db_path* (empty if there is none)."""
+    if not db_path.exists():
+        return {}
+    try:
+        conn = _connect(f"file:{current_generation(db_path)}?mode=ro")
+        try:
+            return dict(conn.execute("SELECT key, value FROM _bh_meta").fetchall())
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError:
+        return {}
+
+
+def _reusable_db(db_path: Path, fingerprint: str, max_age: float) -> bool:
+    """True when *db_path* was built from the same inputs less than *max_age* seconds ago."""
+    meta = _read_build_meta(db_path)
+    if meta.get("fingerprint") != fingerprint:
+        return False
+    age = time.time() - float(meta.get("built_at", 0))
+    if age > max_age:
+        return False
+    logger.info("Reusing unified database %s built %.0fs ago", db_path, age)
+    return True
+
+
+def _build_db_file(
+    db_path: Path,
+    sources: list[tuple[BrowserType, Path]],
+    whitelist: Whitelist | None,
+    max_memory: int | None,
+    options: BuildOptions | None,
+    stats: BuildStats | None = None,
+    control: IngestControl | None = None,
+) -> Path:
+    """Build the unified database beside *db_path* and publish it as its next generation.
+
+    Readers of an older generation keep their open file; *db_path* and new readers see the
+    new one.  Returns the new generation's file.
+    """
+    tmp = db_path.with_name(f".{db_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    stats = stats if stats is not None else BuildStats()
+    try:
+        conn = build_unified_browser_history_db(
+            tmp, sources, whitelist, max_memory, stats, options, control
+        )
+        _write_build_meta(conn, unified_db_fingerprint(sources, whitelist, options), stats.rows)
+        if db_path.exists():
+            previous = current_generation(db_path)
+            # Keep the title embeddings of the previous build so only new titles are embedded.
+            copy_embeddings(conn, previous)
+            # Keep visits' change feed numbers so clients' tokens survive the rebuild.
+            with _raw_url_access(conn):
+                carry_over_feed(conn, previous, RAW_URL_TABLE)
+        # Readers open the file read-only, which is simplest without a WAL alongside it.
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+        # Browsing history is private: keep the cache readable by its owner only.
+        tmp.chmod(0o600)
+        return publish_generation(tmp, db_path)
+    finally:
+        for leftover in (tmp, tmp.with_name(tmp.name + "-wal"), tmp.with_name(tmp.name + "-shm")):
+            leftover.unlink(missing_ok=True)
+
+
+def _persist_unified_db(
+    db_path: Path,
+    sources: Iterable[tuple[BrowserType, Path]],
+    whitelist: Whitelist | None,
+    max_memory: int | None,
+    mmap_size: int,
+    max_age: float | None = None,
+    options: BuildOptions | None = None,
+    stats: BuildStats | None = None,
+    control: IngestControl | None = None,
+) -> Connection:
+    """Return a pre-warmed reader on the unified database persisted at *db_path*.
+
+    With *max_age* (seconds) an existing file built from the same sources, whitelist and
+    options less than *max_age* ago is reused as is; otherwise the database is rebuilt.
+    """
+    sources = list(sources)
+    fingerprint = unified_db_fingerprint(sources, whitelist, options)
+    if max_age is None or not _reusable_db(db_path, fingerprint, max_age):
+        _build_db_file(db_path, sources, whitelist, max_memory, options, stats, control)
+    elif stats is not None:
+        # Nothing was built; carry the row count over from the build that made the file.
+        stats.rows = int(_read_build_meta(db_path).get("rows", 0))
+    collect_generations(db_path)
+    return _open_generation(db_path, mmap_size)
+
+
+def _open_generation(db_path: Path, mmap_size: int) -> Connection:
+    """Open a pre-warmed reader pinned to the generation *db_path* currently points at."""
+    path = current_generation(db_path)
+    warmed = prewarm_db_file(path)
+    logger.info("Pre-warmed %d bytes of %s", warmed, path)
+    return open_unified_db_reader(path, mmap_size)
+
+
+def unified_db_key(
+    sources: Iterable[tuple[BrowserType, Path]],
+    whitelist: Whitelist | None,
+    db_path: Path | None = None,
+    options: BuildOptions | None = None,
+) -> str:
+    """Return the registry key of the unified database for this configuration."""
+    fingerprint = unified_db_fingerprint(sources, whitelist, options)
+    return f"{fingerprint[:16]}@{db_path or ':memory:'}"
+
+
 def get_or_create_unified_db(
     sources: Iterable[tuple[BrowserType, Path]],
     whitelist: Whitelist | None = None,
+    max_memory: int | None = None,
+    db_path: Path | None = None,
+    mmap_size: int = 0,
+    max_age: float | None = None,
+    options: BuildOptions | None = None,
+    stats: BuildStats | None = None,
+    control: IngestControl | None = None,
 ) -> Connection:
-    global _UNIFIED_DB_CONN
-    if _UNIFIED_DB_CONN is not None:
-        return _UNIFIED_DB_CONN
+    """Return the unified database for *sources* and *whitelist*, building it on first use.
+
+    Databases are kept in a process-wide registry keyed by :func:`unified_db_key`, so
+    toolboxes with different sources or whitelists each get their own data.
+    With *db_path* the database is persisted to that file and queried through a read-only,
+    optionally memory-mapped connection; otherwise it lives in memory.  *max_age* lets a
+    persisted database built by an earlier process be reused (see :func:`_persist_unified_db`).
+    *stats* receives the build counters, including live progress, if a build is needed;
+    *control* is passed on to :func:`build_unified_browser_history_db`.
+    """
+    sources = list(sources)
+
+    def build() -> Connection:
+        if db_path is not None:
+            return _persist_unified_db(
+                db_path, sources, whitelist, max_memory, mmap_size, max_age, options, stats,
+                control,
+            )
+        # Use in-memory database by default, spilling to a temp file over the memory budget
+        return build_unified_browser_history_db(
+            None, sources, whitelist, max_memory, stats, options, control
+        )
 
-    # Use in-memory database by default
-    conn = build_unified_browser_history_db(None, sources, whitelist)
-    _UNIFIED_DB_CONN = conn
-    return conn
+    key = unified_db_key(sources, whitelist, db_path, options)
+    if db_path is None:
+        return UNIFIED_DB_REGISTRY.get(key, build)
+    return UNIFIED_DB_REGISTRY.get(
+        key, build, in_memory=False, on_close=partial(collect_generations, db_path)
+    )
 
 
-def cleanup_unified_db() -> None:
-    """Close the unified database connection."""
-    global _UNIFIED_DB_CONN
-    if _UNIFIED_DB_CONN is None:
+def refresh_unified_db(
+    sources: Iterable[tuple[BrowserType, Path]],
+    whitelist: Whitelist | None = None,
+    max_memory: int | None = None,
+    db_path: Path | None = None,
+    mmap_size: int = 0,
+    options: BuildOptions | None = None,
+    stats: BuildStats | None = None,
+    control: IngestControl | None = None,
+) -> None:
+    """Rebuild the unified database from *sources* and send new queries to the new build.
+
+    Queries pinned to the previous build (see :func:`pin_unified_db`) finish on it; it is
+    closed when they have all finished and, for a persisted *db_path*, its generation file
+    is then deleted.
+    """
+    sources = list(sources)
+    key = unified_db_key(sources, whitelist, db_path, options)
+    if db_path is None:
+        conn = build_unified_browser_history_db(
+            None, sources, whitelist, max_memory, stats, options, control
+        )
+        _carry_over_registered(conn, key)
+        UNIFIED_DB_REGISTRY.swap(key, conn)
         return
+    _build_db_file(db_path, sources, whitelist, max_memory, options, stats, control)
+    UNIFIED_DB_REGISTRY.swap(
+        key,
+        _open_generation(db_path, mmap_size),
+        in_memory=False,
+        on_close=partial(collect_generations, db_path),
+    )
+
+
+def _carry_over_registered(conn: Connection, key: str) -> None:
+    """Carry what a rebuild keeps over from the in-memory build registered as *key*."""
+    if key not in UNIFIED_DB_REGISTRY.keys():
+        return
+    with UNIFIED_DB_REGISTRY.pin(key) as old, _raw_url_access(old), _raw_url_access(conn):
+        # Keep the title embeddings so only new titles are embedded.
+        copy_embeddings_from(conn, old)
+        # Keep visits' change feed numbers so clients' tokens survive the rebuild.
+        carry_over_feed_from(conn, old, RAW_URL_TABLE)
+
+
+def pin_unified_db(key: str) -> AbstractContextManager[Connection]:
+    """Pin the unified database registered as *key* for the duration of a query.
+
+    A :func:`refresh_unified_db` meanwhile does not close it under the query.
+    """
+    return UNIFIED_DB_REGISTRY.pin(key)
+
+
+def unified_db_lock(conn: Connection) -> AbstractContextManager[object] | None:
+    """Return the lock serialising the queries pinned to the registered database *conn*."""
+    return UNIFIED_DB_REGISTRY.query_lock(conn)
+
+
+def acquire_unified_db(key: str) -> None:
+    """Register a user of the unified database with registry key *key*."""
+    UNIFIED_DB_REGISTRY.acquire(key)
+
+
+def release_unified_db(key: str) -> None:
+    """Drop a user registered by :func:`acquire_unified_db`.
 
+    An unreferenced database stays open for reuse until the registry needs to evict it.
+    """
+    UNIFIED_DB_REGISTRY.release(key)
+
+
+def rekey_unified_db(old: str, new: str) -> None:
+    """Move the registered database from key *old* to *new* after a whitelist change."""
+    UNIFIED_DB_REGISTRY.rekey(old, new)
+
+
+def cleanup_unified_db() -> None:
+    """Close every unified database, regardless of who still holds a reference."""
+    UNIFIED_DB_REGISTRY.close_all()
+
+
+@contextmanager
+def read_snapshot(conn: Connection) -> Iterator[Connection]:
+    """Run the block's queries on *conn* in one read transaction so they see the same data.
+
+    If *conn* is already in a transaction the block simply joins it.
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN")
     try:
-        _UNIFIED_DB_CONN.close()
-    except Exception:
-        # Best-effort cleanup, ignore errors
-        pass
+        yield conn
     finally:
-        _UNIFIED_DB_CONN = None
+        conn.execute("COMMIT")
+
+
+def _fetch(cur: Cursor, max_rows: int) -> list[Any]:
+    """Fetch up to *max_rows* rows from *cur*; ``0`` (or less) means no limit."""
+    return cur.fetchall() if max_rows <= 0 else cur.fetchmany(max_rows)
 
 
 def run_unified_query(
     conn: Connection, sql: str, params: dict[str, object] | None = None, max_rows: int = 100
 ) -> list[Any]:
-    cur = conn.execute(sql, params or {})
-    return cur.fetchmany(max_rows)
+    """Run *sql* and return up to *max_rows* rows, reporting to any installed query hooks."""
+    with profile_query(conn, sql, params) as profile:
+        rows = _fetch(conn.execute(sql, params or {}), max_rows)
+        profile.rows = len(rows)
+    return rows
 
 
 def run_unified_query_with_headers(
     conn: Connection, sql: str, params: dict[str, object] | None = None, max_rows: int = 100
 ) -> tuple[list[str], list[Any]]:
     """Like :func:`run_unified_query` but also returns column headers."""
-    cur = conn.execute(sql, params or {})
-    headers = [desc[0] for desc in cur.description] if cur.description else []
-    return headers, cur.fetchmany(max_rows)
+    with profile_query(conn, sql, params) as profile:
+        cur = conn.execute(sql, params or {})
+        headers = [desc[0] for desc in cur.description] if cur.description else []
+        rows = _fetch(cur, max_rows)
+        profile.rows = len(rows)
+    return headers, rows
+
+
+def iter_unified_query_with_headers(
+    conn: Connection,
+    sql: str,
+    params: dict[str, object] | None = None,
+    max_rows: int = 100,
+    batch_size: int = FETCH_BATCH_SIZE,
+) -> tuple[list[str], Iterator[Any]]:
+    """Like :func:`run_unified_query_with_headers` but yields rows as they are fetched.
+
+    Rows come off the cursor *batch_size* at a time, so memory use does not grow with
+    *max_rows* (``0`` means no limit).  The query is profiled until its rows run out.
+    """
+    with ExitStack() as stack:
+        profile = stack.enter_context(profile_query(conn, sql, params))
+        cur = conn.execute(sql, params or {})
+        headers = [desc[0] for desc in cur.description] if cur.description else []
+        profiling = stack.pop_all()
+    rows = itertools.chain.from_iterable(iter(lambda: cur.fetchmany(batch_size), []))
+    limited = itertools.islice(rows, max_rows) if max_rows > 0 else rows
+    return headers, _profiled_rows(limited, profile, profiling)
+
+
+def _profiled_rows(
+    rows: Iterator[Any], profile: QueryProfile, profiling: ExitStack
+) -> Iterator[Any]:
+    """Yield *rows*, then close *profiling*, which reports *profile* to the query hooks."""
+    with profiling:
+        for row in rows:
+            profile.rows += 1
+            yield row
@@ -1,7 +1,14 @@
 import json
 import pathlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import llm
-from collections.abc import Callable, Iterable
+from llm.models import EmbeddingModel
+from sqlite3 import Connection
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
 from typing import Any, Sequence, get_args
 
 
@@ -9,8 +16,55 @@ from .firefox import find_firefox_places_sqlite
 from .chrome import find_chrome_history_paths
 from .safari import find_safari_history_paths
 from .browser_types import BrowserType
-from .sqlite import get_or_create_unified_db, run_unified_query, cleanup_unified_db
-from .qp_whitelist import Whitelist, load_whitelist
+from .changes import changes_since
+from .compression import TextCodecName
+from .sqlite import (
+    BuildOptions,
+    BuildStats,
+    SEARCH_MANY_WORKERS,
+    acquire_unified_db,
+    get_or_create_unified_db,
+    release_unified_db,
+    reclean_unified_db,
+    rekey_unified_db,
+    open_unified_db_reader,
+    pin_unified_db,
+    read_snapshot,
+    refresh_unified_db,
+    run_unified_query,
+    unified_db_writer,
+    unified_db_fingerprint,
+    unified_db_key,
+    unified_db_lock,
+)
+from .ingest import INGEST_BATCH_SIZE, IngestControl
+from .qp_whitelist import Whitelist, load_whitelist, make_whitelist_watcher
+from .retention import DEFAULT_SAMPLE_EVERY
+from .semantic import TitleIndex, check_local_model, embed_new_titles
+from .sketches import approx_stats
+from .snapshots import database_file
+from .query_plan import QueryGuard, check_query, log_query_timing, make_query_guard
+from .workload import DEFAULT_INDEX_THRESHOLD, make_adaptive_indexer
+
+
+BatchQuery = tuple[str, dict[str, Any] | None]
+
+
+def _batch_query(query: dict[str, Any] | str) -> BatchQuery:
+    """Normalise one ``search_many`` entry: a bare SQL string or {"sql", "params"}."""
+    if isinstance(query, str):
+        return query, None
+    if "sql" not in query:
+        raise ValueError("each search_many query needs a 'sql' key")
+    return query["sql"], query.get("params")
+
+
+def _optional_path(value: str | pathlib.Path | None) -> pathlib.Path | None:
+    return pathlib.Path(value) if value is not None else None
+
+
+def _initial_whitelist(whitelist: Whitelist | None, path: pathlib.Path | None) -> Whitelist:
+    return whitelist if whitelist is not None else load_whitelist(path)
 
 
 class BrowserHistory(llm.Toolbox):  # type: ignore
@@ -21,15 +75,69 @@ class BrowserHistory(llm.Toolbox):  # type: ignore
         sources: Iterable[str] | None = None,
         max_rows: int = 100,
         whitelist: Whitelist | None = None,
+        whitelist_path: str | pathlib.Path | None = None,
+        max_memory_mb: int | None = None,
+        db_path: str | None = None,
+        mmap_size_mb: int = 0,
+        db_max_age: int | None = None,
+        dedup_window_hours: int | None = None,
+        since: str | None = None,
+        retention_days: int | None = None,
+        sample_after_days: int | None = None,
+        sample_every: int = DEFAULT_SAMPLE_EVERY,
+        sketches: bool = False,
+        text_compression: TextCodecName | None = None,
+        embedding_model: str | EmbeddingModel | None = None,
+        allow_remote_embeddings: bool = False,
+        max_query_cost: int | None = None,
+        rewrite_like: bool = False,
+        workload_profile: str | None = None,
+        adaptive_index_threshold: int = DEFAULT_INDEX_THRESHOLD,
+        ingest_batch_size: int = INGEST_BATCH_SIZE,
     ):
         self.sources: list[tuple[BrowserType, pathlib.Path]] = []
         self.max_rows = max_rows
-        self.whitelist = whitelist if whitelist is not None else load_whitelist(None)
+        self.whitelist = _initial_whitelist(whitelist, _optional_path(whitelist_path))
+        self._whitelist_watcher = make_whitelist_watcher(_optional_path(whitelist_path))
+        self.max_memory = max_memory_mb * 1024 * 1024 if max_memory_mb is not None else None
+        self.db_path = _optional_path(db_path)
+        self.mmap_size = mmap_size_mb * 1024 * 1024
+        self.db_max_age = db_max_age
+        self.build_options = BuildOptions(
+            dedup_window_hours=dedup_window_hours,
+            since=since,
+            retention_days=retention_days,
+            sample_after_days=sample_after_days,
+            sample_every=sample_every,
+            sketches=sketches,
+            text_compression=text_compression,
+        )
+        self.query_guard = make_query_guard(max_query_cost, rewrite_like)
+        self.indexer = make_adaptive_indexer(
+            _optional_path(workload_profile), adaptive_index_threshold, self.db_path
+        )
 
         if not sources:
             sources = get_args(BrowserType)
 
         self._initialize_sources(sources)
+        self._db_key: str | None = None
+        # Counters of the build this toolbox triggers, including its live progress.
+        self._build_stats = BuildStats()
+        self._ingest_control = IngestControl(batch_size=ingest_batch_size)
+        if isinstance(embedding_model, EmbeddingModel):
+            check_local_model(embedding_model, allow_remote_embeddings)
+        self.embedding_model = embedding_model
+        self.allow_remote_embeddings = allow_remote_embeddings
+        self._title_index: TitleIndex | None = None
+        # Serialises resolving the model and loading the title index across threads.
+        self._semantic_lock = threading.Lock()
+        # Idle readers for parallel search_many batches; see _borrowed_readers.
+        self._reader_pool: list[Connection] = []
+        # The generation file the pooled readers have open.
+        self._pool_file: pathlib.Path | None = None
+        self._pool_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
 
     def _initialize_sources(self, sources: Iterable[str]) -> None:
         """Initialize browser history sources."""
@@ -44,11 +152,130 @@ class BrowserHistory(llm.Toolbox):  # type: ignore
                 for p in finder_func():
                     self.sources.append((browser_name, p))
 
-    def _do_search(self, sql: str) -> list[Sequence[Any]]:
-        unified_db = get_or_create_unified_db(self.sources, whitelist=self.whitelist)
-        return run_unified_query(unified_db, sql, {}, self.max_rows)
+    def _acquire(self) -> str:
+        """Hold a reference to this toolbox's unified database; return its registry key."""
+        if self._db_key is None:
+            self._db_key = unified_db_key(
+                self.sources, self.whitelist, self.db_path, self.build_options
+            )
+            acquire_unified_db(self._db_key)
+        return self._db_key
+
+    def _unified_db(self) -> Connection:
+        """Return the shared unified database, holding a reference to it until released.
+
+        Use it through :meth:`_pinned_db`: queries on the shared connection must hold its pin.
+        """
+        self._acquire()
+        conn = get_or_create_unified_db(
+            self.sources,
+            whitelist=self.whitelist,
+            max_memory=self.max_memory,
+            db_path=self.db_path,
+            mmap_size=self.mmap_size,
+            max_age=self.db_max_age,
+            options=self.build_options,
+            stats=self._build_stats,
+            control=self._ingest_control,
+        )
+        return conn
+
+    @contextmanager
+    def _pinned_db(self) -> Iterator[Connection]:
+        """Yield the unified database, kept open for the block even if a refresh swaps it.
+
+        The block has the connection to itself, so a whitelist change is applied here first.
+        """
+        self._unified_db()
+        with pin_unified_db(self._acquire()) as conn:
+            self._reload_whitelist(conn)
+            yield conn
+
+    def _refresh(self) -> None:
+        """Rebuild the unified database from the sources; running queries finish on the old one."""
+        self._unified_db()
+        refresh_unified_db(
+            self.sources,
+            whitelist=self.whitelist,
+            max_memory=self.max_memory,
+            db_path=self.db_path,
+            mmap_size=self.mmap_size,
+            options=self.build_options,
+            stats=self._build_stats,
+            control=self._ingest_control,
+        )
+        # Pooled readers and the title index belong to the previous build.  Readers lent to
+        # a running batch are closed when it returns them.
+        self._drop_readers()
+        with self._semantic_lock:
+            loaded, self._title_index = self._title_index is not None, None
+        if loaded:
+            # The build kept the cached vectors: embed only its new titles, here rather than
+            # in the next semantic_search.
+            self._semantic_index()
+
+    def _reload_whitelist(self, conn: Connection) -> None:
+        """Re-clean the affected rows in place if the whitelist file changed."""
+        new = self._whitelist_watcher.poll() if self._whitelist_watcher is not None else None
+        if new is None or new == self.whitelist:
+            return
+        reclean_unified_db(
+            conn,
+            self.whitelist,
+            new,
+            self.db_path,
+            unified_db_fingerprint(self.sources, new, self.build_options),
+        )
+        self.whitelist = new
+        self._rekey(unified_db_key(self.sources, new, self.db_path, self.build_options))
 
-    def search(self, sql: str) -> str:
+    def _rekey(self, key: str) -> None:
+        """Move this toolbox's registry reference to *key*."""
+        old = self._db_key
+        if old is None:
+            return
+        rekey_unified_db(old, key)
+        self._db_key = key
+        acquire_unified_db(key)
+        release_unified_db(old)
+
+    def _drop_readers(self) -> None:
+        """Close the idle pooled readers; lent ones are closed when returned."""
+        with self._pool_lock:
+            idle, self._reader_pool = self._reader_pool, []
+        for reader in idle:
+            reader.close()
+
+    def _release(self) -> None:
+        """Drop this toolbox's reference so the registry may evict its database."""
+        if hasattr(self, "_pool_lock"):
+            self._drop_readers()
+        key = getattr(self, "_db_key", None)
+        if key is not None:
+            self._db_key = None
+            release_unified_db(key)
+
+    def _do_search(self, sql: str, params: dict[str, Any] | None = None) -> list[Sequence[Any]]:
+        with self._pinned_db() as conn:
+            return self._run_query(conn, sql, params)
+
+    def _run_query(
+        self, unified_db: Connection, sql: str, params: dict[str, Any] | None
+    ) -> list[Sequence[Any]]:
+        """Run one model-written query on *unified_db*, through the guard and indexer."""
+        if self.query_guard is None and self.indexer is None:
+            return run_unified_query(unified_db, sql, params, self.max_rows)
+
+        checked = check_query(unified_db, sql, params, self.query_guard or QueryGuard())
+        started = time.perf_counter()
+        rows = run_unified_query(unified_db, checked.sql, params, self.max_rows)
+        log_query_timing(checked, time.perf_counter() - started, rows)
+        if self.indexer is not None:
+            lock = unified_db_lock(unified_db)
+            self.indexer.observe(unified_db, checked.sql, params, checked.plan, lock)
+        return rows
+
+    def search(self, sql: str, params: dict[str, Any] | None = None) -> str:
         """
         Execute a SQL query against a normalized, unified browser history database.
 
@@ -59,23 +286,242 @@ class BrowserHistory(llm.Toolbox):  # type: ignore
             profile     TEXT,                   -- browser profile name, e.g. 'Default', 'Profile 1', 'default-release'
             url         TEXT NOT NULL,          -- The URL visited (query params filtered by whitelist)
             title       TEXT,                   -- The title of the page visited.
-            referrer_url TEXT,                  -- NULL on Safari, otherwise the referrer (query params filtered by whitelist)
+            referrer_url TEXT,                  -- The referrer (query params filtered by whitelist); on Safari only the page that redirected here
             visited_dt  DATETIME NOT NULL,      -- UTC datetime
             domain      TEXT,                   -- The domain of the URL
             stripped_qp TEXT,                   -- Comma-separated list of query param keys that were removed
             referrer_domain TEXT,               -- The domain of the referrer URL
-            referrer_stripped_qp TEXT           -- Comma-separated list of query param keys removed from referrer
+            referrer_stripped_qp TEXT,          -- Comma-separated list of query param keys removed from referrer
+            scheme      TEXT,                   -- The URL scheme, e.g. 'https'
+            path        TEXT,                   -- The URL path, e.g. '/search'
+            registrable_domain TEXT,            -- domain folded to its registrable part, e.g. 'google.com' for 'mail.google.com'
+            path_depth  INTEGER,                -- Number of non-empty path segments ('/a/b/' is 2)
+            ingest_seq  INTEGER                 -- Increasing number in ingest order; see changes_since
             );
 
         This method will no more than 100 rows of data.
 
-        Provide any SQLite SQL in `sql` and named params in `params`. Examples:
+        Provide any SQLite SQL in `sql` and named params in `params`. Prefer parameterized
+        templates over inlined literals: a template that is reused with different `params`
+        is compiled once and served from the statement cache. Examples:
+
+        sql=`SELECT * FROM browser_history WHERE url LIKE :u ORDER BY visited_dt DESC`, params={"u": "%github.com%"}
+        sql=`SELECT domain, COUNT(*) FROM browser_history WHERE visited_dt >= :since GROUP BY domain`, params={"since": "2025-01-01"}
+        sql=`SELECT * FROM browser_history WHERE lower(title) LIKE lower(:t) ORDER BY visited_dt DESC`, params={"t": "%lemming%"}
+        sql=`SELECT path, COUNT(*) FROM browser_history WHERE registrable_domain = :d AND path LIKE :p GROUP BY path`, params={"d": "github.com", "p": "/simonw/%"}
+        """
+        return json.dumps(self._do_search(sql, params), indent=2)
+
+    def _try_query(
+        self, conn: Connection, sql: str, params: dict[str, Any] | None
+    ) -> list[Sequence[Any]] | dict[str, str]:
+        try:
+            return self._run_query(conn, sql, params)
+        except (sqlite3.Error, ValueError) as exc:
+            return {"error": str(exc)}
+
+    def _pool_of(self, db_file: pathlib.Path) -> list[Connection]:
+        """Return the reader pool for the generation file *db_file*, dropping any other."""
+        with self._pool_lock:
+            if self._pool_file == db_file:
+                return self._reader_pool
+        self._drop_readers()
+        with self._pool_lock:
+            self._pool_file = db_file
+            return self._reader_pool
 
-        `SELECT * FROM browser_history WHERE url LIKE :u ORDER BY visited_ms DESC`.
-        `SELECT * FROM browser_history WHERE lower(title) LIKE lower(title) LIKE lower('%lemming%') ORDER BY visited_ms DESC`.
+    @contextmanager
+    def _borrowed_readers(self, db_file: pathlib.Path, count: int) -> Iterator[list[Connection]]:
+        """Lend *count* read-only connections on the generation file *db_file* to one caller.
+
+        A reader is used by one batch at a time, so concurrent batches never share a read
+        transaction.  Idle readers are pooled; those of a replaced build are closed.
         """
-        return json.dumps(self._do_search(sql), indent=2)
+        pool = self._pool_of(db_file)
+        with self._pool_lock:
+            readers = [pool.pop() for _ in range(min(count, len(pool)))]
+        try:
+            while len(readers) < count:
+                readers.append(open_unified_db_reader(db_file, self.mmap_size))
+            yield readers
+        finally:
+            with self._pool_lock:
+                current = pool is self._reader_pool
+                keep = max(0, SEARCH_MANY_WORKERS - len(pool)) if current else 0
+                pool.extend(readers[:keep])
+            for reader in readers[keep:]:
+                reader.close()
+
+    def _search_parallel(self, db_file: pathlib.Path, batch: list[BatchQuery]) -> list[Any]:
+        workers = min(len(batch), SEARCH_MANY_WORKERS)
+        with self._borrowed_readers(db_file, workers) as readers:
+
+            def run_share(worker: int) -> list[Any]:
+                with read_snapshot(readers[worker]) as conn:
+                    share = batch[worker :: len(readers)]
+                    return [self._try_query(conn, sql, params) for sql, params in share]
+
+            results: list[Any] = [None] * len(batch)
+            with ThreadPoolExecutor(len(readers)) as pool:
+                for worker, share in enumerate(pool.map(run_share, range(len(readers)))):
+                    results[worker :: len(readers)] = share
+            return results
+
+    def _do_search_many(
+        self, queries: list[dict[str, Any] | str], parallel: bool = False
+    ) -> list[Any]:
+        batch = [_batch_query(query) for query in queries]
+        with self._pinned_db() as conn:
+            db_file = self._parallel_file(conn) if parallel and len(batch) > 1 else None
+            if db_file is not None:
+                return self._search_parallel(db_file, batch)
+            return self._search_snapshot(conn, batch)
+
+    def _parallel_file(self, conn: Connection) -> pathlib.Path | None:
+        """Return the generation file *conn* reads, for parallel readers of the same build.
+
+        Only a persisted database can be read through several connections.
+        """
+        return database_file(conn) if self.db_path is not None else None
+
+    def _search_snapshot(self, conn: Connection, batch: list[BatchQuery]) -> list[Any]:
+        with self._snapshot_lock, read_snapshot(conn):
+            return [self._try_query(conn, sql, params) for sql, params in batch]
+
+    def search_many(self, queries: list[dict[str, Any]], parallel: bool = False) -> str:
+        """
+        Run several `search` queries in one call and return all their results, in order.
+
+        `queries` is a list of {"sql": ..., "params": {...}} objects (params optional), using
+        the same schema and rules as `search`. Prefer this over several `search` calls for
+        related questions, e.g. a count, the top domains and the most recent items: the
+        queries see one consistent snapshot of the history. A failing query yields
+        {"error": message} in its slot instead of failing the batch. With `parallel` the
+        queries may run concurrently on separate read connections.
+        """
+        return json.dumps(self._do_search_many(list(queries), parallel), indent=2)
+
+    def _do_changes_since(self, token: str | None = None) -> dict[str, Any]:
+        with self._pinned_db() as conn:
+            return changes_since(conn, token, self.max_rows).as_dict()
+
+    def changes_since(self, token: str | None = None) -> str:
+        """
+        Return the history rows added since `token`, oldest first, with a new token.
+
+        Use this to follow new browsing activity instead of repeating
+        `ORDER BY visited_dt DESC` searches: call it once without a token to get the current
+        position, then pass the returned `token` to each later call. The result is
+        {"columns": [...], "rows": [[...], ...], "token": "...", "more": true/false}; when
+        `more` is true, call again straight away with the new token for the next page. A
+        token from a discarded build of the history is rejected; start again without one.
+        New visits only appear after the history is rebuilt (the server's refresh interval).
+        """
+        return json.dumps(self._do_changes_since(token), indent=2)
+
+    def _prepare(self) -> None:
+        """Build (or open) the unified database and, if enabled, the title embeddings."""
+        self._unified_db()
+        if self.embedding_model is not None:
+            self._semantic_index()
+
+    def _semantic_index(self) -> tuple[EmbeddingModel, TitleIndex]:
+        """Embed titles not embedded yet and return the model and loaded title index."""
+        with self._semantic_lock:
+            model = self._embedding_model()
+            if self._title_index is None:
+                with self._pinned_db() as conn:
+                    with unified_db_writer(conn, self.db_path) as writer:
+                        embed_new_titles(writer, model)
+                    self._title_index = TitleIndex.load(conn, model.model_id)
+            return model, self._title_index
+
+    def _embedding_model(self) -> EmbeddingModel:
+        model = self.embedding_model
+        if model is None:
+            raise ValueError("Semantic search is not enabled; configure an embedding model.")
+        if isinstance(model, str):
+            model = llm.get_embedding_model(model)  # type: ignore[no-untyped-call]
+            check_local_model(model, self.allow_remote_embeddings)
+            self.embedding_model = model
+        return model
+
+    def _do_semantic_search(self, query: str, k: int = 10) -> list[tuple[Any, ...]]:
+        model, index = self._semantic_index()
+        rows = []
+        with self._pinned_db() as conn:
+            for title, score in index.nearest(model.embed(query), k):
+                url, last_visited = conn.execute(
+                    "SELECT url, MAX(visited_dt) FROM browser_history WHERE title = ?", (title,)
+                ).fetchone()
+                rows.append((round(score, 4), title, url, last_visited))
+        return rows
+
+    def semantic_search(self, query: str, k: int = 10) -> str:
+        """
+        Find pages whose titles are closest in meaning to `query`, e.g. "pages about
+        container networking", even when they share no keywords with it.
+
+        Returns up to `k` [similarity, title, url, last_visited] rows, most similar first.
+        Only available when an embedding model is configured; use `search` with LIKE for
+        exact keyword matches.
+        """
+        return json.dumps(self._do_semantic_search(query, k), indent=2)
+
+    def _do_approx_stats(
+        self,
+        kind: str,
+        k: int = 10,
+        period: str = "month",
+        browser: str | None = None,
+        profile: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> list[tuple[str, int]]:
+        with self._pinned_db() as conn:
+            return approx_stats(conn, kind, k, period, browser, profile, since, until)
+
+    def approx_stats(
+        self,
+        kind: str,
+        k: int = 10,
+        period: str = "month",
+        browser: str | None = None,
+        profile: str | None = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> str:
+        """
+        Instant approximate answers to whole-history aggregate questions, from summaries
+        built when the history was loaded. Use `search` when exact numbers are needed.
+
+        kind is one of:
+          - "top_domains": the `k` most visited domains, as [domain, visits] pairs.
+          - "top_urls": the `k` most visited URLs, as [url, visits] pairs.
+          - "distinct_urls": distinct URLs visited per `period` ("day", "month", "year" or
+            "all"), as [period, count] pairs, optionally limited to visits on or after
+            `since` and before `until` (YYYY-MM-DD).
+
+        `browser` ("chrome", "firefox" or "safari") and `profile` restrict the answer to
+        one browser or profile. Visit counts may be overestimated slightly; distinct
+        counts are within a few percent.
+        """
+        rows = self._do_approx_stats(kind, k, period, browser, profile, since, until)
+        return json.dumps(rows, indent=2)
+
+    def tools(self) -> Iterator[llm.Tool]:
+        """Yield the toolbox's tools; ``semantic_search`` needs an embedding model."""
+        semantic = f"{type(self).__name__}_semantic_search"
+        for tool in super().tools():
+            if tool.name != semantic or self.embedding_model is not None:
+                yield tool
+
+    def __enter__(self) -> "BrowserHistory":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._release()
 
     def __del__(self):  # type: ignore
-        """Cleanup the unified database when the toolbox is destroyed."""
-        cleanup_unified_db()
+        """Release the unified database when the toolbox is destroyed."""
+        self._release()
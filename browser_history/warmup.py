@@ -0,0 +1,102 @@
+"""Background build of the unified database so async servers never block on it."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from collections.abc import Callable
+
+from .sqlite import BuildStats
+
+logger = logging.getLogger(__name__)
+
+# How long a query waits for a running build before answering with its progress instead.
+WARMUP_WAIT_SECONDS = 5.0
+
+
+class Warmup:
+    """Run *build* once in a daemon thread and report how far it got through *stats*.
+
+    A failed build is logged and still counts as finished: the next query retries the build
+    itself and surfaces the error to the caller.
+    """
+
+    def __init__(self, build: Callable[[], object], stats: BuildStats):
+        self.stats = stats
+        self.error: Exception | None = None
+        self._build = build
+        self._done = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Start the build unless it is already running or finished."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="bh-warmup", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            self._build()
+        except Exception as exc:
+            self.error = exc
+            logger.exception("Background build of the unified database failed")
+        finally:
+            self._done.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def percent_done(self) -> int:
+        if self.ready:
+            return 100
+        # A build reusing a persisted database jumps straight to done; never claim 100 early.
+        return min(99, int(self.stats.progress * 100))
+
+    def status(self) -> str:
+        return (
+            f"Browser history is warming up, {self.percent_done()}% done. "
+            "Retry the query in a few seconds."
+        )
+
+    async def wait(self, timeout: float = WARMUP_WAIT_SECONDS) -> bool:
+        """Start the build if needed and wait up to *timeout* seconds without blocking the loop.
+
+        Returns whether the build has finished.
+        """
+        self.start()
+        if self.ready:
+            return True
+        return await asyncio.to_thread(self._done.wait, timeout)
+
+
+class RefreshTimer:
+    """Call *refresh* every *interval* seconds in a daemon thread until :meth:`stop`.
+
+    A failed refresh is logged and tried again at the next tick; queries keep using the
+    previous build in the meantime.
+    """
+
+    def __init__(self, refresh: Callable[[], object], interval: float):
+        self.interval = interval
+        self._refresh = refresh
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="bh-refresh", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self._refresh()
+            except Exception:
+                logger.exception("Refreshing the unified database failed")
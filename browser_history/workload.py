@@ -0,0 +1,319 @@
+"""Adaptive indexing: learn which columns queries filter and sort on, and index hot patterns."""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import AbstractContextManager, nullcontext
+from pathlib import Path
+from sqlite3 import Connection, connect
+
+from .compression import history_table
+from .query_plan import explain_query_plan
+from .snapshots import current_generation, database_file
+
+logger = logging.getLogger(__name__)
+
+# Hits a filter/sort pattern needs before an index is built for it.
+DEFAULT_INDEX_THRESHOLD = 3
+# Upper bound on automatically created indexes, to bound build time and write amplification.
+MAX_AUTO_INDEXES = 8
+# Leading filter columns kept in a composite index (the sort columns follow them).
+MAX_FILTER_COLUMNS = 2
+AUTO_INDEX_PREFIX = "idx_bh_auto_"
+# Seconds between writes of the workload profile; pending counts are also written at exit.
+PROFILE_SAVE_INTERVAL = 30.0
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_CLAUSE_END = r"(?=\bgroup\s+by\b|\border\s+by\b|\blimit\b|\bhaving\b|\bunion\b|\bwindow\b|$)"
+_WHERE_RE = re.compile(r"\bwhere\b(.*?)" + _CLAUSE_END, re.DOTALL)
+_ORDER_RE = re.compile(r"\border\s+by\b(.*?)(?=\blimit\b|\bunion\b|$)", re.DOTALL)
+_IDENT_RE = re.compile(r"\b(?:\w+\.)?(\w+)\b")
+_TABLES = ("browser_history", "browser_history_packed")
+# ``FROM browser_history h`` / ``JOIN browser_history AS h``: plan steps name the table "h".
+_ALIAS_RE = re.compile(r"\b(?:from|join)\s+browser_history(?:_packed)?\s+(?:as\s+)?(\w+)")
+_NOT_ALIASES = frozenset(
+    "where join left right inner outer cross natural on using group order limit union "
+    "window having except intersect".split()
+)
+# Plan steps showing that no index served the query's filter or sort.
+_SCAN_STEP = re.compile(r"^SCAN (\w+)( USING COVERING)?")
+_UNSORTED_STEP = "USE TEMP B-TREE FOR ORDER"
+
+
+def _clause_columns(pattern: re.Pattern[str], sql: str, columns: set[str]) -> list[str]:
+    """Return the schema columns mentioned in the clause of *sql* matched by *pattern*."""
+    found: list[str] = []
+    for clause in pattern.findall(sql):
+        for name in _IDENT_RE.findall(clause):
+            if name in columns and name not in found:
+                found.append(name)
+    return found
+
+
+def extract_filter_columns(sql: str, columns: set[str]) -> tuple[list[str], list[str]]:
+    """Return the (WHERE, ORDER BY) columns of *sql* that belong to *columns*."""
+    text = _STRING_RE.sub("''", sql.lower())
+    return (
+        sorted(_clause_columns(_WHERE_RE, text, columns)),
+        _clause_columns(_ORDER_RE, text, columns),
+    )
+
+
+def pattern_key(where: list[str], order: list[str]) -> str:
+    """Serialise a filter/sort pattern as ``"where,cols|order,cols"``."""
+    return f"{','.join(where)}|{','.join(order)}"
+
+
+def index_columns(key: str) -> list[str]:
+    """Return the composite index columns for a pattern key: filters first, then sorts."""
+    where_part, order_part = key.split("|")
+    where = _split_columns(where_part)[:MAX_FILTER_COLUMNS]
+    return where + [c for c in _split_columns(order_part) if c not in where]
+
+
+def _split_columns(part: str) -> list[str]:
+    return [c for c in part.split(",") if c]
+
+
+def table_names(sql: str) -> set[str]:
+    """Return the names plan steps may use for the unified table in *sql*: its aliases too."""
+    aliases = _ALIAS_RE.findall(_STRING_RE.sub("''", sql.lower()))
+    return {*_TABLES, *(alias for alias in aliases if alias not in _NOT_ALIASES)}
+
+
+def _is_unindexed_step(step: str, tables: set[str]) -> bool:
+    if step.startswith(_UNSORTED_STEP):
+        return True
+    scan = _SCAN_STEP.match(step)
+    return scan is not None and scan[1].lower() in tables and not scan[2]
+
+
+def _has_unindexed_step(plan: list[str], tables: set[str]) -> bool:
+    """True when a step of *plan* scans one of *tables* or sorts without an index."""
+    return any(_is_unindexed_step(step, tables) for step in plan)
+
+
+class WorkloadProfile:
+    """Hit counts per filter/sort pattern, persisted as JSON so they survive restarts.
+
+    Hits are written at most every *save_interval* seconds; :meth:`flush` writes the rest.
+    """
+
+    def __init__(
+        self,
+        path: Path | None,
+        counts: dict[str, int] | None = None,
+        save_interval: float = PROFILE_SAVE_INTERVAL,
+    ):
+        self.path = path
+        self.counts: dict[str, int] = dict(counts or {})
+        self.save_interval = save_interval
+        self._saved_at = time.monotonic()
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path | None) -> WorkloadProfile:
+        """Load the profile at *path*; a missing or unreadable file starts empty."""
+        if path is None or not path.exists():
+            return cls(path)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable workload profile %s: %s", path, e)
+            return cls(path)
+        return cls(path, {str(k): int(v) for k, v in data.get("patterns", {}).items()})
+
+    def record(self, key: str) -> int:
+        """Count one hit for *key* and return the new count."""
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self._dirty = True
+            if time.monotonic() - self._saved_at >= self.save_interval:
+                self._save()
+            return self.counts[key]
+
+    def flush(self) -> None:
+        """Write hits not saved yet."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def hot_patterns(self, threshold: int) -> list[str]:
+        """Return patterns with at least *threshold* hits, most frequent first."""
+        with self._lock:
+            ranked = sorted(self.counts.items(), key=lambda item: -item[1])
+        return [key for key, count in ranked if count >= threshold]
+
+    def _save(self) -> None:
+        self._saved_at = time.monotonic()
+        self._dirty = False
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"patterns": self.counts}, indent=2), encoding="utf-8")
+        tmp.replace(self.path)
+
+
+def _existing_indexes(conn: Connection) -> dict[str, list[str]]:
+    """Return the column list of every index on ``browser_history``, keyed by index name."""
+    indexes = {}
+    for index in conn.execute(f"PRAGMA index_list({history_table(conn)})").fetchall():
+        info = conn.execute(f"PRAGMA index_info({index[1]})").fetchall()
+        indexes[index[1]] = [row[2] for row in info]
+    return indexes
+
+
+def _is_covered(columns: list[str], existing: dict[str, list[str]]) -> bool:
+    """True when an existing index already starts with *columns*."""
+    return any(index[: len(columns)] == columns for index in existing.values())
+
+
+def _should_create(columns: list[str], existing: dict[str, list[str]]) -> bool:
+    """True unless *columns* is empty, already indexed, or the auto-index budget is spent."""
+    auto = sum(1 for name in existing if name.startswith(AUTO_INDEX_PREFIX))
+    return bool(columns) and not _is_covered(columns, existing) and auto < MAX_AUTO_INDEXES
+
+
+def _table_columns(conn: Connection) -> set[str]:
+    return {row[1] for row in conn.execute("PRAGMA table_info(browser_history)").fetchall()}
+
+
+def make_adaptive_indexer(
+    profile_path: Path | None, threshold: int, db_path: Path | None
+) -> AdaptiveIndexer | None:
+    """Return an indexer backed by the profile at *profile_path*, or ``None`` if disabled."""
+    if profile_path is None:
+        return None
+    profile = WorkloadProfile.load(profile_path)
+    atexit.register(profile.flush)
+    return AdaptiveIndexer(profile, threshold, db_path)
+
+
+class AdaptiveIndexer:
+    """Record the filter/sort pattern of unindexed queries and index hot ones in the background.
+
+    With *db_path* (a persisted unified database served through read-only connections)
+    indexes are created on a separate writable connection to that file; otherwise they are
+    created on the query connection itself.
+    """
+
+    def __init__(
+        self,
+        profile: WorkloadProfile,
+        threshold: int = DEFAULT_INDEX_THRESHOLD,
+        db_path: Path | None = None,
+    ):
+        self.profile = profile
+        self.threshold = threshold
+        self.db_path = db_path
+        self._scheduled: set[str] = set()
+        # The build the profile's hot patterns were last applied to.
+        self._applied_to: Path | int | None = None
+        self._lock = threading.Lock()
+
+    def observe(
+        self,
+        conn: Connection,
+        sql: str,
+        params: dict[str, object] | None = None,
+        plan: list[str] | None = None,
+        lock: AbstractContextManager[object] | None = None,
+    ) -> None:
+        """Record *sql* if its plan shows an unindexed filter or sort.
+
+        *lock* guards the queries on *conn*; indexes created on *conn* itself hold it.
+        """
+        self._apply_profile_once(conn, lock)
+        key = self._unindexed_pattern(conn, sql, params, plan)
+        if key is not None and self.profile.record(key) >= self.threshold:
+            self.schedule(conn, [key], lock)
+
+    def _unindexed_pattern(
+        self,
+        conn: Connection,
+        sql: str,
+        params: dict[str, object] | None,
+        plan: list[str] | None,
+    ) -> str | None:
+        """Return the pattern key of *sql*, or ``None`` if an index already serves it."""
+        if plan is None:
+            plan = explain_query_plan(conn, sql, params)
+        if not _has_unindexed_step(plan, table_names(sql)):
+            return None
+        where, order = extract_filter_columns(sql, _table_columns(conn))
+        return pattern_key(where, order) if where or order else None
+
+    def schedule(
+        self, conn: Connection, keys: list[str], lock: AbstractContextManager[object] | None = None
+    ) -> threading.Thread | None:
+        """Create indexes for *keys* in a daemon thread, skipping ones already scheduled."""
+        with self._lock:
+            new = [key for key in keys if key not in self._scheduled]
+            self._scheduled.update(new)
+        if not new:
+            return None
+        thread = threading.Thread(
+            target=self._create_indexes,
+            args=(conn, new, lock),
+            name="bh-adaptive-index",
+            daemon=True,
+        )
+        thread.start()
+        return thread
+
+    def _apply_profile_once(
+        self, conn: Connection, lock: AbstractContextManager[object] | None
+    ) -> None:
+        """On first sight of a build, index the patterns already hot in the persisted profile.
+
+        A build is known by its file, so the several readers of one persisted generation
+        count as one; an in-memory build has a single connection.
+        """
+        build = database_file(conn) or id(conn)
+        with self._lock:
+            if self._applied_to == build:
+                return
+            self._applied_to = build
+            self._scheduled.clear()
+        self.schedule(conn, self.profile.hot_patterns(self.threshold), lock)
+
+    def _writer(self, conn: Connection) -> Connection:
+        """Return a connection that may create indexes on the unified database.
+
+        A persisted database is written through the generation file *conn* reads.
+        """
+        if self.db_path is None:
+            return conn
+        path = database_file(conn) or current_generation(self.db_path)
+        return connect(path, timeout=60, check_same_thread=False)
+
+    def _create_indexes(
+        self, conn: Connection, keys: list[str], lock: AbstractContextManager[object] | None
+    ) -> None:
+        writer = self._writer(conn)
+        # Only the query connection itself is shared with the queries.
+        guard = lock if lock is not None and writer is conn else nullcontext()
+        try:
+            with guard:
+                for key in keys:
+                    self._create_index(writer, index_columns(key))
+        finally:
+            if writer is not conn:
+                writer.close()
+
+    def _create_index(self, writer: Connection, columns: list[str]) -> None:
+        if not _should_create(columns, _existing_indexes(writer)):
+            return
+        name = AUTO_INDEX_PREFIX + "_".join(columns)
+        logger.info("Creating adaptive index %s on (%s)", name, ", ".join(columns))
+        writer.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {history_table(writer)}({', '.join(columns)})"
+        )
+        writer.commit()
@@ -0,0 +1,82 @@
+import asyncio
+import threading
+
+from browser_history.mcp_server import make_mcp
+from browser_history.sqlite import BuildStats
+from browser_history.warmup import RefreshTimer, Warmup
+
+
+def test_search_tool_accepts_named_params():
+    mcp = make_mcp(["chrome"], 10, whitelist={})
+    tools = {tool.name: tool for tool in asyncio.run(mcp.list_tools())}
+
+    schema = tools["search"].inputSchema
+    assert schema["required"] == ["sql"]
+    assert "params" in schema["properties"]
+
+
+def test_warmup_reports_progress_until_the_build_finishes():
+    stats = BuildStats(progress=0.42)
+    release = threading.Event()
+    warmup = Warmup(lambda: release.wait(5), stats)
+
+    assert asyncio.run(warmup.wait(0.01)) is False
+    assert "42% done" in warmup.status()
+
+    release.set()
+    assert asyncio.run(warmup.wait(5)) is True
+    assert warmup.percent_done() == 100
+    assert warmup.error is None
+
+
+def test_warmup_records_a_failed_build():
+    def build() -> None:
+        raise RuntimeError("boom")
+
+    warmup = Warmup(build, BuildStats())
+    assert asyncio.run(warmup.wait(5)) is True
+    assert isinstance(warmup.error, RuntimeError)
+
+
+def test_refresh_timer_keeps_going_after_a_failed_refresh():
+    calls: list[int] = []
+    done = threading.Event()
+
+    def refresh() -> None:
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        done.set()
+
+    timer = RefreshTimer(refresh, 0.01)
+    timer.start()
+    assert done.wait(5)
+    timer.stop()
+    assert len(calls) >= 2
+
+
+def test_metrics_endpoint_reports_tool_calls():
+    from starlette.testclient import TestClient
+
+    mcp = make_mcp(["chrome"], 10, whitelist={}, metrics=True)
+    asyncio.run(mcp.call_tool("search", {"sql": "SELECT 1 UNION ALL SELECT 2"}))
+
+    response = TestClient(mcp.streamable_http_app()).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'browser_history_tool_call_seconds_count{tool="search"} 1' in body
+    assert 'browser_history_tool_rows_total{tool="search"} 2' in body
+    assert "# TYPE browser_history_unified_db_memory_bytes gauge" in body
+
+
+def test_search_many_tool_returns_every_result():
+    mcp = make_mcp(["chrome"], 10, whitelist={})
+    queries = [{"sql": "SELECT :n", "params": {"n": 1}}, {"sql": "SELECT nope FROM nowhere"}]
+
+    _, structured = asyncio.run(mcp.call_tool("search_many", {"queries": queries}))
+
+    first, second = structured["result"]
+    assert first == [[1]]
+    assert "no such table" in second["error"]
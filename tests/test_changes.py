@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import json
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from browser_history.changes import Changes, ChangeToken, changes_since
+from browser_history.ingest import IngestCounters
+from browser_history.sqlite import _write_visits
+from browser_history.sqlite import build_unified_browser_history_db
+from browser_history.sqlite import cleanup_unified_db
+from browser_history.sqlite import get_or_create_unified_db
+from browser_history.sqlite import pin_unified_db
+from browser_history.sqlite import refresh_unified_db
+from browser_history.sqlite import unified_db_key
+from browser_history.toolbox import BrowserHistory
+
+fixture_path = Path(__file__).parent / "fixtures"
+chrome_db = fixture_path / "chrome-places.db"
+firefox_db = fixture_path / "firefox-places.db"
+
+
+def _visits(*urls: str, first_id: int = 1):
+    return [
+        (visit_id, url, None, None, "2025-01-01 00:00:00")
+        for visit_id, url in enumerate(urls, start=first_id)
+    ]
+
+
+def test_change_token_round_trip():
+    token = ChangeToken("0123abcd", 42)
+    assert ChangeToken.parse(token.encode()) == token
+    for malformed in ("", "42", "abc-", "abc-x1"):
+        with pytest.raises(ValueError, match="Malformed"):
+            ChangeToken.parse(malformed)
+
+
+def test_changes_since_pages_new_rows():
+    conn = build_unified_browser_history_db(None, [])
+    head = changes_since(conn, None, 2)
+    assert (head.rows, head.more) == ([], False)
+
+    urls = ["https://a.example/", "https://b.example/", "https://c.example/"]
+    _write_visits(conn, _visits(*urls), ("chrome", None), {}, IngestCounters())
+    first = changes_since(conn, head.token, 2)
+    assert [row[3] for row in first.rows] == urls[:2]
+    assert first.more
+    second = changes_since(conn, first.token, 2)
+    assert [row[3] for row in second.rows] == urls[2:]
+    assert not second.more
+
+    more = _visits("https://d.example/", first_id=4)
+    _write_visits(conn, more, ("chrome", None), {}, IngestCounters())
+    latest = changes_since(conn, second.token, 2)
+    assert [row[3] for row in latest.rows] == ["https://d.example/"]
+    assert changes_since(conn, latest.token, 2).rows == []
+    conn.close()
+
+
+def test_changes_since_without_row_limit_still_advances():
+    conn = build_unified_browser_history_db(None, [])
+    head = changes_since(conn, None, 0)
+    _write_visits(conn, _visits("https://a.example/"), ("chrome", None), {}, IngestCounters())
+    page = changes_since(conn, head.token, 0)
+    assert [row[3] for row in page.rows] == ["https://a.example/"]
+    assert not page.more and page.token != head.token
+    assert changes_since(conn, page.token, 0) == Changes([], page.token, False)
+    conn.close()
+
+
+def test_changes_since_rejects_token_of_other_build():
+    conn = build_unified_browser_history_db(None, [("chrome", chrome_db)])
+    other = build_unified_browser_history_db(None, [("chrome", chrome_db)])
+    token = changes_since(other, None, 10).token
+    with pytest.raises(ValueError, match="without a token"):
+        changes_since(conn, token, 10)
+    conn.close()
+    other.close()
+
+
+def test_rebuild_keeps_sequence_numbers(tmp_path: Path):
+    dest = tmp_path / "unified.db"
+    try:
+        conn = get_or_create_unified_db([("chrome", chrome_db)], db_path=dest)
+        token = changes_since(conn, None, 10).token
+        before = conn.execute("SELECT url, ingest_seq FROM browser_history").fetchall()
+        cleanup_unified_db()
+
+        # The rebuild finds the chrome visits again and only numbers firefox's as new.
+        sources = [("chrome", chrome_db), ("firefox", firefox_db)]
+        conn = get_or_create_unified_db(sources, db_path=dest)
+        after = conn.execute("SELECT url, ingest_seq FROM browser_history").fetchall()
+        assert set(before) <= set(after)
+        new = changes_since(conn, token, 10)
+        assert {row[1] for row in new.rows} == {"firefox"}
+        assert len(new.rows) == len(after) - len(before)
+    finally:
+        cleanup_unified_db()
+
+
+def test_in_memory_refresh_keeps_tokens_valid(tmp_path: Path):
+    source = tmp_path / "History"
+    shutil.copy(chrome_db, source)
+    sources = [("chrome", source)]
+    try:
+        token = changes_since(get_or_create_unified_db(sources), None, 10).token
+
+        history = sqlite3.connect(source)
+        history.execute(
+            "INSERT INTO urls (id, url, title, last_visit_time) VALUES (3, ?, 'New', 0)",
+            ("https://new.example/",),
+        )
+        history.execute("INSERT INTO visits (id, url, visit_time) VALUES (3, 3, 13400020000000000)")
+        history.commit()
+        history.close()
+        refresh_unified_db(sources)
+
+        with pin_unified_db(unified_db_key(sources, None)) as conn:
+            new = changes_since(conn, token, 10)
+        assert [row[3] for row in new.rows] == ["https://new.example/"]
+    finally:
+        cleanup_unified_db()
+
+
+def test_toolbox_changes_since(tmp_path: Path):
+    bh = BrowserHistory(["chrome"])
+    bh.sources = [("chrome", chrome_db)]
+    bh.db_path = tmp_path / "unified.db"
+    try:
+        start = json.loads(bh.changes_since())
+        assert start["rows"] == [] and start["columns"][0] == "ingest_seq"
+        assert json.loads(bh.changes_since(start["token"]))["rows"] == []
+    finally:
+        bh._release()
+        cleanup_unified_db()
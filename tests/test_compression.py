@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from browser_history.compression import (
+    PACKED_TABLE,
+    TextCodec,
+    history_table,
+    pack_unified_db,
+    train_zlib_dictionary,
+)
+from browser_history.ingest import IngestCounters
+from browser_history.query_plan import indexed_columns
+from browser_history.sqlite import (
+    RAW_URL_TABLE,
+    BuildOptions,
+    _raw_url_access,
+    _write_visits,
+    build_unified_browser_history_db,
+    open_unified_db_reader,
+    reclean_unified_db,
+)
+
+chrome_db = Path(__file__).parent / "fixtures" / "chrome-places.db"
+
+_ROWS = (
+    "SELECT ingest_seq, url, title, referrer_url, domain, path FROM browser_history "
+    "ORDER BY ingest_seq"
+)
+
+
+def _visits(count: int) -> list[tuple[int, str, str | None, str | None, str]]:
+    return [
+        (
+            i,
+            f"https://docs.example.com/guide/{i % 7}/install?utm=x&q={i}",
+            f"Installing the example toolkit, part {i % 7}",
+            "https://www.google.com/search?q=example+toolkit" if i % 2 else None,
+            "2025-01-01 00:00:00",
+        )
+        for i in range(1, count + 1)
+    ]
+
+
+def test_train_zlib_dictionary_puts_best_tokens_last():
+    samples = ["https://docs.example.com/a", "https://docs.example.com/b", "one-off"]
+    dictionary = train_zlib_dictionary(samples)
+    assert dictionary.endswith(b"https://docs.example.com/")
+    assert b"one-off" not in dictionary
+    assert len(train_zlib_dictionary(samples * 100, size=10)) <= 10
+
+
+def test_codec_round_trips_and_keeps_short_text():
+    codec = TextCodec("zlib", train_zlib_dictionary(["https://docs.example.com/guide/"] * 2))
+    packed = codec.pack("https://docs.example.com/guide/install")
+    assert isinstance(packed, bytes) and len(packed) < len("https://docs.example.com/guide/")
+    assert codec.unpack(packed) == "https://docs.example.com/guide/install"
+    assert codec.pack("a") == "a" and codec.unpack("a") == "a"
+    assert codec.pack(None) is None
+
+
+def test_pack_unified_db_is_transparent_to_queries():
+    conn = build_unified_browser_history_db(None, [])
+    _write_visits(conn, _visits(200), ("chrome", "Default"), {}, IngestCounters())
+    before = conn.execute(_ROWS).fetchall()
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(browser_history)")]
+
+    with _raw_url_access(conn):
+        pack_unified_db(conn, "zlib", RAW_URL_TABLE)
+        raw = conn.execute(f"SELECT typeof(url) FROM {RAW_URL_TABLE} LIMIT 1").fetchone()
+    assert raw == ("blob",)
+    assert conn.execute(_ROWS).fetchall() == before
+    # SELECT * sees the same columns as on an uncompressed database: no extra rowid.
+    assert [row[1] for row in conn.execute("PRAGMA table_info(browser_history)")] == columns
+    assert conn.execute(f"SELECT typeof(url), typeof(title) FROM {PACKED_TABLE}").fetchone() == (
+        "blob",
+        "blob",
+    )
+    assert history_table(conn) == PACKED_TABLE
+    assert {"domain", "visited_dt"} <= indexed_columns(conn)
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT url FROM browser_history WHERE domain = 'docs.example.com'"
+    ).fetchall()
+    assert "USING INDEX idx_bh_domain" in plan[0][3]
+
+    # Re-cleaning rewrites the packed rows in place, compressed again.
+    assert reclean_unified_db(conn, {}, {"docs.example.com": ["q"]}) == 200
+    url, stripped = conn.execute(
+        "SELECT url, stripped_qp FROM browser_history WHERE ingest_seq = 3"
+    ).fetchone()
+    assert (url, stripped) == ("https://docs.example.com/guide/3/install?q=3", "utm")
+    assert conn.execute(f"SELECT typeof(url) FROM {PACKED_TABLE} WHERE id = 3").fetchone() == (
+        "blob",
+    )
+    conn.close()
+
+
+def test_persisted_compressed_db_reads_through_reader(tmp_path: Path):
+    plain = build_unified_browser_history_db(None, [("chrome", chrome_db)])
+    dest = tmp_path / "unified.db"
+    options = BuildOptions(text_compression="zlib")
+    build_unified_browser_history_db(dest, [("chrome", chrome_db)], options=options).close()
+
+    reader = open_unified_db_reader(dest)
+    assert history_table(reader) == PACKED_TABLE
+    rows = reader.execute(_ROWS).fetchall()
+    assert len(rows) == 2
+    assert rows == plain.execute(_ROWS).fetchall()
+    assert history_table(plain) == "browser_history"
+    reader.close()
+    plain.close()
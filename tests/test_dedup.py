@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import shutil
+import sqlite3
+from pathlib import Path
+
+from browser_history.dedup import dedup_visits
+from browser_history.dedup import visit_key
+from browser_history.sqlite import BuildOptions
+from browser_history.sqlite import BuildStats
+from browser_history.sqlite import build_unified_browser_history_db
+
+fixture_path = Path(__file__).parent / "fixtures"
+chrome_db = fixture_path / "chrome-places.db"
+
+
+def _visits_db(rows: list[tuple[str, str, str, str]]) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE browser_history (browser TEXT, profile TEXT, url TEXT, visited_dt TEXT)"
+    )
+    conn.executemany(
+        "INSERT INTO browser_history (browser, profile, url, visited_dt) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+    return conn
+
+
+def test_dedup_keeps_the_profile_with_most_visits():
+    conn = _visits_db(
+        [
+            ("chrome", "laptop", "https://a.com/", "2025-01-01 10:00:00"),
+            ("chrome", "laptop", "https://a.com/", "2025-01-01 10:00:00"),
+            ("chrome", "desktop", "https://a.com/", "2025-01-01 10:00:00"),
+            # Different browser family or hour: not a duplicate.
+            ("firefox", "default", "https://a.com/", "2025-01-01 10:00:00"),
+            ("chrome", "desktop", "https://a.com/", "2025-01-01 11:00:00"),
+        ]
+    )
+
+    stats = dedup_visits(conn, batch_size=2)
+
+    assert stats.rows_removed == 1
+    assert stats.groups == 1
+    rows = conn.execute("SELECT browser, profile, visited_dt FROM browser_history").fetchall()
+    assert sorted(rows) == [
+        ("chrome", "desktop", "2025-01-01 11:00:00"),
+        ("chrome", "laptop", "2025-01-01 10:00:00"),
+        ("chrome", "laptop", "2025-01-01 10:00:00"),
+        ("firefox", "default", "2025-01-01 10:00:00"),
+    ]
+
+
+def test_visit_key_window_groups_nearby_hours():
+    url = "https://a.com/"
+    assert visit_key(url, "2025-01-01 10:00:00", "chrome") != visit_key(
+        url, "2025-01-01 11:00:00", "chrome"
+    )
+    assert visit_key(url, "2025-01-01 10:00:00", "chrome", 6) == visit_key(
+        url, "2025-01-01 11:00:00", "chrome", 6
+    )
+
+
+def test_build_dedups_synced_profiles(tmp_path: Path):
+    synced = tmp_path / "chrome-synced.db"
+    shutil.copy(chrome_db, synced)
+    stats = BuildStats()
+
+    conn = build_unified_browser_history_db(
+        None,
+        [("chrome", chrome_db), ("chrome", synced)],
+        stats=stats,
+        options=BuildOptions(dedup_window_hours=1),
+    )
+
+    assert stats.duplicates_removed == 2
+    assert stats.rows == 2
+    assert stats.dedup_bytes_freed >= 0
+    assert conn.execute("SELECT COUNT(DISTINCT profile) FROM browser_history").fetchone()[0] == 1
+    conn.close()
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from click.testing import CliRunner
+
+from browser_history.export import export_unified_db
+from browser_history.export import read_bhcol
+from browser_history.mcp_server import cli
+from browser_history.sqlite import build_unified_browser_history_db
+
+fixture_path = Path(__file__).parent / "fixtures"
+sources = [
+    ("chrome", fixture_path / "chrome-places.db"),
+    ("firefox", fixture_path / "firefox-places.db"),
+    ("safari", fixture_path / "safari-places.db"),
+]
+
+
+def _read_all(path: Path) -> dict[str, list[str | None]]:
+    merged: dict[str, list[str | None]] = {}
+    for block in read_bhcol(path):
+        for name, values in block.items():
+            merged.setdefault(name, []).extend(values)
+    return merged
+
+
+def test_export_bhcol_round_trips_rows(tmp_path: Path):
+    conn = build_unified_browser_history_db(None, sources)
+    expected = conn.execute("SELECT * FROM browser_history ORDER BY rowid").fetchall()
+
+    stats = export_unified_db(conn, tmp_path, fmt="bhcol", batch_size=4)
+
+    assert stats.rows == len(expected) == 6
+    assert stats.files == [tmp_path / "part-00000.bhcol"]
+    columns = _read_all(stats.files[0])
+    assert list(columns) == [d[1] for d in conn.execute("PRAGMA table_info(browser_history)")]
+    rows = list(zip(*columns.values()))
+    assert rows == [tuple(None if v is None else str(v) for v in row) for row in expected]
+    conn.close()
+
+
+def test_export_partitions_by_browser(tmp_path: Path):
+    conn = build_unified_browser_history_db(None, sources)
+
+    stats = export_unified_db(conn, tmp_path, fmt="bhcol", partition_by="browser", batch_size=5)
+
+    assert sorted(p.parent.name for p in stats.files) == [
+        "browser=chrome",
+        "browser=firefox",
+        "browser=safari",
+    ]
+    for path in stats.files:
+        browser = path.parent.name.split("=")[1]
+        assert set(_read_all(path)["browser"]) == {browser}
+    conn.close()
+
+
+def test_export_partitions_by_date(tmp_path: Path):
+    conn = build_unified_browser_history_db(None, sources)
+    days = {row[0] for row in conn.execute("SELECT substr(visited_dt, 1, 10) FROM browser_history")}
+
+    stats = export_unified_db(conn, tmp_path, fmt="bhcol", partition_by="date")
+
+    assert {p.parent.name for p in stats.files} == {f"date={day}" for day in days}
+    assert sum(len(_read_all(p)["url"]) for p in stats.files) == stats.rows
+    conn.close()
+
+
+def test_read_bhcol_rejects_other_files(tmp_path: Path):
+    path = tmp_path / "x.bhcol"
+    path.write_bytes(b"not a bhcol file")
+    with pytest.raises(ValueError):
+        list(read_bhcol(path))
+
+
+def test_export_parquet(tmp_path: Path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    conn = build_unified_browser_history_db(None, sources)
+
+    stats = export_unified_db(conn, tmp_path, fmt="parquet", batch_size=4)
+
+    table = pq.read_table(stats.files[0])
+    assert table.num_rows == 6
+    assert table.num_rows == stats.rows
+    assert str(table.schema.field("path_depth").type) == "int64"
+    assert str(table.schema.field("ingest_seq").type) == "int64"
+    assert str(table.schema.field("visited_dt").type) == "timestamp[us, tz=UTC]"
+    assert str(table.schema.field("url").type) == "string"
+    first = conn.execute("SELECT visited_dt FROM browser_history ORDER BY rowid").fetchone()[0]
+    assert table.column("visited_dt")[0].as_py().strftime("%Y-%m-%d %H:%M:%S") == first
+    conn.close()
+
+
+def test_cli_export_subcommand(tmp_path: Path):
+    conn = build_unified_browser_history_db(None, sources)
+    with (
+        patch("browser_history.mcp_server.load_whitelist", return_value={}),
+        patch("browser_history.mcp_server._open_unified_db", return_value=conn) as mock_open,
+        patch("browser_history.mcp_server.cleanup_unified_db"),
+    ):
+        result = CliRunner().invoke(
+            cli,
+            ["--sources", "chrome", "export", str(tmp_path), "--format", "bhcol"],
+        )
+
+    assert result.exit_code == 0, result.output
+    assert "Exported 6 rows to 1 file(s)" in result.output
+    assert mock_open.call_args.kwargs["sources"] == ("chrome",)
+    assert (tmp_path / "part-00000.bhcol").exists()
+    conn.close()
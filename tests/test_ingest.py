@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import shutil
+import sqlite3
+from pathlib import Path
+
+from browser_history.ingest import StageCounter, read_source, window_start_id
+from browser_history.retention import IngestWindow
+from browser_history.sqlite import build_unified_browser_history_db
+
+fixture_path = Path(__file__).parent / "fixtures"
+safari_db = fixture_path / "safari-places.db"
+firefox_db = fixture_path / "firefox-places.db"
+
+
+def _attached(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.execute("ATTACH DATABASE ? AS src", (f"file:{path}?mode=ro",))
+    return conn
+
+
+def test_read_source_batches_resume_after_watermark():
+    conn = _attached(safari_db)
+    counter = StageCounter()
+
+    batches = list(read_source(conn, "safari", "src", None, counter, batch_size=1))
+    assert [[visit[0] for visit in batch] for batch in batches] == [[1], [2]]
+    assert counter.rows == 2
+
+    resumed = list(read_source(conn, "safari", "src", None, StageCounter(), after_id=1))
+    assert [visit[1] for batch in resumed for visit in batch] == ["https://webkit.org/"]
+    # The fixture's visits are at 07:06:40 and 07:15:00 UTC on 2025-01-31.
+    window = IngestWindow(since=1_738_307_400.0)
+    windowed = list(read_source(conn, "safari", "src", window, StageCounter()))
+    assert [visit[0] for batch in windowed for visit in batch] == [2]
+    conn.close()
+
+
+def test_window_start_is_found_through_the_time_index():
+    conn = _attached(firefox_db)
+    statements: list[str] = []
+    conn.set_trace_callback(statements.append)
+    # The fixture's visits are at 1725750000 and 1725755000.
+    assert window_start_id(conn, "firefox", "src", None) == -1
+    assert window_start_id(conn, "firefox", "src", IngestWindow(since=1_725_751_000.0)) == 1
+    assert window_start_id(conn, "firefox", "src", IngestWindow(since=1_800_000_000.0)) is None
+    plan = conn.execute("EXPLAIN QUERY PLAN " + statements[-1]).fetchall()
+    assert "moz_historyvisits_dateindex" in plan[0][3]
+
+    window = IngestWindow(since=1_725_751_000.0)
+    rows = [visit[0] for batch in read_source(conn, "firefox", "src", window, StageCounter())
+            for visit in batch]
+    assert rows == [2]
+    conn.close()
+
+
+def test_safari_redirect_source_is_the_referrer(tmp_path: Path):
+    db = tmp_path / "History.db"
+    shutil.copy(safari_db, db)
+    conn = sqlite3.connect(db)
+    conn.execute(
+        """INSERT INTO history_items (id, url, visit_count, daily_visit_counts,
+                                      should_recompute_derived_visit_counts)
+           VALUES (3, 'https://apple.com/', 1, x'', 0)"""
+    )
+    conn.execute(
+        "INSERT INTO history_visits (id, history_item, visit_time, title, redirect_source) "
+        "VALUES (3, 3, 760000900, 'Apple', 1)"
+    )
+    conn.commit()
+    conn.close()
+
+    unified = build_unified_browser_history_db(None, [("safari", db)])
+    rows = unified.execute(
+        "SELECT url, referrer_url, referrer_domain FROM browser_history ORDER BY rowid"
+    ).fetchall()
+    unified.close()
+    assert rows == [
+        ("https://www.apple.com/", None, None),
+        ("https://webkit.org/", None, None),
+        ("https://apple.com/", "https://www.apple.com/", "www.apple.com"),
+    ]
@@ -1,7 +1,8 @@
 import logging
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
-from browser_history.mcp_server import cli, get_version, _format_table
+from browser_history.mcp_server import cli, get_version
+from browser_history.output import format_table
 
 
 def test_cli_log_level_debug():
@@ -117,7 +118,7 @@ def test_cli_query_error():
 
 
 def test_format_table_basic():
-    output = _format_table(["name", "val"], [("alice", 1), ("bob", 2)])
+    output = format_table(["name", "val"], [("alice", 1), ("bob", 2)])
     lines = output.split("\n")
     assert len(lines) == 4  # header + separator + 2 data rows
     assert lines[0] == "name   val"
@@ -127,7 +128,7 @@ def test_format_table_basic():
 
 
 def test_format_table_columns_widen_for_data():
-    output = _format_table(["a", "b"], [("longvalue", "x")])
+    output = format_table(["a", "b"], [("longvalue", "x")])
     lines = output.split("\n")
     # Column 'a' should widen to fit 'longvalue' (9 chars)
     assert lines[0] == "a          b"
@@ -136,14 +137,14 @@ def test_format_table_columns_widen_for_data():
 
 
 def test_format_table_none_values():
-    output = _format_table(["col"], [(None,), ("ok",)])
+    output = format_table(["col"], [(None,), ("ok",)])
     lines = output.split("\n")
     assert lines[2].strip() == ""  # None renders as empty string
     assert lines[3].strip() == "ok"
 
 
 def test_format_table_single_row():
-    output = _format_table(["id"], [("only",)])
+    output = format_table(["id"], [("only",)])
     lines = output.split("\n")
     assert len(lines) == 3  # header + separator + 1 data row
     assert lines[0] == "id  "
@@ -171,3 +172,55 @@ def test_cli_query_single_row_says_row_not_rows():
         assert result.exit_code == 0
         assert "(1 row)" in result.output
         assert "(1 rows)" not in result.output
+
+
+def test_cli_query_binds_named_params():
+    runner = CliRunner()
+    with (
+        patch("browser_history.mcp_server.BrowserHistory") as mock_bh_cls,
+        patch("browser_history.mcp_server.load_whitelist", return_value={}),
+        patch("browser_history.mcp_server.get_or_create_unified_db") as mock_get_db,
+        patch("browser_history.mcp_server.run_unified_query_with_headers") as mock_query,
+        patch("browser_history.mcp_server.cleanup_unified_db"),
+    ):
+        mock_bh = MagicMock()
+        mock_bh.sources = []
+        mock_bh_cls.return_value = mock_bh
+        mock_get_db.return_value = MagicMock()
+        mock_query.return_value = (["x"], [("one",)])
+
+        result = runner.invoke(
+            cli, ["--query", "SELECT :a, :b", "--param", "a=1", "--param", "b=x=y"]
+        )
+
+        assert result.exit_code == 0
+        assert mock_query.call_args.args[2] == {"a": "1", "b": "x=y"}
+
+
+def test_cli_query_rejects_malformed_param():
+    runner = CliRunner()
+    result = runner.invoke(cli, ["--query", "SELECT 1", "--param", "novalue"])
+    assert result.exit_code == 2
+    assert "expected NAME=VALUE" in result.output
+
+
+def test_cli_query_streams_csv():
+    runner = CliRunner()
+    with (
+        patch("browser_history.mcp_server.BrowserHistory") as mock_bh_cls,
+        patch("browser_history.mcp_server.load_whitelist", return_value={}),
+        patch("browser_history.mcp_server.get_or_create_unified_db") as mock_get_db,
+        patch("browser_history.mcp_server.iter_unified_query_with_headers") as mock_iter,
+        patch("browser_history.mcp_server.cleanup_unified_db"),
+    ):
+        mock_bh = MagicMock()
+        mock_bh.sources = []
+        mock_bh_cls.return_value = mock_bh
+        mock_get_db.return_value = MagicMock()
+        mock_iter.return_value = (["name", "val"], iter([("alice", 1), ("bob", 2)]))
+
+        result = runner.invoke(cli, ["--query", "SELECT 1", "--format", "csv", "--max-rows", "0"])
+
+        assert result.exit_code == 0
+        assert result.output == "name,val\nalice,1\nbob,2\n"
+        assert mock_iter.call_args.kwargs["max_rows"] == 0
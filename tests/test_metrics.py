@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from starlette.testclient import TestClient
+
+from browser_history.mcp_server import _batch_rows, _feed_rows, _run_tool, make_mcp
+from browser_history.metrics import ServerMetrics
+from browser_history.sqlite import BuildStats
+from browser_history.warmup import Warmup
+
+
+def test_track_counts_errors_and_timeouts():
+    metrics = ServerMetrics()
+    with pytest.raises(ValueError):
+        with metrics.track("search"):
+            raise ValueError("bad sql")
+    with metrics.track("search") as call:
+        call.timed_out = True
+
+    body = metrics.render()
+
+    assert 'browser_history_tool_errors_total{tool="search"} 1' in body
+    assert 'browser_history_tool_timeouts_total{tool="search"} 1' in body
+    assert 'browser_history_tool_call_seconds_count{tool="search"} 2' in body
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = ServerMetrics()
+    with metrics.track("search"):
+        pass
+
+    body = metrics.render([("browser_history_unified_db_rows", "gauge", "Rows.", 6)])
+
+    assert 'browser_history_tool_call_seconds_bucket{tool="search",le="0.005"} 1' in body
+    assert 'browser_history_tool_call_seconds_bucket{tool="search",le="+Inf"} 1' in body
+    assert "browser_history_unified_db_rows 6" in body
+
+
+def test_metrics_route_serves_gauges():
+    app = make_mcp(["chrome"], 10, whitelist={}, metrics=True).streamable_http_app()
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200
+    assert "browser_history_unified_db_memory_bytes" in response.text
+
+
+def test_run_tool_counts_rows_reported_by_each_tool():
+    warmup = Warmup(lambda: None, BuildStats())
+    metrics = ServerMetrics()
+    batch = [[(1,), (2,)], {"error": "no such column"}, [(3,)]]
+    feed = {"columns": ["ingest_seq"], "rows": [[7], [8]], "token": "a-8", "more": False}
+
+    async def run() -> None:
+        assert await _run_tool("search_many", warmup, metrics, lambda: batch, rows=_batch_rows)
+        assert await _run_tool("changes_since", warmup, metrics, lambda: feed, rows=_feed_rows)
+        assert await _run_tool("search", warmup, metrics, lambda: [(1,)]) == [(1,)]
+
+    asyncio.run(run())
+    body = metrics.render()
+    assert 'browser_history_tool_rows_total{tool="search_many"} 3' in body
+    assert 'browser_history_tool_rows_total{tool="changes_since"} 2' in body
+    assert 'browser_history_tool_rows_total{tool="search"} 1' in body
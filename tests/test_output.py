@@ -0,0 +1,45 @@
+import io
+import json
+
+from browser_history.output import write_csv, write_jsonl, write_sampled_table, write_tsv
+
+HEADERS = ["name", "val"]
+ROWS = [("alice", 1), ("bob", None), ("carol, jr", 3)]
+
+
+def test_write_csv_quotes_and_blanks_none():
+    out = io.StringIO()
+    assert write_csv(HEADERS, iter(ROWS), out) == 3
+    assert out.getvalue() == 'name,val\nalice,1\nbob,\n"carol, jr",3\n'
+
+
+def test_write_tsv():
+    out = io.StringIO()
+    assert write_tsv(HEADERS, iter(ROWS), out) == 3
+    assert out.getvalue().splitlines()[0] == "name\tval"
+    assert out.getvalue().splitlines()[3] == "carol, jr\t3"
+
+
+def test_write_jsonl_one_object_per_row():
+    out = io.StringIO()
+    assert write_jsonl(HEADERS, iter(ROWS), out) == 3
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert lines[1] == {"name": "bob", "val": None}
+
+
+def test_write_sampled_table_sizes_columns_from_sample():
+    out = io.StringIO()
+    rows = iter([("a", 1), ("bb", 2), ("a-much-longer-value", 3)])
+    assert write_sampled_table(HEADERS, rows, out, sample_size=2) == 3
+    lines = out.getvalue().splitlines()
+    assert lines[0] == "name  val"
+    assert lines[1] == "----  ---"
+    assert lines[2] == "a     1  "
+    assert lines[4] == "a-much-longer-value  3  "
+    assert lines[-1] == "(3 rows)"
+
+
+def test_write_sampled_table_no_results():
+    out = io.StringIO()
+    assert write_sampled_table(HEADERS, iter([]), out) == 0
+    assert out.getvalue() == "(no results)\n"
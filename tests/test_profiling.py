@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from browser_history.profiling import QueryProfile
+from browser_history.profiling import SlowQueryLog
+from browser_history.profiling import add_query_hook
+from browser_history.profiling import redact_sql
+from browser_history.profiling import remove_query_hook
+from browser_history.sqlite import build_unified_browser_history_db
+from browser_history.sqlite import iter_unified_query_with_headers
+from browser_history.sqlite import run_unified_query_with_headers
+
+fixture_path = Path(__file__).parent / "fixtures"
+
+
+def test_redact_sql_replaces_literals_only():
+    sql = "SELECT t1.url FROM browser_history t1 WHERE url LIKE '%it''s%' AND id > 42 LIMIT 1.5e3"
+    assert redact_sql(sql) == (
+        "SELECT t1.url FROM browser_history t1 WHERE url LIKE ? AND id > ? LIMIT ?"
+    )
+
+
+def test_hooks_receive_query_profiles():
+    conn = build_unified_browser_history_db(None, [("chrome", fixture_path / "chrome-places.db")])
+    seen: list[QueryProfile] = []
+    add_query_hook(seen.append)
+    try:
+        _, rows = run_unified_query_with_headers(
+            conn, "SELECT url FROM browser_history WHERE domain = :d", {"d": "x.com"}
+        )
+    finally:
+        remove_query_hook(seen.append)
+
+    (profile,) = seen
+    assert profile.rows == len(rows)
+    assert profile.seconds > 0
+    assert profile.plan and "idx_bh_domain" in " ".join(profile.plan)
+    conn.close()
+
+
+def test_plan_is_explained_only_when_read(tmp_path: Path):
+    conn = build_unified_browser_history_db(None, [("chrome", fixture_path / "chrome-places.db")])
+    seen: list[QueryProfile] = []
+    fast = SlowQueryLog(tmp_path / "slow.jsonl", threshold_ms=60_000)
+    add_query_hook(fast)
+    add_query_hook(seen.append)
+    try:
+        run_unified_query_with_headers(conn, "SELECT url FROM browser_history", None)
+    finally:
+        remove_query_hook(seen.append)
+        remove_query_hook(fast)
+
+    # The fast query was not logged, so its plan was never explained.
+    (profile,) = seen
+    assert not (tmp_path / "slow.jsonl").exists()
+    assert profile._plan is None
+    assert profile.plan[0].startswith("SCAN browser_history")
+    conn.close()
+
+
+def test_slow_query_log_writes_redacted_json_lines(tmp_path: Path):
+    log = SlowQueryLog(tmp_path / "slow.jsonl", threshold_ms=10)
+    log(QueryProfile("SELECT 1 WHERE 'secret' = 'x'", seconds=0.001))
+    log(QueryProfile("SELECT * FROM t WHERE url = 'secret'", seconds=0.5, rows=3, vm_steps=9000))
+
+    (line,) = (tmp_path / "slow.jsonl").read_text().splitlines()
+    record = json.loads(line)
+    assert record["sql"] == "SELECT * FROM t WHERE url = ?"
+    assert record["rows"] == 3
+    assert record["vm_steps"] == 9000
+    assert record["ms"] == 500.0
+
+
+def test_streamed_queries_are_profiled_when_their_rows_run_out():
+    conn = build_unified_browser_history_db(None, [("chrome", fixture_path / "chrome-places.db")])
+    seen: list[QueryProfile] = []
+    add_query_hook(seen.append)
+    try:
+        headers, rows = iter_unified_query_with_headers(
+            conn, "SELECT url FROM browser_history", max_rows=0, batch_size=1
+        )
+        assert headers == ["url"] and seen == []
+        assert len(list(rows)) == 2
+    finally:
+        remove_query_hook(seen.append)
+
+    (profile,) = seen
+    assert profile.rows == 2 and profile.seconds > 0
+    conn.close()
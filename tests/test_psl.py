@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import pytest
+
+from browser_history.psl import compile_rules, parse_rules, registrable_domain, suffix_labels
+
+
+@pytest.mark.parametrize(
+    "host, expected",
+    [
+        ("mail.google.com", "google.com"),
+        ("google.com", "google.com"),
+        ("news.bbc.co.uk", "bbc.co.uk"),
+        ("WWW.Example.ORG.", "example.org"),
+        ("simonw.github.io", "simonw.github.io"),
+        ("a.b.foo.kawasaki.jp", "b.foo.kawasaki.jp"),
+        ("a.city.kawasaki.jp", "city.kawasaki.jp"),
+        ("co.uk", "co.uk"),
+        ("www.city.osaka.jp", "city.osaka.jp"),
+        ("foo.pref.hokkaido.jp", "pref.hokkaido.jp"),
+        ("www.gov.on.ca", "gov.on.ca"),
+        ("shop.example.qc.ca", "example.qc.ca"),
+        ("foo.bar.xn--55qx5d.cn", "bar.xn--55qx5d.cn"),
+        ("localhost", "localhost"),
+        ("192.168.1.10", "192.168.1.10"),
+        ("::1", "::1"),
+    ],
+)
+def test_registrable_domain(host, expected):
+    assert registrable_domain(host) == expected
+
+
+def test_suffix_labels_defaults_to_tld():
+    assert suffix_labels(["www", "example", "unlisted"]) == 1
+    assert suffix_labels(["x", "y", "ck"]) == 2
+    assert suffix_labels(["www", "ck"]) == 1
+
+
+def test_parse_rules_skips_comments_and_encodes_idn():
+    text = "// ICANN\n\ncom\n*.ck  // wildcard\n!www.ck\n公司.cn\n"
+    rules = list(parse_rules(text))
+    assert rules == ["com", "*.ck", "!www.ck", "公司.cn"]
+    trie = compile_rules(rules)
+    assert "xn--55qx5d" in trie.children["cn"].children
+    assert trie.children["ck"].children["www"].exception
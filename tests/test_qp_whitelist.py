@@ -1,4 +1,6 @@
 from __future__ import annotations
+import os
+
 import pytest
 
 from pathlib import Path
@@ -7,7 +9,9 @@ from browser_history.qp_whitelist import (
     load_whitelist,
     process_url,
     _match_domain,
+    changed_domains,
     default_query_param_whitelist,
+    WhitelistWatcher,
 )
 
 
@@ -104,3 +108,39 @@ def test_process_url_domain_not_in_whitelist_strips_all():
     result = process_url("https://unknown.com/page?secret=token&id=5", wl)
     assert "?" not in result["url"]
     assert result["stripped_qp"] == "id,secret"
+
+
+def test_changed_domains_follows_parent_rules():
+    old = {"google.com": ["q"]}
+    new = {"google.com": ["q", "tbm"], "bing.com": ["q"]}
+    domains = ["www.google.com", "bing.com", "example.com", "maps.google.com"]
+    assert changed_domains(domains, old, new) == ["www.google.com", "bing.com", "maps.google.com"]
+    assert changed_domains(domains, old, old) == []
+
+
+def test_whitelist_watcher_reloads_on_change(tmp_path: Path):
+    path = tmp_path / "wl.yaml"
+    path.write_text("example.com:\n  - q\n")
+    watcher = WhitelistWatcher(path)
+    assert watcher.poll() is None
+
+    path.write_text("example.com:\n  - q\n  - page\n")
+    os.utime(path, ns=(0, path.stat().st_mtime_ns + 1_000_000))
+    assert watcher.poll() == {"example.com": ["q", "page"]}
+    assert watcher.poll() is None
+
+
+@pytest.mark.parametrize(
+    "url, scheme, path, registrable, depth",
+    [
+        ("https://mail.google.com/mail/u/0/?tab=rm", "https", "/mail/u/0/", "google.com", 3),
+        ("http://news.bbc.co.uk", "http", "", "bbc.co.uk", 0),
+        ("file:///Users/me/notes.txt", "file", "/Users/me/notes.txt", "", 3),
+    ],
+)
+def test_process_url_decomposition(url, scheme, path, registrable, depth):
+    result = process_url(url, {})
+    assert result["scheme"] == scheme
+    assert result["path"] == path
+    assert result["registrable_domain"] == registrable
+    assert result["path_depth"] == depth
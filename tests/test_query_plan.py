@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from browser_history.query_plan import (
+    QueryGuard,
+    QueryRejectedError,
+    check_query,
+    estimate_cost,
+    indexed_columns,
+    text_columns,
+    make_query_guard,
+    rewrite_like_prefixes,
+)
+from browser_history.sqlite import build_unified_browser_history_db
+
+fixture_path = Path(__file__).parent / "fixtures"
+sources = [
+    ("chrome", fixture_path / "chrome-places.db"),
+    ("firefox", fixture_path / "firefox-places.db"),
+    ("safari", fixture_path / "safari-places.db"),
+]
+
+
+@pytest.fixture
+def conn():
+    c = build_unified_browser_history_db(None, sources)
+    yield c
+    c.close()
+
+
+def test_estimate_cost_weights_plan_steps():
+    assert estimate_cost(["SCAN browser_history"], 1000) == 1000
+    assert estimate_cost(["SCAN browser_history USING COVERING INDEX idx_bh_time"], 1000) == 250
+    search = "SEARCH browser_history USING INDEX idx_bh_url (url>? AND url<?)"
+    assert estimate_cost([search], 1000) == 10
+    assert estimate_cost(["SCAN browser_history", "USE TEMP B-TREE FOR ORDER BY"], 1000) == 1100
+    assert estimate_cost(["SCAN CONSTANT ROW"], 1000) == 0
+
+
+def test_make_query_guard_disabled_by_default():
+    assert make_query_guard(None, False) is None
+    assert make_query_guard(10, False) == QueryGuard(max_cost=10, rewrite_like=False)
+
+
+def test_indexed_columns(conn):
+    assert {"visited_dt", "url", "title"} <= indexed_columns(conn)
+
+
+def test_text_columns_follow_affinity(conn):
+    columns = text_columns(conn)
+    assert {"url", "title", "domain", "path"} <= columns
+    assert not {"visited_dt", "path_depth", "ingest_seq"} & columns
+
+
+def test_check_query_rejects_full_scan_with_advice(conn):
+    with pytest.raises(QueryRejectedError) as exc:
+        check_query(conn, "SELECT * FROM browser_history", None, QueryGuard(max_cost=1))
+    message = str(exc.value)
+    assert "SCAN browser_history" in message
+    assert "visited_dt" in message
+
+
+def test_check_query_allows_indexed_search(conn):
+    checked = check_query(
+        conn,
+        "SELECT url FROM browser_history WHERE url = :u",
+        {"u": "https://example.com/"},
+        QueryGuard(max_cost=1),
+    )
+    assert any(step.startswith("SEARCH") for step in checked.plan)
+
+
+def test_rewrite_like_prefix_uses_index_and_keeps_results(conn):
+    sql = "SELECT url FROM browser_history WHERE url LIKE 'HTTPS://news%' ORDER BY url"
+    checked = check_query(conn, sql, None, QueryGuard(rewrite_like=True))
+
+    assert "url >= 'HTTPS://NEWS' AND url < 'https://newt'" in checked.sql
+    assert any(step.startswith("SEARCH") and "idx_bh_url" in step for step in checked.plan)
+    assert conn.execute(checked.sql).fetchall() == conn.execute(sql).fetchall()
+    assert conn.execute(checked.sql).fetchall() == [("https://news.ycombinator.com/",)]
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT url FROM browser_history WHERE visited_dt LIKE '2024%' ORDER BY url",
+        "SELECT url FROM browser_history WHERE ingest_seq LIKE '1%' ORDER BY url",
+    ],
+)
+def test_rewrite_like_skips_numeric_affinity_columns(conn, sql):
+    checked = check_query(conn, sql, None, QueryGuard(rewrite_like=True))
+
+    assert checked.sql == sql
+    assert conn.execute(checked.sql).fetchall() == conn.execute(sql).fetchall() != []
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "SELECT * FROM browser_history WHERE domain LIKE 'abc%'",
+        "SELECT * FROM browser_history WHERE url LIKE '%abc%'",
+        "SELECT * FROM browser_history WHERE url LIKE 'a_c%'",
+        "SELECT * FROM browser_history WHERE url LIKE 'abc%' ESCAPE '\\'",
+    ],
+)
+def test_rewrite_like_prefixes_leaves_other_patterns(sql):
+    assert rewrite_like_prefixes(sql, {"url", "title", "visited_dt"}) == sql
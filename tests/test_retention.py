@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from browser_history.retention import IngestWindow
+from browser_history.retention import make_ingest_window
+from browser_history.retention import parse_since
+from browser_history.retention import window_clause
+from browser_history.sqlite import BuildOptions
+from browser_history.sqlite import build_unified_browser_history_db
+
+fixture_path = Path(__file__).parent / "fixtures"
+sources = [
+    ("chrome", fixture_path / "chrome-places.db"),
+    ("firefox", fixture_path / "firefox-places.db"),
+    ("safari", fixture_path / "safari-places.db"),
+]
+DAY = 86_400
+
+
+def test_make_ingest_window_defaults_to_everything():
+    assert make_ingest_window() is None
+
+
+def test_make_ingest_window_later_cutoff_wins():
+    now = parse_since("2025-03-01")
+    window = make_ingest_window(since="2025-01-01", retention_days=30, now=now)
+    assert window == IngestWindow(since=now - 30 * DAY)
+
+    window = make_ingest_window(since="2025-02-25", retention_days=30, now=now)
+    assert window is not None and window.since == parse_since("2025-02-25")
+
+
+def test_make_ingest_window_sampling():
+    window = make_ingest_window(sample_after_days=7, sample_every=5, now=10 * DAY)
+    assert window == IngestWindow(since=None, sample_before=3 * DAY, sample_every=5)
+
+
+def test_window_clause_uses_native_visit_times():
+    window = IngestWindow(since=0.0)
+    assert window_clause("firefox", window) == ("WHERE h.visit_date >= ?", (0,))
+    assert window_clause("chrome", window) == ("WHERE v.visit_time >= ?", (11_644_473_600_000_000,))
+    assert window_clause("safari", window) == ("WHERE v.visit_time >= ?", (-978_307_200.0,))
+    assert window_clause("chrome", None) == ("", ())
+    assert window_clause("chrome", IngestWindow(sample_before=1.0, sample_every=1)) == ("", ())
+
+
+def test_parse_since_rejects_garbage():
+    with pytest.raises(ValueError):
+        parse_since("last tuesday")
+
+
+def test_build_pushes_since_into_source_selects():
+    conn = build_unified_browser_history_db(
+        None, sources, options=BuildOptions(since="2025-01-01")
+    )
+    rows = conn.execute("SELECT browser, visited_dt FROM browser_history").fetchall()
+    assert sorted({browser for browser, _ in rows}) == ["chrome", "safari"]
+    assert all(visited >= "2025-01-01" for _, visited in rows)
+    conn.close()
+
+
+def test_build_down_samples_old_visits():
+    conn = build_unified_browser_history_db(
+        None,
+        sources,
+        options=BuildOptions(sample_after_days=0, sample_every=2),
+    )
+    # Every visit is older than "now", so only even visit ids (one per fixture) are kept.
+    assert conn.execute("SELECT COUNT(*) FROM browser_history").fetchone()[0] == 3
+    conn.close()
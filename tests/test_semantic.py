@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import pytest
+from llm.models import EmbeddingModel
+
+from browser_history.semantic import TitleIndex
+from browser_history.semantic import embed_new_titles
+from browser_history.sqlite import build_unified_browser_history_db
+from browser_history.sqlite import cleanup_unified_db
+from browser_history.sqlite import get_or_create_unified_db
+from browser_history.sqlite import unified_db_writer
+from browser_history.toolbox import BrowserHistory
+
+fixture_path = Path(__file__).parent / "fixtures"
+sources = [
+    ("chrome", fixture_path / "chrome-places.db"),
+    ("firefox", fixture_path / "firefox-places.db"),
+]
+# Stand-in "meanings": each title maps onto one axis.
+TOPICS = {"browser": ("chromium", "mozilla", "browsers"), "news": ("hacker", "news")}
+
+
+class TopicModel(EmbeddingModel):
+    model_id = "topic-test"
+
+    def __init__(self) -> None:
+        self.embedded: list[str] = []
+
+    def embed_batch(self, items: Iterable[str | bytes]) -> Iterator[list[float]]:
+        for item in items:
+            text = str(item).lower()
+            self.embedded.append(text)
+            yield [float(any(w in text for w in words)) for words in TOPICS.values()] + [0.1]
+
+
+class RemoteTopicModel(TopicModel):
+    model_id = "remote-topic-test"
+    needs_key = "example"
+
+
+def test_embed_new_titles_only_embeds_once():
+    conn = build_unified_browser_history_db(None, sources)
+    model = TopicModel()
+
+    assert embed_new_titles(conn, model) == 4
+    assert embed_new_titles(conn, model) == 0
+    assert len(model.embedded) == 4
+    conn.close()
+
+
+def test_rebuild_keeps_cached_embeddings(tmp_path: Path):
+    db_path = tmp_path / "unified.db"
+    model = TopicModel()
+    try:
+        for expected in (4, 0):
+            conn = get_or_create_unified_db(sources, db_path=db_path)
+            with unified_db_writer(conn, db_path) as writer:
+                assert embed_new_titles(writer, model) == expected
+            cleanup_unified_db()
+    finally:
+        cleanup_unified_db()
+
+
+def test_in_memory_refresh_keeps_cached_embeddings():
+    model = TopicModel()
+    bh = BrowserHistory(["chrome"], embedding_model=model)
+    bh.sources = sources
+    try:
+        bh.semantic_search("web browsers")
+        assert len(model.embedded) == 5  # four titles and the query
+        bh._refresh()
+        assert json.loads(bh.semantic_search("news", k=1))[0][1] == "Hacker News"
+        # The refresh reloaded the title index from the carried-over vectors.
+        assert len(model.embedded) == 6
+    finally:
+        bh._release()
+        cleanup_unified_db()
+
+
+def test_semantic_search_tool_needs_a_model():
+    names = {tool.name for tool in BrowserHistory(["chrome"]).tools()}
+    assert "BrowserHistory_search" in names
+    assert "BrowserHistory_semantic_search" not in names
+    with_model = BrowserHistory(["chrome"], embedding_model=TopicModel())
+    assert "BrowserHistory_semantic_search" in {tool.name for tool in with_model.tools()}
+
+
+def test_title_index_nearest_pure_python():
+    index = TitleIndex(["a", "b", "c"], [])
+    index._vectors = [(1.0, 0.0), (0.0, 1.0), (0.6, 0.8)]
+    assert [title for title, _ in index.nearest([0.0, 2.0], k=2)] == ["b", "c"]
+
+
+def test_semantic_search_tool(tmp_path: Path):
+    bh = BrowserHistory(["chrome"], embedding_model=TopicModel())
+    bh.sources = sources
+    bh.db_path = tmp_path / "unified.db"
+
+    rows = json.loads(bh.semantic_search("web browsers", k=2))
+
+    assert [row[1] for row in rows] == ["Chromium", "Mozilla"]
+    assert rows[0][2] == "https://www.chromium.org/"
+    bh._release()
+
+
+def test_remote_embedding_model_needs_opt_in(tmp_path: Path):
+    with pytest.raises(ValueError, match="API key"):
+        BrowserHistory(["chrome"], embedding_model=RemoteTopicModel())
+
+    bh = BrowserHistory(
+        ["chrome"], embedding_model=RemoteTopicModel(), allow_remote_embeddings=True
+    )
+    bh.sources = sources
+    bh.db_path = tmp_path / "unified.db"
+    try:
+        assert json.loads(bh.semantic_search("web browsers", k=1))[0][1] == "Chromium"
+    finally:
+        bh._release()
+        cleanup_unified_db()
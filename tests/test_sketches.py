@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from browser_history.sketches import HyperLogLog
+from browser_history.sketches import TopK
+from browser_history.sketches import approx_stats
+from browser_history.sqlite import BuildOptions
+from browser_history.sqlite import build_unified_browser_history_db
+
+fixture_path = Path(__file__).parent / "fixtures"
+sources = [
+    ("chrome", fixture_path / "chrome-places.db"),
+    ("firefox", fixture_path / "firefox-places.db"),
+    ("safari", fixture_path / "safari-places.db"),
+]
+
+
+def test_topk_keeps_heavy_hitters_and_never_undercounts():
+    topk = TopK(capacity=10)
+    for i in range(1_000):
+        topk.add(f"rare-{i}")
+        if i % 4 == 0:
+            topk.add("hot")
+
+    (item, count), *_ = topk.top(1)
+    assert item == "hot"
+    assert 250 <= count <= 250 + topk.floor
+
+    other = TopK.from_bytes(topk.to_bytes())
+    other.merge(topk)
+    assert other.top(1)[0][0] == "hot"
+
+
+def test_hyperloglog_estimate_and_merge():
+    left, right = HyperLogLog(), HyperLogLog()
+    for i in range(20_000):
+        (left if i % 2 else right).add(f"https://example.com/{i}")
+    left.merge(HyperLogLog.from_bytes(right.to_bytes()))
+    assert abs(left.estimate() - 20_000) < 20_000 * 0.1
+    assert HyperLogLog().estimate() == 0
+
+
+def test_build_sketches_answers_approx_stats():
+    conn = build_unified_browser_history_db(None, sources, options=BuildOptions(sketches=True))
+    exact = conn.execute(
+        "SELECT domain, COUNT(*) FROM browser_history GROUP BY domain ORDER BY 2 DESC, 1 DESC"
+    ).fetchall()
+
+    assert approx_stats(conn, "top_domains", k=len(exact)) == exact
+    distinct = conn.execute("SELECT COUNT(DISTINCT url) FROM browser_history").fetchone()[0]
+    assert approx_stats(conn, "distinct_urls", period="all") == [("all", distinct)]
+    assert approx_stats(conn, "top_urls", k=1, browser="firefox")
+    conn.close()
+
+
+def test_approx_stats_without_sketches_points_to_search():
+    conn = build_unified_browser_history_db(None, sources)
+    with pytest.raises(ValueError, match="--sketches"):
+        approx_stats(conn, "top_domains")
+    with pytest.raises(ValueError, match="kind must be one of"):
+        approx_stats(conn, "nope")
+    conn.close()
@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from browser_history.snapshots import (
+    collect_generations,
+    current_generation,
+    generations,
+    publish_generation,
+)
+
+
+def _publish(db_path: Path, content: bytes) -> Path:
+    built = db_path.with_name("build.tmp")
+    built.write_bytes(content)
+    try:
+        return publish_generation(built, db_path)
+    finally:
+        built.unlink()
+
+
+def test_publish_links_db_path_to_newest_generation(tmp_path: Path):
+    db = tmp_path / "unified.db"
+    first = _publish(db, b"one")
+    second = _publish(db, b"two")
+
+    assert (first.name, second.name) == ("unified-1.db", "unified-2.db")
+    assert generations(db) == [1, 2]
+    assert db.read_bytes() == b"two"
+    assert current_generation(db) == second
+
+
+def test_collect_keeps_only_current_generation(tmp_path: Path):
+    db = tmp_path / "unified.db"
+    first = _publish(db, b"one")
+    with first.open("rb") as reader:
+        second = _publish(db, b"two")
+        assert collect_generations(db) == [first]
+        # An already open reader still sees its generation.
+        assert reader.read() == b"one"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["unified-2.db", "unified.db"]
+    assert current_generation(db) == second
+    # Generation numbers keep increasing after a collection.
+    assert _publish(db, b"three").name == "unified-3.db"
+
+
+def test_current_generation_of_legacy_file(tmp_path: Path):
+    db = tmp_path / "unified.db"
+    db.write_bytes(b"legacy")
+    assert current_generation(db) == db
+    assert collect_generations(db) == []
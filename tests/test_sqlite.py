@@ -1,11 +1,32 @@
 from __future__ import annotations
 import sqlite3
+import threading
+
+import pytest
 
 from browser_history.sqlite import copy_locked_db
 from browser_history.sqlite import sha_label
 from browser_history.sqlite import build_unified_browser_history_db
 from browser_history.sqlite import run_unified_query
-from browser_history.sqlite import _apply_qp_whitelist
+from browser_history.sqlite import _write_visits
+from browser_history.ingest import IngestCancelled, IngestControl, IngestCounters
+from browser_history.sqlite import BuildStats
+from browser_history.sqlite import get_or_create_unified_db
+from browser_history.sqlite import cleanup_unified_db
+from browser_history.sqlite import acquire_unified_db
+from browser_history.sqlite import release_unified_db
+from browser_history.sqlite import unified_db_key
+from browser_history.sqlite import pin_unified_db
+from browser_history.sqlite import unified_db_lock
+from browser_history.sqlite import unified_db_writer
+from browser_history.snapshots import database_file
+from browser_history.sqlite import refresh_unified_db
+from browser_history.sqlite import UNIFIED_DB_REGISTRY
+from browser_history.registry import UnifiedDBRegistry, memory_bytes
+from browser_history.sqlite import reclean_unified_db
+from browser_history.sqlite import prewarm_db_file
+from browser_history.sqlite import iter_unified_query_with_headers
+from browser_history.toolbox import BrowserHistory
 
 from pathlib import Path
 
@@ -50,7 +71,7 @@ def test_build_unified_browser_history_db():
     cur = conn.cursor()
     rows = cur.execute(
         "SELECT browser, profile, url, title, referrer_url, visited_dt, domain, stripped_qp "
-        "FROM browser_history ORDER BY browser"
+        "FROM browser_history ORDER BY browser, visited_dt, url"
     ).fetchall()
     conn.close()
 
@@ -60,7 +81,7 @@ def test_build_unified_browser_history_db():
     ff_hour = "2024-09-08 00:00:00"
     sf_hour = "2025-01-31 07:00:00"
 
-    # Map by browser for easier asserts
+    # Map by browser for easier asserts, keeping each browser's latest visit
     out = {r[0]: r for r in rows}
 
     chrome_profile = sha_label("chrome", chrome_db)
@@ -120,6 +141,27 @@ def test_build_unified_browser_history_db_with_whitelist():
         assert row[1] is not None  # domain populated
 
 
+def test_build_stores_url_decomposition_with_indexes():
+    conn = build_unified_browser_history_db(None, [("chrome", chrome_db), ("firefox", firefox_db)])
+
+    rows = run_unified_query(
+        conn,
+        """SELECT domain, scheme, path, registrable_domain, path_depth FROM browser_history
+           WHERE registrable_domain = (SELECT registrable_domain FROM browser_history LIMIT 1)""",
+    )
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT url FROM browser_history WHERE registrable_domain = 'x'"
+    ).fetchall()
+    conn.close()
+
+    assert rows
+    for domain, scheme, path, registrable, depth in rows:
+        assert scheme in ("http", "https")
+        assert domain.endswith(registrable)
+        assert depth == len([segment for segment in path.split("/") if segment])
+    assert "idx_bh_registrable_domain" in str(plan)
+
+
 def test_run_unified_query_counts_rows():
     conn = build_unified_browser_history_db(None, [("chrome", chrome_db)])
 
@@ -128,6 +170,38 @@ def test_run_unified_query_counts_rows():
     conn.close()
 
 
+def test_build_spills_to_temp_file_over_memory_budget():
+    stats = BuildStats()
+    conn = build_unified_browser_history_db(
+        None,
+        [("chrome", chrome_db), ("firefox", firefox_db), ("safari", safari_db)],
+        max_memory=1,
+        stats=stats,
+    )
+
+    assert stats.spilled is True
+    assert stats.rows == 6
+    assert stats.sources == 3
+    assert stats.projected_bytes > 1
+    assert stats.peak_rss_bytes > 0
+    assert stats.progress == 1.0
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == 1  # FILE
+    assert conn.execute("PRAGMA cache_size").fetchone()[0] < 0
+    rows = run_unified_query(conn, "SELECT COUNT(*) FROM browser_history")
+    assert rows[0][0] == 6
+    conn.close()
+
+
+def test_build_stays_in_memory_under_budget():
+    stats = BuildStats()
+    conn = build_unified_browser_history_db(
+        None, [("chrome", chrome_db)], max_memory=1 << 40, stats=stats
+    )
+    assert stats.spilled is False
+    assert stats.rows == 2
+    conn.close()
+
+
 def test_build_unified_browser_history_db_with_file():
     # Test with file-based database
     dest = fixture_path / "unified_file.sqlite"
@@ -143,46 +217,183 @@ def test_build_unified_browser_history_db_with_file():
     dest.unlink()
 
 
-def test_apply_qp_whitelist_to_referrer():
+def test_get_or_create_unified_db_persists_and_opens_mmap_reader(tmp_path: Path):
+    dest = tmp_path / "unified.db"
+    try:
+        conn = get_or_create_unified_db([("chrome", chrome_db)], db_path=dest, mmap_size=1 << 20)
+        assert dest.exists()
+        assert conn.execute("PRAGMA mmap_size").fetchone()[0] == 1 << 20
+        assert run_unified_query(conn, "SELECT COUNT(*) FROM browser_history")[0][0] == 2
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM browser_history")
+    finally:
+        cleanup_unified_db()
+
+
+def _built_at(path: Path) -> str:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT value FROM _bh_meta WHERE key = 'built_at'").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_get_or_create_unified_db_reuses_fresh_persisted_db(tmp_path: Path):
+    dest = tmp_path / "unified.db"
+    try:
+        get_or_create_unified_db([("chrome", chrome_db)], db_path=dest)
+        assert dest.stat().st_mode & 0o777 == 0o600
+        first = _built_at(dest)
+        cleanup_unified_db()
+
+        # A later process with the same inputs reuses the file within max_age...
+        conn = get_or_create_unified_db([("chrome", chrome_db)], db_path=dest, max_age=60)
+        assert run_unified_query(conn, "SELECT COUNT(*) FROM browser_history")[0][0] == 2
+        assert _built_at(dest) == first
+        cleanup_unified_db()
+
+        # ...but rebuilds it when the sources differ.
+        sources = [("chrome", chrome_db), ("firefox", firefox_db)]
+        conn = get_or_create_unified_db(sources, db_path=dest, max_age=60)
+        assert run_unified_query(conn, "SELECT COUNT(*) FROM browser_history")[0][0] == 4
+        assert _built_at(dest) != first
+        # Only the current generation and the link to it remain; no temporary files.
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["unified-2.db", "unified.db"]
+    finally:
+        cleanup_unified_db()
+
+
+def test_registry_isolates_source_sets():
+    try:
+        chrome = get_or_create_unified_db([("chrome", chrome_db)])
+        both = get_or_create_unified_db([("chrome", chrome_db), ("firefox", firefox_db)])
+        assert chrome is not both
+        assert chrome.execute("SELECT COUNT(*) FROM browser_history").fetchone()[0] == 2
+        assert both.execute("SELECT COUNT(*) FROM browser_history").fetchone()[0] == 4
+        assert get_or_create_unified_db([("chrome", chrome_db)]) is chrome
+        # A different whitelist is a different database too.
+        assert get_or_create_unified_db([("chrome", chrome_db)], {"x.com": ["q"]}) is not chrome
+    finally:
+        cleanup_unified_db()
+
+
+def test_registry_evicts_least_recently_used_unreferenced_db(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(UNIFIED_DB_REGISTRY, "max_entries", 1)
+    chrome_key = unified_db_key([("chrome", chrome_db)], None)
+    try:
+        acquire_unified_db(chrome_key)
+        chrome = get_or_create_unified_db([("chrome", chrome_db)])
+        firefox = get_or_create_unified_db([("firefox", firefox_db)])
+
+        # The referenced chrome database survives; the registry is over budget until released.
+        assert chrome.execute("SELECT COUNT(*) FROM browser_history").fetchone()[0] == 2
+        release_unified_db(chrome_key)
+        assert UNIFIED_DB_REGISTRY.keys() == [unified_db_key([("firefox", firefox_db)], None)]
+        with pytest.raises(sqlite3.ProgrammingError):
+            chrome.execute("SELECT 1")
+        assert firefox.execute("SELECT COUNT(*) FROM browser_history").fetchone()[0] == 2
+    finally:
+        cleanup_unified_db()
+
+
+def test_registry_builds_outside_its_lock():
+    registry = UnifiedDBRegistry()
+    started, finish = threading.Event(), threading.Event()
+    builds = []
+
+    def slow_build() -> sqlite3.Connection:
+        builds.append(1)
+        started.set()
+        assert finish.wait(5)
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    threads = [
+        threading.Thread(target=registry.get, args=("slow", slow_build)) for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        assert started.wait(5)
+        # Other keys and bookkeeping do not wait for the running build.
+        fast = registry.get("fast", lambda: sqlite3.connect(":memory:"))
+        assert registry.total_bytes() == memory_bytes(fast)
+    finally:
+        finish.set()
+        for thread in threads:
+            thread.join(5)
+    assert len(builds) == 1
+    assert registry.keys() == ["fast", "slow"]
+    registry.close_all()
+
+
+def test_registry_evicts_over_memory_cap(monkeypatch: pytest.MonkeyPatch):
+    try:
+        chrome = get_or_create_unified_db([("chrome", chrome_db)])
+        monkeypatch.setattr(UNIFIED_DB_REGISTRY, "max_bytes", UNIFIED_DB_REGISTRY.total_bytes())
+        get_or_create_unified_db([("firefox", firefox_db)])
+        assert len(UNIFIED_DB_REGISTRY.keys()) == 1
+        with pytest.raises(sqlite3.ProgrammingError):
+            chrome.execute("SELECT 1")
+    finally:
+        cleanup_unified_db()
+
+
+def test_unified_db_lock_is_held_by_pinned_queries():
+    sources = [("chrome", chrome_db)]
+    try:
+        conn = get_or_create_unified_db(sources)
+        lock = unified_db_lock(conn)
+        assert lock is not None and unified_db_lock(sqlite3.connect(":memory:")) is None
+        with pin_unified_db(unified_db_key(sources, None, None)):
+            # Another thread doing work on the connection waits for the query.
+            acquired = []
+            waiter = threading.Thread(target=lambda: acquired.append(lock.acquire(timeout=0.05)))
+            waiter.start()
+            waiter.join()
+            assert acquired == [False]
+    finally:
+        cleanup_unified_db()
+
+
+def test_refresh_keeps_pinned_generation_until_drained(tmp_path: Path):
+    dest = tmp_path / "unified.db"
+    sources = [("chrome", chrome_db)]
+    key = unified_db_key(sources, None, dest)
+    try:
+        get_or_create_unified_db(sources, db_path=dest)
+        with pin_unified_db(key) as old:
+            refresh_unified_db(sources, db_path=dest)
+            # The running query keeps its generation; new queries get the new one.
+            assert old.execute("SELECT COUNT(*) FROM browser_history").fetchone()[0] == 2
+            assert (tmp_path / "unified-1.db").exists()
+            with pin_unified_db(key) as new:
+                assert new is not old
+        with pytest.raises(sqlite3.ProgrammingError):
+            old.execute("SELECT 1")
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["unified-2.db", "unified.db"]
+    finally:
+        cleanup_unified_db()
+
+
+def test_prewarm_db_file_reads_whole_file(tmp_path: Path):
+    f = tmp_path / "blob.db"
+    f.write_bytes(b"x" * 2500)
+    assert prewarm_db_file(f, chunk_size=1024) == 2500
+
+
+def _visit(url, referrer=None, visit_id=1):
+    return (visit_id, url, None, referrer, "2025-01-01 00:00:00")
+
+
+def test_write_visits_cleans_referrer():
     """Test that referrer URLs get stripped via whitelist."""
-    conn = sqlite3.connect(":memory:")
-    cur = conn.cursor()
-    cur.executescript(
-        """
-        CREATE TABLE browser_history (
-            browser TEXT NOT NULL,
-            profile TEXT,
-            url TEXT NOT NULL,
-            title TEXT,
-            referrer_url TEXT,
-            visited_dt DATETIME NOT NULL,
-            domain TEXT,
-            stripped_qp TEXT,
-            referrer_domain TEXT,
-            referrer_stripped_qp TEXT
-        );
-        """
-    )
-    # Insert a row with referrer URL containing query parameters
-    cur.execute(
-        "INSERT INTO browser_history (browser, profile, url, referrer_url, visited_dt) VALUES (?, ?, ?, ?, ?)",
-        (
-            "chrome",
-            "Default",
-            "https://example.com/page?keep=1&strip=2",
-            "https://google.com/search?q=hello&ref=abc",
-            "2025-01-01 00:00:00",
-        ),
-    )
-    conn.commit()
+    conn = build_unified_browser_history_db(None, [])
+    visits = [_visit("https://example.com/page?keep=1&strip=2", "https://google.com/search?q=hello&ref=abc")]
+    _write_visits(conn, visits, ("chrome", "Default"), {"google.com": ["q"]}, IngestCounters())
 
-    whitelist = {"google.com": ["q"]}
-    _apply_qp_whitelist(conn, whitelist)
-
-    cur.execute(
+    row = conn.execute(
         "SELECT url, domain, stripped_qp, referrer_url, referrer_domain, referrer_stripped_qp FROM browser_history"
-    )
-    row = cur.fetchone()
+    ).fetchone()
     # Check main URL stripping (no rule for example.com, strip all)
     assert row[0] == "https://example.com/page"
     assert row[1] == "example.com"
@@ -194,45 +405,73 @@ def test_apply_qp_whitelist_to_referrer():
     conn.close()
 
 
-def test_apply_qp_whitelist_null_referrer():
-    """Test that NULL referrer URLs are handled correctly."""
-    conn = sqlite3.connect(":memory:")
-    cur = conn.cursor()
-    cur.executescript(
-        """
-        CREATE TABLE browser_history (
-            browser TEXT NOT NULL,
-            profile TEXT,
-            url TEXT NOT NULL,
-            title TEXT,
-            referrer_url TEXT,
-            visited_dt DATETIME NOT NULL,
-            domain TEXT,
-            stripped_qp TEXT,
-            referrer_domain TEXT,
-            referrer_stripped_qp TEXT
-        );
-        """
-    )
-    cur.execute(
-        "INSERT INTO browser_history (browser, profile, url, referrer_url, visited_dt) VALUES (?, ?, ?, ?, ?)",
-        (
-            "chrome",
-            "Default",
-            "https://example.com/page?keep=1&strip=2",
-            None,
-            "2025-01-01 00:00:00",
-        ),
+def test_reclean_unified_db_updates_only_changed_domains():
+    conn = build_unified_browser_history_db(None, [])
+    visits = [
+        _visit("https://example.com/p?keep=1&strip=2", None, 1),
+        _visit("https://other.org/?a=1", "https://www.example.com/?keep=3", 2),
+        _visit("https://third.net/?b=1", None, 3),
+    ]
+    _write_visits(conn, visits, ("chrome", None), {}, IngestCounters())
+    # Model-written queries cannot see the raw URLs.
+    with pytest.raises(sqlite3.DatabaseError):
+        conn.execute("SELECT url FROM _bh_raw")
+
+    assert reclean_unified_db(conn, {}, {"example.com": ["keep"]}) == 2
+
+    rows = conn.execute(
+        "SELECT url, stripped_qp, referrer_url FROM browser_history ORDER BY rowid"
+    ).fetchall()
+    assert rows == [
+        ("https://example.com/p?keep=1", "strip", None),
+        ("https://other.org/", "a", "https://www.example.com/?keep=3"),
+        ("https://third.net/", "b", None),
+    ]
+    conn.close()
+
+
+def test_build_ingests_in_batches_with_progress():
+    sources = [("chrome", chrome_db), ("firefox", firefox_db), ("safari", safari_db)]
+    progress: list[float] = []
+    stats = BuildStats()
+    conn = build_unified_browser_history_db(
+        None, sources, stats=stats, control=IngestControl(batch_size=1, on_progress=progress.append)
     )
-    conn.commit()
+    batched = conn.execute("SELECT * FROM browser_history ORDER BY rowid").fetchall()
+    conn.close()
+    conn = build_unified_browser_history_db(None, sources)
+    whole = conn.execute("SELECT * FROM browser_history ORDER BY rowid").fetchall()
+    conn.close()
+
+    assert batched == whole
+    assert stats.ingest.batches == len(whole)
+    assert stats.ingest.read.rows == stats.ingest.write.rows == len(whole)
+    assert progress == sorted(progress)
+    assert progress[-1] == 1.0
+
+
+def test_build_cancelled_between_batches():
+    control = IngestControl(batch_size=1)
+    control.on_progress = lambda progress: control.cancel.set()
+    with pytest.raises(IngestCancelled):
+        build_unified_browser_history_db(None, [("chrome", chrome_db)], control=control)
+
+    # The next build with the same control runs to completion.
+    control.on_progress = None
+    conn = build_unified_browser_history_db(None, [("chrome", chrome_db)], control=control)
+    assert conn.execute("SELECT COUNT(*) FROM browser_history").fetchone() == (2,)
+    conn.close()
 
-    whitelist = {"example.com": ["keep"]}
-    _apply_qp_whitelist(conn, whitelist)
 
-    cur.execute(
+def test_write_visits_null_referrer():
+    """Test that NULL referrer URLs are handled correctly."""
+    conn = build_unified_browser_history_db(None, [])
+    visits = [_visit("https://example.com/page?keep=1&strip=2")]
+    _write_visits(conn, visits, ("chrome", "Default"), {"example.com": ["keep"]}, IngestCounters())
+
+    row = conn.execute(
         "SELECT url, domain, stripped_qp, referrer_url, referrer_domain, referrer_stripped_qp FROM browser_history"
-    )
-    row = cur.fetchone()
+    ).fetchone()
     assert row[0] == "https://example.com/page?keep=1"
     assert row[1] == "example.com"
     assert row[2] == "strip"
@@ -240,3 +479,86 @@ def test_apply_qp_whitelist_null_referrer():
     assert row[4] is None
     assert row[5] is None
     conn.close()
+
+
+def test_run_unified_query_with_named_params():
+    conn = build_unified_browser_history_db(None, [("chrome", chrome_db), ("firefox", firefox_db)])
+    sql = "SELECT COUNT(*) FROM browser_history WHERE browser = :b"
+    assert run_unified_query(conn, sql, {"b": "chrome"})[0][0] == 2
+    assert run_unified_query(conn, sql, {"b": "firefox"})[0][0] == 2
+    assert run_unified_query(conn, sql, {"b": "safari"})[0][0] == 0
+    conn.close()
+
+
+def test_iter_unified_query_with_headers_streams_and_limits():
+    conn = build_unified_browser_history_db(
+        None, [("chrome", chrome_db), ("firefox", firefox_db), ("safari", safari_db)]
+    )
+    sql = "SELECT browser FROM browser_history ORDER BY rowid"
+
+    headers, rows = iter_unified_query_with_headers(conn, sql, max_rows=4, batch_size=3)
+    assert headers == ["browser"]
+    assert len(list(rows)) == 4
+
+    _, rows = iter_unified_query_with_headers(conn, sql, max_rows=0, batch_size=1)
+    assert len(list(rows)) == 6
+    assert len(run_unified_query(conn, sql, max_rows=0)) == 6
+    conn.close()
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_search_many_keeps_query_order(tmp_path, parallel):
+    bh = BrowserHistory(["chrome"])
+    bh.sources = [("chrome", chrome_db), ("firefox", firefox_db)]
+    bh.db_path = tmp_path / "unified.db"
+    queries = [
+        "SELECT COUNT(*) FROM browser_history",
+        {"sql": "SELECT url FROM browser_history WHERE browser = :b", "params": {"b": "firefox"}},
+        {"sql": "SELECT * FROM _bh_raw"},
+        "SELECT 3",
+    ]
+    try:
+        count, urls, denied, three = bh._do_search_many(queries, parallel=parallel)
+    finally:
+        bh._release()
+        cleanup_unified_db()
+
+    assert count == [(4,)]
+    assert len(urls) == 2
+    assert "_bh_raw" in denied["error"]
+    assert three == [(3,)]
+
+
+def test_concurrent_batches_borrow_their_own_readers(tmp_path: Path):
+    bh = BrowserHistory(["chrome"])
+    bh.sources = [("chrome", chrome_db)]
+    bh.db_path = tmp_path / "unified.db"
+    try:
+        db_file = database_file(bh._unified_db())
+        assert db_file is not None
+        with bh._borrowed_readers(db_file, 2) as first:
+            with bh._borrowed_readers(db_file, 2) as second:
+                assert not set(map(id, first)) & set(map(id, second))
+            # A refresh drops the pool; readers of the old build are closed on return.
+            bh._drop_readers()
+        with pytest.raises(sqlite3.ProgrammingError):
+            first[0].execute("SELECT 1")
+        assert len(bh._reader_pool) == 0
+        with bh._borrowed_readers(db_file, 1) as third:
+            pass
+        assert bh._reader_pool == third
+    finally:
+        bh._release()
+        cleanup_unified_db()
+
+
+def test_every_connection_opens_the_generation_file(tmp_path: Path):
+    dest = tmp_path / "unified.db"
+    try:
+        conn = get_or_create_unified_db([("chrome", chrome_db)], db_path=dest)
+        # Never the hard-linked db_path: SQLite names the rollback journal after the path.
+        assert database_file(conn) == tmp_path / "unified-1.db"
+        with unified_db_writer(conn, dest) as writer:
+            assert database_file(writer) == tmp_path / "unified-1.db"
+    finally:
+        cleanup_unified_db()
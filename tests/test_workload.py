@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from browser_history.snapshots import database_file
+from browser_history.sqlite import build_unified_browser_history_db
+from browser_history.sqlite import cleanup_unified_db
+from browser_history.sqlite import get_or_create_unified_db
+from browser_history.sqlite import open_unified_db_reader
+from browser_history.workload import (
+    AdaptiveIndexer,
+    WorkloadProfile,
+    extract_filter_columns,
+    index_columns,
+    pattern_key,
+    table_names,
+)
+
+fixture_path = Path(__file__).parent / "fixtures"
+sources = [
+    ("chrome", fixture_path / "chrome-places.db"),
+    ("firefox", fixture_path / "firefox-places.db"),
+]
+COLUMNS = {"browser", "profile", "url", "title", "visited_dt", "domain", "referrer_domain"}
+QUERY = (
+    "SELECT url FROM browser_history WHERE domain = 'example.com' AND browser = :b "
+    "ORDER BY visited_dt DESC LIMIT 5"
+)
+
+
+def _join_index_threads():
+    for thread in threading.enumerate():
+        if thread.name == "bh-adaptive-index":
+            thread.join(timeout=5)
+
+
+def _auto_indexes(conn) -> list[str]:
+    return [
+        row[1]
+        for row in conn.execute("PRAGMA index_list(browser_history)").fetchall()
+        if row[1].startswith("idx_bh_auto_")
+    ]
+
+
+def test_extract_filter_columns():
+    where, order = extract_filter_columns(QUERY, COLUMNS)
+    assert where == ["browser", "domain"]
+    assert order == ["visited_dt"]
+
+
+def test_extract_filter_columns_ignores_string_literals():
+    where, order = extract_filter_columns(
+        "SELECT * FROM browser_history WHERE url = 'title profile'", COLUMNS
+    )
+    assert where == ["url"]
+    assert order == []
+
+
+def test_index_columns_puts_filters_before_sorts():
+    assert index_columns(pattern_key(["browser", "domain"], ["visited_dt"])) == [
+        "browser",
+        "domain",
+        "visited_dt",
+    ]
+    assert index_columns(pattern_key(["domain"], ["domain"])) == ["domain"]
+
+
+def test_workload_profile_round_trip(tmp_path: Path):
+    path = tmp_path / "profile.json"
+    profile = WorkloadProfile.load(path)
+    assert profile.record("domain|") == 1
+    assert profile.record("domain|") == 2
+    # Hits are saved in batches, not on every query.
+    assert not path.exists()
+    profile.flush()
+    assert WorkloadProfile.load(path).counts == {"domain|": 2}
+    assert WorkloadProfile.load(path).hot_patterns(2) == ["domain|"]
+
+
+def test_workload_profile_saves_after_interval(tmp_path: Path):
+    path = tmp_path / "profile.json"
+    profile = WorkloadProfile(path, save_interval=0)
+    profile.record("domain|")
+    assert WorkloadProfile.load(path).counts == {"domain|": 1}
+
+
+def test_table_names_include_aliases():
+    sql = "SELECT h.url FROM browser_history AS h JOIN browser_history r ON r.url = h.url"
+    assert table_names(sql) == {"browser_history", "browser_history_packed", "h", "r"}
+    assert "where" not in table_names("SELECT * FROM browser_history WHERE url = 'x'")
+
+
+def test_workload_profile_ignores_unreadable_file(tmp_path: Path):
+    path = tmp_path / "profile.json"
+    path.write_text("{not json")
+    assert WorkloadProfile.load(path).counts == {}
+
+
+def test_adaptive_indexer_builds_index_for_hot_pattern(tmp_path: Path):
+    path = tmp_path / "profile.json"
+    conn = build_unified_browser_history_db(None, sources)
+    indexer = AdaptiveIndexer(WorkloadProfile.load(path), threshold=2)
+
+    indexer.observe(conn, QUERY, {"b": "chrome"})
+    _join_index_threads()
+    assert _auto_indexes(conn) == []
+
+    indexer.observe(conn, QUERY, {"b": "chrome"})
+    _join_index_threads()
+    assert _auto_indexes(conn) == ["idx_bh_auto_browser_domain_visited_dt"]
+    conn.close()
+    indexer.profile.flush()
+
+    # A later session with the persisted profile indexes the hot pattern up front.
+    fresh = build_unified_browser_history_db(None, sources)
+    AdaptiveIndexer(WorkloadProfile.load(path), threshold=2).observe(
+        fresh, "SELECT COUNT(*) FROM browser_history"
+    )
+    _join_index_threads()
+    assert _auto_indexes(fresh) == ["idx_bh_auto_browser_domain_visited_dt"]
+    fresh.close()
+
+
+def test_adaptive_indexer_waits_for_the_query_lock():
+    conn = build_unified_browser_history_db(None, sources)
+    indexer = AdaptiveIndexer(WorkloadProfile(None), threshold=1)
+    lock = threading.RLock()
+    with lock:
+        indexer.observe(conn, QUERY, {"b": "chrome"}, lock=lock)
+        # The index thread does not touch the shared connection while a query holds it.
+        time.sleep(0.05)
+        assert _auto_indexes(conn) == []
+    _join_index_threads()
+    assert _auto_indexes(conn) == ["idx_bh_auto_browser_domain_visited_dt"]
+    conn.close()
+
+
+def test_adaptive_indexer_applies_profile_once_per_build(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+):
+    db_path = tmp_path / "unified.db"
+    try:
+        conn = get_or_create_unified_db(sources, db_path=db_path)
+        indexer = AdaptiveIndexer(WorkloadProfile(None), threshold=10, db_path=db_path)
+        applied = []
+        monkeypatch.setattr(indexer, "schedule", lambda conn, keys, lock: applied.append(keys))
+        # Parallel search_many readers open the same generation file as the pinned one.
+        reader = open_unified_db_reader(database_file(conn))
+        for query_conn in (conn, reader, conn, reader):
+            indexer.observe(query_conn, "SELECT COUNT(*) FROM browser_history")
+        assert len(applied) == 1
+        reader.close()
+    finally:
+        cleanup_unified_db()
+
+
+def test_adaptive_indexer_records_aliased_scans():
+    conn = build_unified_browser_history_db(None, sources)
+    indexer = AdaptiveIndexer(WorkloadProfile(None), threshold=10)
+    indexer.observe(conn, "SELECT h.url FROM browser_history h WHERE h.browser = 'chrome'")
+    assert indexer.profile.counts == {"browser|": 1}
+    conn.close()
+
+
+def test_adaptive_indexer_ignores_indexed_queries(tmp_path: Path):
+    conn = build_unified_browser_history_db(None, sources)
+    indexer = AdaptiveIndexer(WorkloadProfile(None), threshold=1)
+    indexer.observe(conn, "SELECT * FROM browser_history WHERE url = 'https://example.com/'")
+    _join_index_threads()
+    assert indexer.profile.counts == {}
+    conn.close()